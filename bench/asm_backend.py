@@ -0,0 +1,88 @@
+"""
+compares the x86-64 assembly backend with the C backend at -O0 and -O1 on
+tests/rule110.ce scaled up to a bigger board, both the time it takes to build
+the executable and the time it takes to run it
+
+usage:
+    python bench/asm_backend.py [-board N] [-runs N]
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import subprocess
+import statistics
+import tempfile
+import time
+import sys
+import os
+
+here = Path(os.path.abspath(__file__)).parent.parent
+sys.path.insert(0, str(here))
+
+from src import core, parsing, CEAst, typecheck  # type: ignore[import]
+from src import build, toolchain  # type: ignore[import]
+from src.compiler import write_c_code_from_AST  # type: ignore[import]
+from src.x86_64 import write_asm_from_AST  # type: ignore[import]
+
+
+def timed(function, *args) -> float:  # type: ignore[no-untyped-def]
+    start = time.perf_counter()
+    if function(*args):
+        sys.exit(1)
+    return time.perf_counter() - start
+
+
+def run(exe: str, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.check_call([exe], stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+if __name__ == "__main__":
+    board = 3000
+    runs = 5
+    if "-board" in sys.argv:
+        board = int(sys.argv[sys.argv.index("-board") + 1])
+    if "-runs" in sys.argv:
+        runs = int(sys.argv[sys.argv.index("-runs") + 1])
+
+    source_code = (here / "tests" / "rule110.ce").read_text()
+    source_code = source_code.replace(
+        "const sizeof(board) 30 end", f"const sizeof(board) {board} end"
+    )
+
+    cc = toolchain.TOOLCHAINS["gcc"]
+    results: list[tuple[str, float, float]] = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / "rule110.ce"
+        source.write_text(source_code)
+        ast = CEAst.makeAST(parsing.parse_file(str(source)), source)
+        typecheck.typecheck_AST(ast)
+        c_file = str(source.with_suffix(".c"))
+        asm_file = str(source.with_suffix(".s"))
+        with open(c_file, "w") as out:
+            write_c_code_from_AST(ast, out, core.STACK_SIZE)
+        with open(asm_file, "w") as out:
+            write_asm_from_AST(ast, out)
+
+        for flag in ["-O0", "-O1"]:
+            exe = str(Path(tmp) / f"c{flag}.exe")
+            build_time = timed(
+                build.compile_program, cc, toolchain.BuildOptions(flag), c_file, exe
+            )
+            results.append((f"gcc {flag}", build_time, run(exe, runs)))
+
+        exe = str(Path(tmp) / "asm.exe")
+        build_time = timed(build.assemble_and_link, asm_file, exe)
+        results.append(("asm", build_time, run(exe, runs)))
+
+    print(f"[INFO] rule110 with a {board} cell board, median of {runs} runs")
+    for name, build_time, run_time in results:
+        print(
+            f"{name:8} build: {build_time * 1000:8.2f}ms run: {run_time * 1000:8.2f}ms"
+        )
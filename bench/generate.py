@@ -0,0 +1,162 @@
+"""
+generates valid corpe programs of a given size and shape, for stress testing the
+compiler (see bench/scaling.py)
+
+every statement leaves the stack like it found it, so the blocks can be nested and
+mixed freely and the program always type checks. the programs are only meant to be
+compiled, the loops run but nothing is printed
+
+usage:
+    python bench/generate.py [-tokens N] [-macros N] [-macro-depth N] [-nesting N]
+                             [-constants N] [-memories N] [-seed N] [-o FILEPATH]
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+import random
+import sys
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Callable
+
+
+@dataclass
+class Shape:
+    tokens: int = 10_000
+    macros: int = 16
+    # the deepest if nesting inside of the body of a macro
+    macro_depth: int = 2
+    # the deepest if/while nesting of the body
+    nesting: int = 4
+    constants: int = 16
+    memories: int = 8
+    seed: int = 0
+
+
+class Generator:
+    def __init__(self, shape: Shape) -> None:
+        self.shape = shape
+        self.random = random.Random(shape.seed)
+        self.lines: list[str] = []
+        self.tokens = 0
+        self.depth = 0
+        self.constants: list[str] = []
+        self.memories: list[str] = []
+        self.macros: list[str] = []
+
+    def line(self, text: str) -> None:
+        self.lines.append("    " * self.depth + text)
+        self.tokens += len(text.split())
+
+    def number(self) -> str:
+        return str(self.random.randrange(1, 100))
+
+    def operand(self) -> str:
+        if self.constants and self.random.random() < 0.5:
+            return self.random.choice(self.constants)
+        return self.number()
+
+    def declarations(self) -> None:
+        for i in range(self.shape.constants):
+            # the later constants are computed from the earlier ones
+            if self.constants:
+                previous = self.random.choice(self.constants)
+                self.line(f"const C{i} {previous} {self.number()} + end")
+            else:
+                self.line(f"const C{i} {self.number()} end")
+            self.constants.append(f"C{i}")
+        for i in range(self.shape.memories):
+            self.line(f"memory M{i} {8 * self.random.randrange(1, 64)} end")
+            self.memories.append(f"M{i}")
+        for i in range(self.shape.macros):
+            # every macro is `int -- int`, a macro can not use other macros so the
+            # depth is the nesting of the ifs in its body
+            body = f"{self.operand()} +"
+            for _ in range(self.random.randrange(self.shape.macro_depth + 1)):
+                body = f"dup {self.operand()} < if {body} end"
+            self.line(f"macro X{i} {body} endmacro")
+            self.macros.append(f"X{i}")
+
+    def arithmetic(self) -> None:
+        operator = self.random.choice(["+", "-", "*", "&", "|", "<", "=="])
+        self.line(f"{self.operand()} {self.operand()} {operator} drop")
+
+    def memory_access(self) -> None:
+        mem = self.random.choice(self.memories)
+        if self.random.random() < 0.5:
+            self.line(f"{self.number()} {mem} !64")
+        else:
+            self.line(f"{mem} cast(int) 8 + cast(ptr) @64 drop")
+
+    def macro_use(self) -> None:
+        self.line(f"{self.operand()} {self.random.choice(self.macros)} drop")
+
+    def statement(self) -> None:
+        kinds: list[Callable[[], None]] = [self.arithmetic]
+        if self.memories:
+            kinds.append(self.memory_access)
+        if self.macros:
+            kinds.append(self.macro_use)
+        self.random.choice(kinds)()
+
+    def open_block(self) -> str:
+        """
+        returns the line that closes the block
+        """
+        if self.random.random() < 0.5:
+            self.line(f"{self.operand()} {self.operand()} < if")
+            self.depth += 1
+            return "end"
+        self.line("0 while dup 3 < do")
+        self.depth += 1
+        return "1 + end drop"
+
+    def close_block(self, closing: str) -> None:
+        self.depth -= 1
+        self.line(closing)
+
+    def generate(self) -> str:
+        self.declarations()
+        closings: list[str] = []
+        # the first statements go through every level, so the deepest nesting is reached
+        while len(closings) < self.shape.nesting:
+            closings.append(self.open_block())
+        while self.tokens < self.shape.tokens:
+            roll = self.random.random()
+            if len(closings) < self.shape.nesting and roll < 0.15:
+                closings.append(self.open_block())
+            elif closings and roll < 0.3:
+                self.close_block(closings.pop())
+            else:
+                self.statement()
+        while closings:
+            self.close_block(closings.pop())
+        return "\n".join(self.lines) + "\n"
+
+
+def generate_program(shape: Shape) -> str:
+    return Generator(shape).generate()
+
+
+if __name__ == "__main__":
+    shape = Shape()
+    for flag, field in [
+        ("-tokens", "tokens"),
+        ("-macros", "macros"),
+        ("-macro-depth", "macro_depth"),
+        ("-nesting", "nesting"),
+        ("-constants", "constants"),
+        ("-memories", "memories"),
+        ("-seed", "seed"),
+    ]:
+        if flag in sys.argv:
+            setattr(shape, field, int(sys.argv[sys.argv.index(flag) + 1]))
+
+    source_code = generate_program(shape)
+    if "-o" in sys.argv:
+        with open(sys.argv[sys.argv.index("-o") + 1], "w") as f:
+            f.write(source_code)
+    else:
+        sys.stdout.write(source_code)
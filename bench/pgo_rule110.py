@@ -0,0 +1,81 @@
+"""
+compares a plain build with a profile guided build (-pgo) of tests/rule110.ce
+scaled up to a bigger board
+
+usage:
+    python bench/pgo_rule110.py [-board N] [-runs N] [-O2]
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import subprocess
+import statistics
+import tempfile
+import time
+import sys
+import os
+
+here = Path(os.path.abspath(__file__)).parent.parent
+sys.path.insert(0, str(here))
+
+from src import core, parsing, CEAst, typecheck  # type: ignore[import]
+from src import build, pgo, toolchain  # type: ignore[import]
+from src.compiler import write_c_code_from_AST  # type: ignore[import]
+
+
+def run(exe: str, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.check_call([exe], stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+if __name__ == "__main__":
+    board = 3000
+    runs = 5
+    optimization_flag = "-O2"
+    if "-board" in sys.argv:
+        board = int(sys.argv[sys.argv.index("-board") + 1])
+    if "-runs" in sys.argv:
+        runs = int(sys.argv[sys.argv.index("-runs") + 1])
+    for flag in ["-O0", "-O1", "-O2", "-O3", "-Ofast"]:
+        if flag in sys.argv:
+            optimization_flag = flag
+
+    source_code = (here / "tests" / "rule110.ce").read_text()
+    source_code = source_code.replace(
+        "const sizeof(board) 30 end", f"const sizeof(board) {board} end"
+    )
+
+    cc = toolchain.TOOLCHAINS["gcc"]
+    options = toolchain.BuildOptions(optimization_flag)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / "rule110.ce"
+        source.write_text(source_code)
+        ast = CEAst.makeAST(parsing.parse_file(str(source)), source)
+        typecheck.typecheck_AST(ast)
+        c_file = str(source.with_suffix(".c"))
+        with open(c_file, "w") as out:
+            write_c_code_from_AST(ast, out, core.STACK_SIZE)
+
+        plain = str(Path(tmp) / "plain.exe")
+        profiled = str(Path(tmp) / "pgo.exe")
+        if build.compile_program(cc, options, c_file, plain):
+            sys.exit(1)
+        if pgo.build_with_pgo(cc, options, c_file, profiled, []):
+            sys.exit(1)
+
+        plain_time = run(plain, runs)
+        pgo_time = run(profiled, runs)
+
+    print(
+        f"[INFO] rule110 with a {board} cell board, {optimization_flag}, "
+        f"median of {runs} runs"
+    )
+    print(f"plain: {plain_time * 1000:8.2f}ms")
+    print(f"pgo:   {pgo_time * 1000:8.2f}ms")
+    print(f"speedup: {plain_time / pgo_time:.2f}x")
@@ -0,0 +1,73 @@
+"""
+compares the output throughput of `print` with the buffered output runtime
+against the stdio (printf/fputc) one on a million line print loop
+
+usage:
+    python bench/print_throughput.py [-lines N] [-runs N] [-O2]
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import subprocess
+import statistics
+import tempfile
+import time
+import sys
+import os
+
+here = Path(os.path.abspath(__file__)).parent.parent
+sys.path.insert(0, str(here))
+
+from src import core, parsing, CEAst, typecheck  # type: ignore[import]
+from src.compiler import generate_c_code_from_AST  # type: ignore[import]
+
+
+def build(source: Path, buffered_output: bool, optimization_flag: str) -> Path:
+    ast = CEAst.makeAST(parsing.parse_file(str(source)), source)
+    typecheck.typecheck_AST(ast)
+    name = "buffered" if buffered_output else "stdio"
+    c_file = source.with_name(f"{name}.c")
+    exe = source.with_name(f"{name}.exe")
+    c_file.write_text(
+        generate_c_code_from_AST(ast, core.STACK_SIZE, buffered_output=buffered_output)
+    )
+    subprocess.check_call(["gcc", str(c_file), "-o", str(exe), optimization_flag])
+    return exe
+
+
+def run(exe: Path, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        with open(os.devnull, "w") as devnull:
+            start = time.perf_counter()
+            subprocess.check_call([str(exe)], stdout=devnull)
+            times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+if __name__ == "__main__":
+    lines = 1_000_000
+    runs = 5
+    optimization_flag = "-O2"
+    if "-lines" in sys.argv:
+        lines = int(sys.argv[sys.argv.index("-lines") + 1])
+    if "-runs" in sys.argv:
+        runs = int(sys.argv[sys.argv.index("-runs") + 1])
+    for flag in ["-O0", "-O1", "-O2", "-O3", "-Ofast"]:
+        if flag in sys.argv:
+            optimization_flag = flag
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / "print_loop.ce"
+        source.write_text(
+            f"0 while dup {lines} < do\n    dup print\n    1 +\nend drop\n"
+        )
+
+        stdio = run(build(source, False, optimization_flag), runs)
+        buffered = run(build(source, True, optimization_flag), runs)
+
+    print(f"[INFO] {lines} lines, {optimization_flag}, median of {runs} runs")
+    print(f"stdio:    {stdio * 1000:8.2f}ms {lines / stdio / 1e6:6.2f}M lines/s")
+    print(f"buffered: {buffered * 1000:8.2f}ms {lines / buffered / 1e6:6.2f}M lines/s")
+    print(f"speedup:  {stdio / buffered:.2f}x")
@@ -0,0 +1,177 @@
+"""
+scalability stress test for the compiler
+
+it compiles programs from bench/generate.py of growing size, times every phase
+of the compiler on them and fits `time = c * tokens^k` to each phase. a phase fails
+when its exponent grows faster than n log n over the measured sizes (plus a
+tolerance for the noise of the timer and the garbage collector)
+
+a size is skipped, with the ones after it, once compiling the one before it took
+longer than the time budget
+
+usage:
+    python bench/scaling.py [-max-tokens N] [-runs N] [-budget SECONDS] [-o FILEPATH]
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import tempfile
+import json
+import math
+import time
+import sys
+import gc
+import io
+import os
+
+here = Path(os.path.abspath(__file__)).parent.parent
+sys.path.insert(0, str(here))
+
+from src import core, parsing, CEAst, typecheck  # type: ignore[import]
+from src.compiler import write_c_code_from_AST  # type: ignore[import]
+from src.x86_64 import write_asm_from_AST  # type: ignore[import]
+from bench.generate import Shape, generate_program  # type: ignore[import]
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Callable
+
+# 10^3 to 10^6 tokens, in steps of half a decade
+SIZES: list[int] = [1_000, 3_000, 10_000, 30_000, 100_000, 300_000, 1_000_000]
+# how much faster than n log n a phase is allowed to look before it fails
+EXPONENT_TOLERANCE: float = 0.2
+# timings under this are mostly noise and are not used for the fit, in seconds
+MIN_FIT_TIME: float = 0.001
+
+PHASES: list[str] = ["lex", "makeAST", "typecheck", "C codegen", "asm codegen"]
+
+
+def shape_for(tokens: int) -> Shape:
+    """
+    the number of the declarations grows with the program, so the lookups of their
+    names are part of what is measured
+    """
+    return Shape(
+        tokens=tokens,
+        macros=max(4, tokens // 200),
+        macro_depth=3,
+        nesting=8,
+        constants=max(4, tokens // 100),
+        memories=max(2, tokens // 400),
+    )
+
+
+def timed(function: Callable[[], Any]) -> tuple[float, Any]:
+    gc.collect()
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def compile_phases(source: Path) -> dict[str, float]:
+    times: dict[str, float] = {}
+    times["lex"], ops = timed(lambda: parsing.parse_file(str(source)))
+    times["makeAST"], ast = timed(lambda: CEAst.makeAST(ops, source))
+    times["typecheck"], _ = timed(lambda: typecheck.typecheck_AST(ast))
+    times["C codegen"], _ = timed(
+        lambda: write_c_code_from_AST(ast, io.StringIO(), core.STACK_SIZE)
+    )
+    times["asm codegen"], _ = timed(lambda: write_asm_from_AST(ast, io.StringIO()))
+    return times
+
+
+def fit_exponent(points: list[tuple[int, float]]) -> float:
+    """
+    least squares fit of log(time) = k * log(tokens) + c, returns k
+    """
+    xs = [math.log(tokens) for tokens, _ in points]
+    ys = [math.log(seconds) for _, seconds in points]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    covariance = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    return covariance / variance
+
+
+def n_log_n_exponent(smallest: int, biggest: int) -> float:
+    """
+    the exponent that n log n has between the two sizes
+    """
+    growth = (biggest * math.log(biggest)) / (smallest * math.log(smallest))
+    return math.log(growth) / math.log(biggest / smallest)
+
+
+if __name__ == "__main__":
+    max_tokens = SIZES[-1]
+    runs = 3
+    budget = 60.0
+    json_path = None
+    if "-max-tokens" in sys.argv:
+        max_tokens = int(sys.argv[sys.argv.index("-max-tokens") + 1])
+    if "-runs" in sys.argv:
+        runs = int(sys.argv[sys.argv.index("-runs") + 1])
+    if "-budget" in sys.argv:
+        budget = float(sys.argv[sys.argv.index("-budget") + 1])
+    if "-o" in sys.argv:
+        json_path = sys.argv[sys.argv.index("-o") + 1]
+
+    # phase -> [(tokens, seconds)], the best of the runs
+    timings: dict[str, list[tuple[int, float]]] = {phase: [] for phase in PHASES}
+    with tempfile.TemporaryDirectory() as tmp:
+        for tokens in [size for size in SIZES if size <= max_tokens]:
+            source = Path(tmp) / f"scaling{tokens}.ce"
+            source.write_text(generate_program(shape_for(tokens)))
+            best: dict[str, float] = {}
+            for _ in range(runs):
+                for phase, seconds in compile_phases(source).items():
+                    best[phase] = min(seconds, best.get(phase, seconds))
+            total = sum(best.values())
+            print(
+                f"[INFO] {tokens:>9} tokens: "
+                + " ".join(f"{phase} {best[phase] * 1000:.1f}ms" for phase in PHASES)
+            )
+            for phase in PHASES:
+                timings[phase].append((tokens, best[phase]))
+            if total > budget:
+                print(
+                    f"[INFO] compiling took {total:.1f}s, "
+                    f"over the budget of {budget:.0f}s"
+                )
+                break
+
+    results: dict[str, dict[str, Any]] = {}
+    failed = False
+    for phase in PHASES:
+        points = [
+            (tokens, seconds)
+            for tokens, seconds in timings[phase]
+            if seconds >= MIN_FIT_TIME
+        ]
+        if len(points) < 3:
+            print(
+                f"[INFO] {phase}: not enough sizes "
+                f"over {MIN_FIT_TIME * 1000:.0f}ms to fit"
+            )
+            continue
+        exponent = fit_exponent(points)
+        allowed = n_log_n_exponent(points[0][0], points[-1][0]) + EXPONENT_TOLERANCE
+        ok = exponent <= allowed
+        failed |= not ok
+        results[phase] = {
+            "timings": timings[phase],
+            "exponent": exponent,
+            "allowed_exponent": allowed,
+            "ok": ok,
+        }
+        print(
+            f"[{'OK' if ok else 'FAIL'}] {phase}: grows like n^{exponent:.2f} "
+            f"between {points[0][0]} and {points[-1][0]} tokens "
+            f"(at most n^{allowed:.2f})"
+        )
+
+    if json_path is not None:
+        with open(json_path, "w") as f:
+            f.write(json.dumps(results, indent=2) + "\n")
+    if failed:
+        sys.exit(1)
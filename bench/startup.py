@@ -0,0 +1,111 @@
+"""
+startup benchmark for corpe.py
+
+it measures how much longer than a bare interpreter (`python -c pass`) it takes to
+start corpe.py with --help and to run the imports that corpe.py does for every compile,
+and fails if that goes over the budgets below. the imports are read from the
+`__main__` block of corpe.py, so the benchmark follows it when it changes.
+
+the budgets are relative to the start of the bare interpreter, so they hold on slow
+and fast machines alike. every measurement is the median of the runs, and the runs
+of the three commands are interleaved so a busy machine slows all of them down.
+
+usage:
+    python bench/startup.py [-runs N]
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import subprocess
+import statistics
+import time
+import ast
+import sys
+import os
+
+here = Path(os.path.abspath(__file__)).parent.parent
+
+# what corpe.py is allowed to add on top of `python -c pass`, as a multiple of it.
+# --help only imports sys, the cost is compiling corpe.py itself (it is a script, so
+# its bytecode is not cached), about 0.3x.
+# a compile imports the front end, the toolchain selection and the build helpers,
+# about 4x: the node classes of src/core.py (procs, variables, arrays, parallel-for,
+# comptime and strings) and src/build.py with subprocess are most of it. the IR, the
+# thread pool of -split, the asm backend, -watch, -pgo and -stats are only imported by
+# the builds that use them, the budget fails when one of those (about 1x) is not
+COMPILE_IMPORTS_BUDGET: float = 5.0
+HELP_BUDGET: float = 0.75
+
+
+def compile_imports() -> str:
+    """
+    the imports that the `__main__` block of corpe.py does unconditionally, the ones
+    inside of an if (a backend or a flag) are only paid by the builds that use them
+    """
+    tree = ast.parse((here / "corpe.py").read_text())
+    for node in tree.body:
+        if (
+            isinstance(node, ast.If)
+            and ast.unparse(node.test) == "__name__ == '__main__'"
+        ):
+            return "\n".join(
+                ast.unparse(statement)
+                for statement in node.body
+                if isinstance(statement, (ast.Import, ast.ImportFrom))
+            )
+    raise AssertionError("corpe.py has no __main__ block")
+
+
+# the bytecode of src/ is written on the first run, like it is for a user, even when
+# PYTHONDONTWRITEBYTECODE is set here. otherwise every run compiles the sources again
+environment = {
+    name: value
+    for name, value in os.environ.items()
+    if name != "PYTHONDONTWRITEBYTECODE"
+}
+
+
+def wall_time_ms(args: list[str]) -> float:
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, *args], cwd=here, capture_output=True, env=environment
+    )
+    return (time.perf_counter() - start) * 1000
+
+
+if __name__ == "__main__":
+    runs = 31
+    if "-runs" in sys.argv:
+        runs = int(sys.argv[sys.argv.index("-runs") + 1])
+
+    commands: dict[str, list[str]] = {
+        "bare interpreter": ["-c", "pass"],
+        "corpe.py --help": ["corpe.py", "--help"],
+        "compile imports": ["-c", compile_imports()],
+    }
+    times: dict[str, list[float]] = {name: [] for name in commands}
+    for name, args in commands.items():
+        wall_time_ms(args)  # warms up the file cache and the bytecode of src/
+    for _ in range(runs):
+        for name, args in commands.items():
+            times[name].append(wall_time_ms(args))
+
+    baseline = statistics.median(times["bare interpreter"])
+    print(f"[INFO] bare interpreter: {baseline:.2f}ms, median of {runs} runs")
+
+    ok = True
+    for name, budget in [
+        ("corpe.py --help", HELP_BUDGET),
+        ("compile imports", COMPILE_IMPORTS_BUDGET),
+    ]:
+        # the difference of two medians can come out a little negative
+        added = max(0.0, statistics.median(times[name]) - baseline)
+        passed = added <= budget * baseline
+        ok &= passed
+        print(
+            f"[{'OK' if passed else 'FAIL'}] {name}: +{added:.2f}ms "
+            f"({added / baseline:.2f}x the bare interpreter, budget {budget:.2f}x)"
+        )
+
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,166 @@
+"""
+the runtime benchmark suite: compiles every program in bench/programs with every
+configuration, runs each executable several times and reports the median, the p95
+and the throughput of every (program, configuration) as JSON.
+the outputs of every configuration of a program have to be the same, a codegen
+change that changes them makes the suite fail
+
+usage:
+    python bench/suite.py [-runs N] [-configs "-O0 -O1 -O2 asm"] [-only <PROGRAM>]
+                          [-o <FILEPATH>]
+"""
+
+from __future__ import annotations
+
+from contextlib import redirect_stdout
+from pathlib import Path
+import subprocess
+import statistics
+import tempfile
+import hashlib
+import math
+import json
+import time
+import sys
+import os
+
+here = Path(os.path.abspath(__file__)).parent.parent
+sys.path.insert(0, str(here))
+
+from src import core, parsing, CEAst, typecheck  # type: ignore[import]
+from src import build, toolchain  # type: ignore[import]
+from src.compiler import write_c_code_from_AST  # type: ignore[import]
+from src.x86_64 import write_asm_from_AST  # type: ignore[import]
+
+# the amount of work every program does, the throughput is work units per second
+WORK: dict[str, tuple[int, str]] = {
+    "rule110": (1000 * 1000, "cells"),
+    "sieve": (10_000_000, "numbers"),
+    "nested": (200 * 200 * 200, "iterations"),
+    "memcopy": (16 * 1048576, "bytes"),
+    "print": (1_000_000, "lines"),
+}
+# "asm" is the x86-64 backend, everything else is an optimization level of the C backend
+DEFAULT_CONFIGS: list[str] = ["-O0", "-O1", "-O2", "asm"]
+
+
+def percentile(values: list[float], p: float) -> float:
+    # nearest rank
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def compile_program(ast: CEAst.AST, config: str, directory: Path, name: str) -> Path:
+    executable = directory / f"{name}{config}.exe"
+    if config == "asm":
+        asm_file = directory / f"{name}.s"
+        with open(asm_file, "w") as out:
+            write_asm_from_AST(ast, out)
+        exit_code = build.assemble_and_link(str(asm_file), str(executable))
+    else:
+        c_file = directory / f"{name}.c"
+        with open(c_file, "w") as out:
+            write_c_code_from_AST(ast, out, core.STACK_SIZE)
+        exit_code = build.compile_program(
+            toolchain.TOOLCHAINS["gcc"],
+            toolchain.BuildOptions(config),
+            str(c_file),
+            str(executable),
+        )
+    if exit_code:
+        print(f"[ERROR] could not build {name} with {config}", file=sys.stderr)
+        sys.exit(1)
+    return executable
+
+
+def measure(executable: Path, runs: int) -> tuple[list[float], str]:
+    """
+    the wall times of `runs` runs and the sha256 of the output
+    """
+    times = []
+    output_hash = ""
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [str(executable)],
+            stdout=subprocess.PIPE,
+            stdin=subprocess.DEVNULL,
+            check=True,
+        )
+        times.append(time.perf_counter() - start)
+        output_hash = hashlib.sha256(result.stdout).hexdigest()
+    return times, output_hash
+
+
+def main() -> None:
+    runs = 5
+    configs = DEFAULT_CONFIGS
+    only = None
+    output = None
+    if "-runs" in sys.argv:
+        runs = int(sys.argv[sys.argv.index("-runs") + 1])
+    if "-configs" in sys.argv:
+        configs = sys.argv[sys.argv.index("-configs") + 1].split()
+    if "-only" in sys.argv:
+        only = sys.argv[sys.argv.index("-only") + 1]
+    if "-o" in sys.argv:
+        output = sys.argv[sys.argv.index("-o") + 1]
+
+    programs = sorted((here / "bench" / "programs").glob(f"*{core.EXTENSION}"))
+    if only is not None:
+        programs = [program for program in programs if program.stem == only]
+        if not programs:
+            print(f"[ERROR] there is no benchmark called {only}", file=sys.stderr)
+            sys.exit(1)
+
+    results = []
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for program in programs:
+            ast = CEAst.makeAST(parsing.parse_file(str(program)), program)
+            typecheck.typecheck_AST(ast)
+            work, unit = WORK[program.stem]
+            hashes: set[str] = set()
+            for config in configs:
+                # the commands are echoed to stderr, stdout is only for the report
+                with redirect_stdout(sys.stderr):
+                    executable = compile_program(ast, config, Path(tmp), program.stem)
+                times, output_hash = measure(executable, runs)
+                hashes.add(output_hash)
+                median = statistics.median(times)
+                results.append(
+                    {
+                        "program": program.stem,
+                        "config": config,
+                        "runs": runs,
+                        "median_s": median,
+                        "p95_s": percentile(times, 95),
+                        "throughput": work / median,
+                        "unit": f"{unit}/s",
+                        "output_sha256": output_hash,
+                    }
+                )
+                print(
+                    f"[INFO] {program.stem:8} {config:4} median {median * 1000:9.2f}ms",
+                    file=sys.stderr,
+                )
+            if len(hashes) > 1:
+                print(
+                    f"[ERROR] the output of {program.stem} "
+                    "depends on the configuration",
+                    file=sys.stderr,
+                )
+                failed = True
+
+    report = json.dumps({"results": results}, indent=2)
+    if output is not None:
+        with open(output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
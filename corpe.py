@@ -3,19 +3,21 @@
 # generate the C code
 # call a C compiler that will compile the generated C
 
-from __future__ import annotations
+# NOTE: this script is called a lot from other scripts, so only `sys` is imported
+# at the top level. everything else is imported when it is actually needed so
+# that `--help` and argument errors do not pay for the whole compiler.
+# see bench/startup.py for the startup budget
 
-from src.compiler import generate_c_code_from_AST  # type: ignore[import]
+from __future__ import annotations
 
-import subprocess
-from pathlib import Path
-from typing import Union
-from src import core, parsing, CEAst, typecheck  # type: ignore[import]
 import sys
-import shlex
 
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Optional
 
-def read_file(filepath: Union[Path, str]) -> str:
+
+def read_file(filepath: str) -> str:
     with open(filepath, "r") as f:
         return f.read()
 
@@ -25,12 +27,33 @@ def usage() -> None:
     print("python corpe.py <FILEPATH>")
     print("Optional flags:")
     print("    -r (run the generated executable)")
+    print("    -backend <c|asm> (c: through C, asm: x86-64 assembly, default c)")
+    print("    -bounds-check (check the index of every <array>.get and <array>.set)")
+    print("    -split (split the program into C files and compile them in parallel)")
+    print("    -j <N> (the parallel compiler jobs of -split, default one per core)")
+    print("    -pgo (profile guided: instrument, train, rebuild with the profile)")
+    print('    -pgo-args "<ARGS>" (the arguments of the training run)')
+    print("    -pgo-input <FILEPATH> (the stdin of the training run)")
+    print("    -watch (rebuild, and with -r rerun, every time the file changes)")
+    print("    -emit-ir (save the checked program to <FILEPATH>.ceir, which can be")
+    print("              compiled instead of the source)")
+    print("    -stats (with -r, report the time, memory, page faults and context")
+    print("            switches of the run)")
+    print("    -repeat <N> (with -stats, run the executable N times and summarize)")
+    print("    -stats-json <FILEPATH> (with -stats, also save the runs as JSON)")
     print("Compiler flags:")
+    print("    -cc <gcc|clang|tcc> (the C compiler, default the best for the profile)")
+    print("    -profile <dev|release> (dev: fast compile, release: fast executable)")
     print("    -O0 (no optimizations, default)")
     print("    -O1 (some optimizations)")
     print("    -O2 (more optimizations)")
     print("    -O3 (even more optimizations)")
     print("    -Ofast (using experimental features)")
+    print("    -march-native (optimize for this machine)")
+    print("    -flto (link time optimizations)")
+    print("    -static (link statically)")
+    print('    -cflags "<FLAGS>" (extra compiler flags, CFLAGS is used too)')
+    print('    -ldflags "<FLAGS>" (extra linker flags, LDFLAGS is used too)')
     sys.exit(1)
 
 
@@ -41,8 +64,32 @@ def consume_arg(arg: str) -> bool:
     return False
 
 
-def get_optimization_flag() -> str:
-    ret = "-O0"
+def consume_arg_value(arg: str, default: str) -> str:
+    if arg in sys.argv:
+        index = sys.argv.index(arg)
+        if index + 1 >= len(sys.argv):
+            print(f"[ERROR] {arg} expects a value", file=sys.stderr)
+            usage()
+        value = sys.argv[index + 1]
+        del sys.argv[index : index + 2]
+        return value
+    return default
+
+
+def consume_int_value(arg: str, default: int) -> int:
+    value = consume_arg_value(arg, str(default))
+    try:
+        return int(value)
+    except ValueError:
+        print(
+            f"[ERROR] {arg} expects a number but found {repr(value)}", file=sys.stderr
+        )
+        usage()
+        raise AssertionError("unreachable")
+
+
+def get_optimization_flag(default: str = "-O0") -> str:
+    ret = default
     if consume_arg("-O0"):
         ret = "-O0"
     if consume_arg("-O1"):
@@ -57,6 +104,9 @@ def get_optimization_flag() -> str:
 
 
 def echo_and_call(cmd: list[str]) -> int:
+    import shlex
+    import subprocess
+
     print(f"[CMD] {shlex.join(cmd)}")
     return subprocess.call(cmd)
 
@@ -69,32 +119,168 @@ if __name__ == "__main__":
     ):
         usage()
 
+    from pathlib import Path
+    import shlex
+    from src import core, parsing, CEAst, typecheck  # type: ignore[import]
+    from src import build, toolchain, comptime  # type: ignore[import]
+    from src.compiler import write_c_code_from_AST  # type: ignore[import]
+    from src.compiler import all_parallel_loops  # type: ignore[import]
+
     filepath: str = sys.argv.pop(1)
+    from_ir: bool = filepath.endswith(core.IR_EXTENSION)
+    extension: str = core.IR_EXTENSION if from_ir else core.EXTENSION
     base_filename: str = (
-        filepath[: -len(core.EXTENSION)]
-        if filepath.endswith(core.EXTENSION)
-        else filepath
+        filepath[: -len(extension)] if filepath.endswith(extension) else filepath
     )
     run: bool = "-r" in sys.argv
 
-    optimization_flag: str = get_optimization_flag()
+    profile: Optional[str] = consume_arg_value("-profile", "") or None
+    if profile is not None and profile not in toolchain.PREFERENCES:
+        print(f"[ERROR] unknown profile {profile}", file=sys.stderr)
+        usage()
+    cc = toolchain.select_toolchain(consume_arg_value("-cc", "") or None, profile)
+    options = toolchain.profile_options(cc, profile)
+    options.optimization = get_optimization_flag(options.optimization)
+    options.march_native |= consume_arg("-march-native")
+    options.lto |= consume_arg("-flto")
+    options.static |= consume_arg("-static")
+    options.cflags += shlex.split(consume_arg_value("-cflags", ""))
+    options.ldflags += shlex.split(consume_arg_value("-ldflags", ""))
+
+    backend: str = consume_arg_value("-backend", "c")
+    if backend not in ("c", "asm"):
+        print(f"[ERROR] unknown backend {backend}", file=sys.stderr)
+        usage()
+    bounds_checks: bool = consume_arg("-bounds-check")
+    split: bool = consume_arg("-split")
+    jobs: int = consume_int_value("-j", 0)
+    if jobs < 0:
+        print("[ERROR] -j can not be negative", file=sys.stderr)
+        usage()
+    pgo: bool = consume_arg("-pgo")
+    pgo_args: list[str] = shlex.split(consume_arg_value("-pgo-args", ""))
+    pgo_input: Optional[str] = consume_arg_value("-pgo-input", "") or None
+    if pgo and split:
+        print("[ERROR] -pgo can not be used with -split", file=sys.stderr)
+        usage()
+    if backend == "asm" and (pgo or split):
+        print("[ERROR] -pgo and -split need the C backend", file=sys.stderr)
+        usage()
+
+    emit_ir: bool = consume_arg("-emit-ir")
+    stats: bool = consume_arg("-stats")
+    repeat: int = consume_int_value("-repeat", 1)
+    stats_json: Optional[str] = consume_arg_value("-stats-json", "") or None
+    if (repeat != 1 or stats_json is not None) and not stats:
+        print("[ERROR] -repeat and -stats-json need -stats", file=sys.stderr)
+        usage()
+    if repeat < 1:
+        print("[ERROR] -repeat expects at least one run", file=sys.stderr)
+        usage()
+    if consume_arg("-watch"):
+        if split or pgo or emit_ir or from_ir:
+            print(
+                "[ERROR] -watch only works on a source file "
+                "without -split, -pgo and -emit-ir",
+                file=sys.stderr,
+            )
+            usage()
+        from src.watch import Watcher  # type: ignore[import]
 
-    CEAst.run_checks()
+        Watcher(
+            filepath, base_filename, backend, cc, options, bounds_checks, run
+        ).watch()
+        sys.exit(0)
+    if from_ir:
+        from src import ir  # type: ignore[import]
 
-    with open(base_filename + ".c", "w") as out:
+        print(f"[INFO] loading {filepath}...")
+        ir_file = ir.IRFile(filepath)
+        stale = ir_file.stale_sources()
+        if stale:
+            print(
+                f"[ERROR] {filepath} is older than {', '.join(stale)}, "
+                "compile the source with -emit-ir again",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        # only checked programs are saved
+        ast = ir_file.to_AST()
+        ir_file.close()
+    else:
         print(f"[INFO] parsing {filepath}...")
         ast = CEAst.makeAST(parsing.parse_file(filepath), Path(filepath))
         print(f"[INFO] type checking {filepath}...")
         typecheck.typecheck_AST(ast)
+        if emit_ir:
+            from src import ir  # type: ignore[import]
+
+            print(f"[INFO] saving {base_filename + core.IR_EXTENSION}...")
+            ir.save_ir(ast, base_filename + core.IR_EXTENSION)
+    # the backends bake too, it is done here so the parallel loops that only ran
+    # at compile time do not need OpenMP
+    comptime.bake(ast)
+    if backend == "c" and all_parallel_loops(ast):
+        cc.enable_openmp(options)
+
+    if backend == "asm":
+        from src.x86_64 import write_asm_from_AST  # type: ignore[import]
+
+        with open(base_filename + ".s", "w") as out:
+            print("[INFO] generating x86-64 assembly...")
+            write_asm_from_AST(ast, out, bounds_checks)
+        print("[INFO] assembling with as and ld...")
+        if build.assemble_and_link(base_filename + ".s", base_filename + ".exe"):
+            run = False
+    elif split:
+        from src.compiler import write_translation_units  # type: ignore[import]
+
         print("[INFO] generating C code...")
-        out.write(generate_c_code_from_AST(ast, core.STACK_SIZE))
+        units = write_translation_units(
+            ast,
+            Path(base_filename + ".units"),
+            core.STACK_SIZE,
+            bounds_checks=bounds_checks,
+        )
+        print(f"[INFO] compiling {len(units)} translation units with {cc.name}...")
+        if build.compile_translation_units(
+            cc, options, units, base_filename + ".exe", jobs
+        ):
+            run = False
+    else:
+        with open(base_filename + ".c", "w") as out:
+            print("[INFO] generating C code...")
+            write_c_code_from_AST(
+                ast, out, core.STACK_SIZE, bounds_checks=bounds_checks
+            )
 
-    print("[INFO] compiling with GCC compiler...")
-    if echo_and_call(
-        ["gcc", base_filename + ".c", "-o", base_filename + ".exe", optimization_flag]
-    ):
-        run = False
+        if pgo:
+            from src import pgo as pgo_build  # type: ignore[import]
 
-    if run:
+            print(
+                f"[INFO] compiling with {cc.name} and profile guided optimizations..."
+            )
+            if pgo_build.build_with_pgo(
+                cc,
+                options,
+                base_filename + ".c",
+                base_filename + ".exe",
+                pgo_args,
+                pgo_input,
+            ):
+                run = False
+        else:
+            print(f"[INFO] compiling with {cc.name}...")
+            if build.compile_program(
+                cc, options, base_filename + ".c", base_filename + ".exe"
+            ):
+                run = False
+
+    if run and stats:
+        from src.stats import run_and_report  # type: ignore[import]
+
+        print("[INFO] running the executable...")
+        run_and_report([base_filename + ".exe"], repeat, stats_json)
+    elif run:
         print("[INFO] running the executable...")
         echo_and_call([base_filename + ".exe"])
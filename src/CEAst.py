@@ -10,27 +10,55 @@ from src.core import (  # type: ignore[import]
     KeyWord,
     mapping,
     mapping_names,
+    words,
     Types,
     LocType,
     Push,
     Mem,
     PushMem,
+    PushMemLength,
+    PushStr,
+    MEMORY_LENGTH_SUFFIX,
+    ArrayGet,
+    ArraySet,
+    ARRAY_GET_SUFFIX,
+    ARRAY_SET_SUFFIX,
+    ELEMENT_TYPES,
     Macro,
+    Proc,
+    Call,
+    ParallelFor,
+    Comptime,
+    Variable,
+    PushVar,
+    SetVar,
+    PROC_SEPARATOR,
+    PROC_BODY,
+    TYPE_WORDS,
+    STRING_QUOTE,
+    STRING_ESCAPES,
     Operation,
     ExpandedFromNode,
 )
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from pathlib import Path
-from typing import *
 
 import itertools
 
 import sys
 
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Optional, Union
+
 
 def run_checks():
+    """
+    validates the word tables, this is a development time check (see tests.py -checks)
+    and it is not run every time the compiler starts
+    """
     err: bool = False
     for team in [Intrinsics, KeyWords]:
         for op in team:
@@ -48,6 +76,10 @@ class AST:
     path: Path
     body: list[BuildIn]
     memories: list[Mem]
+    procs: list[Proc] = field(default_factory=list)
+    variables: list[Variable] = field(default_factory=list)
+    # the texts of the string literals, every text is kept once
+    strings: list[bytes] = field(default_factory=list)
 
 
 def compiler_error(
@@ -62,6 +94,36 @@ def format_location(file: str, line: int, column: int) -> str:
     return f"{file}:{line + 1}:{column + 1}"
 
 
+def decode_string(op: Operation) -> bytes:
+    """
+    the bytes of a string literal (the word with its quotes), as utf-8
+    """
+    text: list[str] = []
+    i = 1
+    while i < len(op.word):
+        char = op.word[i]
+        if char == STRING_QUOTE:
+            # the lexer ends the word at the closing quote
+            return "".join(text).encode()
+        if char == "\\":
+            escape = op.word[i + 1 : i + 2]
+            if escape not in STRING_ESCAPES:
+                compiler_error(
+                    op.format_location(),
+                    f"unknown escape {repr(char + escape)} in the string, expected one of "
+                    + ", ".join("\\" + key for key in STRING_ESCAPES),
+                )
+            text.append(STRING_ESCAPES[escape])
+            i += 2
+            continue
+        text.append(char)
+        i += 1
+    compiler_error(
+        op.format_location(), "the string is not closed before the end of the line"
+    )
+    raise AssertionError("unreachable")
+
+
 def corpe_basic_math_eval(ops: list[Operation], constants: dict[str, int]) -> int:
     stack = []
     for op in ops:
@@ -119,16 +181,12 @@ def corpe_basic_math_eval(ops: list[Operation], constants: dict[str, int]) -> in
 
 
 def check_word_redefinition(
-    name: str, constants: dict[str, int], memories: list[Mem], macros: list[Macro]
+    name: str,
+    constants: dict[str, int],
+    memory_names: set[str],
+    macros: dict[str, Macro],
 ) -> bool:
-    if name in constants:
-        return True
-    if name in memories:
-        return True
-    for macro in macros:
-        if name == macro.name:
-            return True
-    return False
+    return name in constants or name in memory_names or name in macros
 
 
 def isint(s: str) -> bool:
@@ -139,7 +197,7 @@ def isint(s: str) -> bool:
 
 
 def can_be_int(s: str) -> bool:
-    return (
+    return bool(
         Patterns.hexadecimal_format.search(s)
         or Patterns.binary_format.search(s)
         or isint(s)
@@ -147,15 +205,23 @@ def can_be_int(s: str) -> bool:
 
 
 def gather_ops_to_right_until_op(
-    ops_to_right: list[Operation], blocked: list[str], out: list[Operation], exit_word: str=mapping[KeyWords.END]
+    operations: list[Operation],
+    start: int,
+    blocked: list[str],
+    out: list[Operation],
+    exit_word: str = mapping[KeyWords.END],
 ) -> int:
     """
+    gathers the operations from operations[start] on, the list is not sliced so
+    a definition costs the length of its body and not of the rest of the program
+
     return codes:
         0: no errors
         1: operation was blocked (the operation that caused the error will be pushed to the output)
         2: end keyword was not found
     """
-    for op in ops_to_right:
+    for i in range(start, len(operations)):
+        op = operations[i]
         if op.word in blocked:
             out.append(op)
             return 1
@@ -165,21 +231,129 @@ def gather_ops_to_right_until_op(
     return 2
 
 
+def parse_proc_header(
+    op: Operation, operations: list[Operation], start: int
+) -> tuple[Proc, int]:
+    """
+    parses `<name> <inputs> -- <outputs> in` from operations[start] on, after the
+    proc keyword, returns the proc (without a body) and the number of operations of the header
+    """
+    if start >= len(operations):
+        compiler_error(
+            op.format_location(), "expected a name for the proc but found nothing"
+        )
+    name = operations[start].word
+    if can_be_int(name):
+        compiler_error(
+            operations[start].format_location(), "proc name can not be a number"
+        )
+
+    ins: list[Types] = []
+    outs: list[Types] = []
+    types = ins
+    for i in range(1, len(operations) - start):
+        header_op = operations[start + i]
+        if header_op.word == PROC_SEPARATOR and types is ins:
+            types = outs
+        elif header_op.word == PROC_BODY and types is outs:
+            return Proc(name, op.loc, ins, outs, []), i + 1
+        elif header_op.word in TYPE_WORDS:
+            types.append(TYPE_WORDS[header_op.word])
+        else:
+            compiler_error(
+                header_op.format_location(),
+                f"expected a type ({', '.join(TYPE_WORDS)}), "
+                f"'{PROC_SEPARATOR if types is ins else PROC_BODY}' in the signature of {name} "
+                f"but found {repr(header_op.word)}",
+            )
+    compiler_error(
+        op.format_location(),
+        f"the signature of {name} has to be `<inputs> {PROC_SEPARATOR} <outputs> {PROC_BODY}`",
+    )
+    raise AssertionError("unreachable")
+
+
+def group_blocks(body: list[BuildIn], first_id: int) -> list[BuildIn]:
+    """
+    moves the operations between every parallel-for or comptime and its end into a
+    ParallelFor or Comptime node, the parallel loops are numbered from `first_id`
+    """
+    grouped: list[BuildIn] = []
+    # the enclosing bodies and the node that is being gathered
+    outer: list[tuple[list[BuildIn], Union[ParallelFor, Comptime]]] = []
+    # the blocks that are open in the current body, an end closes the loop only at 0
+    depths: list[int] = [0]
+    next_id = first_id
+    for node in body:
+        if isinstance(node, KeyWord) and node.typ in (
+            KeyWords.PARALLEL_FOR,
+            KeyWords.COMPTIME,
+        ):
+            block: Union[ParallelFor, Comptime]
+            if node.typ == KeyWords.PARALLEL_FOR:
+                block = ParallelFor(
+                    node.loc, [], next_id, expanded_from=node.expanded_from
+                )
+                next_id += 1
+            else:
+                block = Comptime(node.loc, [], expanded_from=node.expanded_from)
+            outer.append((grouped, block))
+            grouped = block.body
+            depths.append(0)
+            continue
+        if isinstance(node, KeyWord) and node.typ in (KeyWords.IF, KeyWords.WHILE):
+            depths[-1] += 1
+        elif isinstance(node, KeyWord) and node.typ == KeyWords.END:
+            if depths[-1] == 0 and outer:
+                depths.pop()
+                grouped, block = outer.pop()
+                grouped.append(block)
+                continue
+            depths[-1] -= 1
+        grouped.append(node)
+    if outer:
+        block = outer[-1][1]
+        name = "parallel-for" if isinstance(block, ParallelFor) else "comptime"
+        compiler_error(block.format_location(), f"end for the {name} was not found")
+    return grouped
+
+
+def parallel_loops(body: list[BuildIn]) -> list[ParallelFor]:
+    """
+    every parallel-for in `body`, the nested ones and the ones in comptime blocks included
+    """
+    loops: list[ParallelFor] = []
+    for node in body:
+        if isinstance(node, ParallelFor):
+            loops.append(node)
+        if isinstance(node, ParallelFor) or isinstance(node, Comptime):
+            loops.extend(parallel_loops(node.body))
+    return loops
+
+
 def makeAST(ops: list[tuple[LocType, str]], path: Path) -> AST:
     # NOTE: in C &var, were var is a pointer, it returns the address of it
 
-    # all of the instructions that will be compiled
-    body: list[BuildIn] = []
     # constants are only a parsing stage thing and not a compilation stage
     constants: dict[str, int] = {}
     # the arrays/memories declared with the mem keyword
     memories: list[Mem] = []
-    memory_names: list[str] = []  # only at the make ast stage
+    memory_names: set[str] = set()  # only at the make ast stage
+    # `<name>.length` -> `<name>` for the memories that are mapped from files
+    memory_length_names: dict[str, str] = {}
+    # `<name>.get`/`<name>.set` -> `<name>` and the node for the arrays
+    array_names: dict[str, tuple[str, type]] = {}
     # for the end keyword
     keyword_stack: list[KeyWord] = []
     # macro definitions are a parsing stage thing
-    macros: list[Macro] = []
-    macro_names: list[str] = []
+    macros: dict[str, Macro] = {}
+    procs: list[Proc] = []
+    proc_ids: dict[str, int] = {}
+    # the operations of the body of every proc
+    proc_operations: list[list[Operation]] = []
+    # the proc whose body is being gathered and the number of blocks open in it
+    current_proc: Optional[Proc] = None
+    proc_depth: int = 0
 
     # this is here so we can collect all of the errors that the program produces
     error_occurred: bool = False
@@ -188,53 +362,81 @@ def makeAST(ops: list[tuple[LocType, str]], path: Path) -> AST:
 
     ops_count: int = len(ops)
 
-    # the operations that are to the right of the current operation
-    ops_to_right: list[Operation]
+    # the index of the operation that is to the right of the current operation
+    start: int
 
     _operations: list[Operation] = [Operation(x[0], x[1]) for x in ops]
     operations: list[Operation] = []
-    for i, op in enumerate(_operations):  # first pass to gather information about the program
+
+    def add_operation(op: Operation) -> None:
+        """
+        adds an operation to the program or to the body of the proc that is being
+        gathered, the end that matches the proc closes it
+        """
+        nonlocal current_proc, proc_depth
+        if current_proc is None:
+            operations.append(op)
+            return
+        if op.word in (
+            mapping[KeyWords.IF],
+            mapping[KeyWords.WHILE],
+            mapping[KeyWords.PARALLEL_FOR],
+            mapping[KeyWords.COMPTIME],
+        ):
+            proc_depth += 1
+        elif op.word == mapping[KeyWords.END]:
+            if proc_depth == 0:
+                current_proc = None
+                return
+            proc_depth -= 1
+        proc_operations[-1].append(op)
+
+    for i, op in enumerate(
+        _operations
+    ):  # first pass to gather information about the program
         if skips:
             skips -= 1
             continue
-        ops_to_right = _operations[i + 1 :]
+        start = i + 1
         if op.word == mapping[KeyWords.MACRO]:
-            if len(ops_to_right) <= 1:
+            if ops_count - start <= 1:
                 compiler_error(
-                    op.format_location(),
-                    f"macro definition needs a name and a ending"
+                    op.format_location(), f"macro definition needs a name and a ending"
                 )
 
-            gathered = []
+            gathered: list[Operation] = []
             blocked = [
                 mapping[KeyWords.MACRO],
                 mapping[KeyWords.CONST],
                 mapping[KeyWords.MEMORY],
+                mapping[KeyWords.MEMORY_FILE],
+                mapping[KeyWords.MEMORY_FILE_RW],
+                mapping[KeyWords.ARRAY],
+                mapping[KeyWords.PROC],
             ]
-            macro_name = ops_to_right[0].word
+            macro_name = _operations[start].word
 
-            if check_word_redefinition(macro_name, constants, memories, macros):
+            if check_word_redefinition(macro_name, constants, memory_names, macros):
                 compiler_error(
-                    ops_to_right[0].format_location(),
-                    f"{macro_name} is already defined"
+                    _operations[start].format_location(),
+                    f"{macro_name} is already defined",
                 )
 
             ret_code = gather_ops_to_right_until_op(
-                ops_to_right[1:], blocked, gathered, mapping[KeyWords.ENDMACRO]
+                _operations, start + 1, blocked, gathered, mapping[KeyWords.ENDMACRO]
             )
             skips += len(gathered) + 2
 
             if ret_code == 0:
-                macro_name = ops_to_right[0].word
-                if check_word_redefinition(macro_name, constants, memories, macros):
+                macro_name = _operations[start].word
+                if check_word_redefinition(macro_name, constants, memory_names, macros):
                     error_text = "can not redefine a already existing word"
                 if can_be_int(macro_name):
                     error_text = "constant name can not be a number"
                 if "error_text" in locals():
-                    compiler_error(ops_to_right[0].format_location(), error_text)
+                    compiler_error(_operations[start].format_location(), error_text)
 
-                macro_names.append(macro_name)
-                macros.append(Macro(macro_name, op.loc, gathered))
+                macros[macro_name] = Macro(macro_name, op.loc, gathered)
                 continue
             # anything from here is a error
             if ret_code == 1:
@@ -252,19 +454,23 @@ def makeAST(ops: list[tuple[LocType, str]], path: Path) -> AST:
                 mapping[KeyWords.IF],
                 mapping[KeyWords.WHILE],
                 mapping[KeyWords.MEMORY],
+                mapping[KeyWords.MEMORY_FILE],
+                mapping[KeyWords.MEMORY_FILE_RW],
+                mapping[KeyWords.ARRAY],
                 mapping[KeyWords.DO],
                 mapping[KeyWords.CONST],
                 mapping[KeyWords.MACRO],
+                mapping[KeyWords.PROC],
             ]
 
             operations_to_evaluate: list[Operation] = []
             ret_code = gather_ops_to_right_until_op(
-                ops_to_right, blocked, operations_to_evaluate
+                _operations, start, blocked, operations_to_evaluate
             )
             skips += len(operations_to_evaluate) + 1
 
             if ret_code == 0:
-                len_ops_to_left = len(ops_to_right)
+                len_ops_to_left = ops_count - start
                 if len_ops_to_left == 0:
                     error_text = (
                         "expected name for constant definition but found nothing"
@@ -273,13 +479,15 @@ def makeAST(ops: list[tuple[LocType, str]], path: Path) -> AST:
                     error_text = "a name, value and a ending was expected for a constant declaration"
                 if "error_text" in locals():
                     compiler_error(op.format_location(), error_text)
-                constant_name = ops_to_right[0].word
-                if check_word_redefinition(constant_name, constants, memories, macros):
+                constant_name = _operations[start].word
+                if check_word_redefinition(
+                    constant_name, constants, memory_names, macros
+                ):
                     error_text = "can not redefine a already existing word"
                 if can_be_int(constant_name):
                     error_text = "constant name can not be a number"
                 if "error_text" in locals():
-                    compiler_error(ops_to_right[0].format_location(), error_text)
+                    compiler_error(_operations[start].format_location(), error_text)
 
                 operations_to_evaluate = operations_to_evaluate[1:]
                 if len(operations_to_evaluate) == 0:
@@ -302,58 +510,124 @@ def makeAST(ops: list[tuple[LocType, str]], path: Path) -> AST:
                     op.format_location(),
                     f"end for the const declaration was not found, const block needs to end with 'end' keyword",
                 )
-        elif op.word in macro_names:
-            for macro in macros:
-                if macro.name == op.word:
-                    for op_ in macro.ops:
-                        op_.expanded_from = ExpandedFromNode(op.loc, op.word)
-                        operations.append(op_)
-        elif op.word == mapping[KeyWords.MEMORY]:
+        elif op.word == mapping[KeyWords.PROC]:
+            if current_proc is not None:
+                compiler_error(
+                    op.format_location(),
+                    f"a proc can not be defined inside of {current_proc.name}",
+                )
+            proc, header_length = parse_proc_header(op, _operations, start)
+            skips += header_length
+            if (
+                check_word_redefinition(proc.name, constants, memory_names, macros)
+                or proc.name in proc_ids
+            ):
+                compiler_error(
+                    _operations[start].format_location(),
+                    "can not redefine a already existing word",
+                )
+            proc.id = len(procs)
+            proc_ids[proc.name] = proc.id
+            procs.append(proc)
+            proc_operations.append([])
+            current_proc = proc
+            proc_depth = 0
+        elif op.word in macros:
+            for op_ in macros[op.word].ops:
+                op_.expanded_from = ExpandedFromNode(op.loc, op.word)
+                add_operation(op_)
+        elif op.word in (
+            mapping[KeyWords.MEMORY],
+            mapping[KeyWords.MEMORY_FILE],
+            mapping[KeyWords.MEMORY_FILE_RW],
+            mapping[KeyWords.ARRAY],
+        ):
             blocked = [
                 mapping[KeyWords.IF],
                 mapping[KeyWords.WHILE],
                 mapping[KeyWords.MEMORY],
+                mapping[KeyWords.MEMORY_FILE],
+                mapping[KeyWords.MEMORY_FILE_RW],
+                mapping[KeyWords.ARRAY],
                 mapping[KeyWords.DO],
                 mapping[KeyWords.CONST],
                 mapping[KeyWords.MACRO],
+                mapping[KeyWords.PROC],
             ]
 
             operations_to_evaluate = []
             ret_code = gather_ops_to_right_until_op(
-                ops_to_right, blocked, operations_to_evaluate
+                _operations, start, blocked, operations_to_evaluate
             )
             skips += len(operations_to_evaluate) + 1
 
             if ret_code == 0:
-                len_ops_to_left = len(ops_to_right)
+                len_ops_to_left = ops_count - start
                 if len_ops_to_left == 0:
                     error_text = "expected name for memory definition but found nothing"
                 if len_ops_to_left == 1:
                     error_text = "a name, value and a ending was expected for a memory declaration"
                 if "error_text" in locals():
                     compiler_error(op.format_location(), error_text)
-                mem_name = ops_to_right[0].word
-                if check_word_redefinition(mem_name, constants, memories, macros):
+                mem_name = _operations[start].word
+                if check_word_redefinition(mem_name, constants, memory_names, macros):
                     error_text = "can not redefine a already existing word"
                 if can_be_int(mem_name):
                     error_text = "memory name can not be a number"
                 if "error_text" in locals():
-                    compiler_error(ops_to_right[0].format_location(), error_text)
+                    compiler_error(_operations[start].format_location(), error_text)
 
                 operations_to_evaluate = operations_to_evaluate[1:]
+                element_size = None
+                if op.word == mapping[KeyWords.ARRAY]:
+                    if (
+                        not operations_to_evaluate
+                        or operations_to_evaluate[0].word not in ELEMENT_TYPES
+                    ):
+                        compiler_error(
+                            op.format_location(),
+                            f"expected the element type of {mem_name} ({', '.join(ELEMENT_TYPES)}) after its name",
+                        )
+                    element_size = ELEMENT_TYPES[operations_to_evaluate[0].word]
+                    operations_to_evaluate = operations_to_evaluate[1:]
                 if len(operations_to_evaluate) == 0:
                     compiler_error(
                         op.format_location(), f"memory declaration needs a body"
                     )
 
-                memories.append(
-                    Mem(
-                        corpe_basic_math_eval(operations_to_evaluate, constants),
-                        mem_name,
-                        op.loc,
+                value = corpe_basic_math_eval(operations_to_evaluate, constants)
+                if op.word == mapping[KeyWords.MEMORY]:
+                    memories.append(Mem(value, mem_name, op.loc))
+                elif element_size is not None:
+                    # the value is the number of elements
+                    memories.append(
+                        Mem(
+                            value * element_size,
+                            mem_name,
+                            op.loc,
+                            element_size=element_size,
+                        )
                     )
-                )
-                memory_names.append(mem_name)
+                    array_names[mem_name + ARRAY_GET_SUFFIX] = (mem_name, ArrayGet)
+                    array_names[mem_name + ARRAY_SET_SUFFIX] = (mem_name, ArraySet)
+                else:
+                    # the value is the index of the command line argument that has the path
+                    if value < 1:
+                        compiler_error(
+                            op.format_location(),
+                            f"the argument index of a {op.word} declaration has to be at least 1",
+                        )
+                    memories.append(
+                        Mem(
+                            0,
+                            mem_name,
+                            op.loc,
+                            argument=value,
+                            writable=op.word == mapping[KeyWords.MEMORY_FILE_RW],
+                        )
+                    )
+                    memory_length_names[mem_name + MEMORY_LENGTH_SUFFIX] = mem_name
+                memory_names.add(mem_name)
                 continue
             # anything from here is a error
             if ret_code == 1:
@@ -367,64 +641,136 @@ def makeAST(ops: list[tuple[LocType, str]], path: Path) -> AST:
                     f"end for the const declaration was not found, const block needs to end with 'end' keyword",
                 )
         else:
-            operations.append(op)
-
-    for i, op in enumerate(operations):  # second pass
-        if skips:
-            skips -= 1
-            continue
-        ops_to_right = operations[i + 1 :]
-
-        if op.word in memory_names:
+            add_operation(op)
+
+    if current_proc is not None:
+        compiler_error(
+            current_proc.format_location(),
+            f"end for the proc {current_proc.name} was not found",
+        )
+
+    variables: list[Variable] = []
+    strings: list[bytes] = []
+    string_ids: dict[bytes, int] = {}
+
+    def lower_operations(operations: list[Operation]) -> list[BuildIn]:  # second pass
+        """
+        main and every proc have their own variables, they are visible from
+        the declaration to the end of the body
+        """
+        nonlocal error_occurred
+        body: list[BuildIn] = []
+        variable_ids: dict[str, int] = {}
+        i = 0
+        while i < len(operations):
+            op = operations[i]
+            i += 1
             exp_from = None
             if op.expanded_from is not None:
                 exp_from = op.expanded_from
-            body.append(PushMem(op.word, op.loc, expanded_from=exp_from))
-            continue
 
-        elif op.word in mapping_names:
-            exp_from = None
-            if op.expanded_from is not None:
-                exp_from = op.expanded_from
-            found = False
-            for oper in Intrinsics:
-                if op.word == mapping[oper]:
+            if op.word == mapping[KeyWords.VAR]:
+                # var <name> [int|ptr]
+                if i >= len(operations):
+                    compiler_error(
+                        op.format_location(),
+                        "expected a name for the variable but found nothing",
+                    )
+                name = operations[i].word
+                i += 1
+                if (
+                    name in variable_ids
+                    or name in words
+                    or name in proc_ids
+                    or name in memory_names
+                    or name in memory_length_names
+                    or name in array_names
+                    or check_word_redefinition(name, constants, memory_names, macros)
+                ):
+                    compiler_error(
+                        operations[i - 1].format_location(),
+                        "can not redefine a already existing word",
+                    )
+                if can_be_int(name):
+                    compiler_error(
+                        operations[i - 1].format_location(),
+                        "variable name can not be a number",
+                    )
+                typ = Types.INT
+                if i < len(operations) and operations[i].word in TYPE_WORDS:
+                    typ = TYPE_WORDS[operations[i].word]
+                    i += 1
+                variable_ids[name] = len(variables)
+                variables.append(Variable(name, op.loc, typ, len(variables)))
+            elif op.word == mapping[KeyWords.SET]:
+                # set <name>
+                if i >= len(operations) or operations[i].word not in variable_ids:
+                    compiler_error(
+                        op.format_location(),
+                        f"{op.word} expects the name of a variable",
+                    )
+                name = operations[i].word
+                i += 1
+                body.append(
+                    SetVar(name, op.loc, variable_ids[name], expanded_from=exp_from)
+                )
+            elif op.word in variable_ids:
+                body.append(
+                    PushVar(
+                        op.word, op.loc, variable_ids[op.word], expanded_from=exp_from
+                    )
+                )
+            elif op.word in memory_names:
+                body.append(PushMem(op.word, op.loc, expanded_from=exp_from))
+            elif op.word in array_names:
+                array_name, node = array_names[op.word]
+                body.append(node(array_name, op.loc, expanded_from=exp_from))
+            elif op.word in memory_length_names:
+                body.append(
+                    PushMemLength(
+                        memory_length_names[op.word], op.loc, expanded_from=exp_from
+                    )
+                )
+            elif op.word in proc_ids:
+                body.append(
+                    Call(op.word, op.loc, proc_ids[op.word], expanded_from=exp_from)
+                )
+            elif op.word in words:
+                oper = words[op.word]
+                if isinstance(oper, Intrinsics):
                     body.append(Intrinsic(oper, op.loc, expanded_from=exp_from))
-                    found = True
-                    break
-            for oper in KeyWords:
-                if op.word == mapping[oper]:
+                elif isinstance(oper, KeyWords):
                     body.append(KeyWord(oper, op.loc, expanded_from=exp_from))
-                    found = True
-            if not found:
-                raise NotImplementedError(op.word)
-            continue
-
-        elif can_be_int(op.word):
-            exp_from = None
-            if op.expanded_from is not None:
-                exp_from = op.expanded_from
-            # abuse bytecode optimization stage
-            body.append(Push(eval(op.word), Types.INT, expanded_from=exp_from))
-            continue
-
-        elif op.word in constants:
-            exp_from = None
-            if op.expanded_from is not None:
-                exp_from = op.expanded_from
-            body.append(Push(constants[op.word], Types.INT, expanded_from=exp_from))
-            continue
+                else:
+                    raise NotImplementedError(op.word)
+            elif op.word.startswith(STRING_QUOTE):
+                text = decode_string(op)
+                if text not in string_ids:
+                    string_ids[text] = len(strings)
+                    strings.append(text)
+                body.append(PushStr(op.loc, string_ids[text], expanded_from=exp_from))
+            elif can_be_int(op.word):
+                # abuse bytecode optimization stage
+                body.append(Push(eval(op.word), Types.INT, expanded_from=exp_from))
+            elif op.word in constants:
+                body.append(Push(constants[op.word], Types.INT, expanded_from=exp_from))
+            else:
+                compiler_error(
+                    op.format_location(),
+                    f"unrecognised word {repr(op.word)}",
+                    noexit=True,
+                )
+                error_occurred = True
+        return body
 
-        else:
-            compiler_error(
-                op.format_location(),
-                f"unrecognised word {repr(op.word)}",
-                noexit=True,
-            )
-            error_occurred = True
-            continue
+    # all of the instructions that will be compiled
+    body = group_blocks(lower_operations(operations), 0)
+    parallel_loop_count = len(parallel_loops(body))
+    for proc, proc_body in zip(procs, proc_operations):
+        proc.body = group_blocks(lower_operations(proc_body), parallel_loop_count)
+        parallel_loop_count += len(parallel_loops(proc.body))
 
     if error_occurred:
         sys.exit(1)
 
-    return AST(path, body, memories)
+    return AST(path, body, memories, procs, variables, strings)
@@ -0,0 +1,77 @@
+# compiles the generated C into an executable
+from __future__ import annotations
+
+from pathlib import Path
+
+from src.toolchain import BuildOptions, Toolchain  # type: ignore[import]
+
+import subprocess
+import shlex
+import os
+
+
+def echo_and_call(cmd: list[str]) -> int:
+    print(f"[CMD] {shlex.join(cmd)}")
+    return subprocess.call(cmd)
+
+
+def compile_program(
+    toolchain: Toolchain, options: BuildOptions, c_file: str, executable: str
+) -> int:
+    flags = toolchain.compile_flags(options)
+    # compiling and linking is one step here, so the flags that both need are only passed once
+    flags.extend(flag for flag in toolchain.link_flags(options) if flag not in flags)
+    return echo_and_call([toolchain.name, c_file, "-o", executable, *flags])
+
+
+def compile_translation_units(
+    toolchain: Toolchain,
+    options: BuildOptions,
+    units: list[Path],
+    executable: str,
+    jobs: int = 0,
+) -> int:
+    """
+    compiles every unit to an object file with up to `jobs` compilers running at the
+    same time (0 means one per core) and links the objects. returns the exit code of
+    the first step that failed or 0
+    """
+    # only -split needs the threads, so every other build does not import them
+    from concurrent.futures import ThreadPoolExecutor
+
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+
+    compile_flags = toolchain.compile_flags(options)
+
+    def compile_unit(unit: Path) -> int:
+        return echo_and_call(
+            [
+                toolchain.name,
+                "-c",
+                str(unit),
+                "-o",
+                str(unit.with_suffix(".o")),
+                *compile_flags,
+            ]
+        )
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for exit_code in pool.map(compile_unit, units):
+            if exit_code:
+                return exit_code
+
+    objects = [str(unit.with_suffix(".o")) for unit in units]
+    return echo_and_call(
+        [toolchain.name, *objects, "-o", executable, *toolchain.link_flags(options)]
+    )
+
+
+def assemble_and_link(asm_file: str, executable: str) -> int:
+    """
+    the assembly from src/x86_64.py does not need libc, so it is linked on its own
+    """
+    obj = str(Path(asm_file).with_suffix(".o"))
+    return echo_and_call(["as", asm_file, "-o", obj]) or echo_and_call(
+        ["ld", obj, "-o", executable]
+    )
@@ -19,12 +19,75 @@ from src.core import (  # type: ignore[import]
     Push,
     Mem,
     PushMem,
+    PushMemLength,
+    PushStr,
+    Proc,
+    Call,
+    ParallelFor,
+    PushVar,
+    SetVar,
+    ArrayGet,
+    ArraySet,
+    ARRAY_GET_SUFFIX,
+    ARRAY_SET_SUFFIX,
 )
 
+from src.typecheck import SIGNATURES  # type: ignore[import]
+from src.comptime import bake  # type: ignore[import]
+
+from dataclasses import dataclass
+from pathlib import Path
+
 import textwrap
+import sys
+import io
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Optional, TextIO
 
 memory_prefix: str = "CeMemory_"
+memory_length_prefix: str = "CeMemoryLength_"
 memory_padding: int = 5
+# the memories that are not mapped from files live in one arena, the ones that the
+# comptime blocks gave contents in a second one that is in .data instead of .bss
+arena_name: str = "ce_arena"
+data_arena_name: str = "ce_data_arena"
+# regions of at least a cache line start on one, the smaller ones are packed at the
+# width of their elements (a cell for memories)
+CACHE_LINE: int = 64
+CELL_SIZE: int = 8
+# a use of a memory in a loop counts as this many uses of the loop around it
+LOOP_WEIGHT: int = 8
+string_prefix: str = "CeString_"
+
+# size of the buffer that `print` and `putc` write to before it is flushed with write(2)
+output_buffer_size: int = 1 << 16
+
+# the number of top level operations of main that go to one translation unit
+MAIN_CHUNK_OPS: int = 5000
+
+# the C type of the elements of an array by their size in bytes
+ELEMENT_C_TYPES: dict[int, str] = {1: "char", 2: "short", 4: "int", 8: "long"}
+
+proc_prefix: str = "CeProc_"
+# the body of every parallel-for is a function that runs one iteration
+parallel_prefix: str = "CeParallel_"
+variable_prefix: str = "CeVar_"
+# procs with at most this many operations are inlined at every call
+PROC_INLINE_OPS: int = 16
+# the induction variable of a counted loop, suffixed with the nesting level
+counter_prefix: str = "ce_counter"
+
+# the conditions and steps of `while dup <limit> <compare> do ... <step> <+|-> end`
+COUNTED_LOOP_COMPARES: dict[Intrinsics, str] = {
+    Intrinsics.LT: "<",
+    Intrinsics.LE: "<=",
+    Intrinsics.NE: "!=",
+    Intrinsics.GE: ">=",
+    Intrinsics.GT: ">",
+}
+COUNTED_LOOP_STEPS: dict[Intrinsics, str] = {Intrinsics.ADD: "+=", Intrinsics.SUB: "-="}
 
 
 def construct_name(name: str) -> str:
@@ -34,287 +97,1307 @@ def construct_name(name: str) -> str:
     return "".join(str(ord(char)) for char in name)
 
 
-def generate_standard_code(
-    out: list[str],
-    ast: CEAst.AST,
-    stack_size: int = 30000,
-) -> None:
-    # NOTE: indentation has to be 8 spaces
+def generate_output_runtime(buffered_output: bool = True) -> str:
+    """
+    the functions that `print`, `putc` and `puts` compile to.
+    the buffered version avoids the locking and the format parsing of stdio
+    """
+    if not buffered_output:
+        return textwrap.dedent("""
+            void ce_flush() {
+              fflush(stdout);
+            }
+
+            void ce_putc(char c) {
+              fputc(c, stdout);
+            }
+
+            void ce_puts(bytes s, cell n) {
+              fwrite(s, 1, n, stdout);
+            }
+
+            void ce_print_int(cell value) {
+              printf("%ld\\n", value);
+            }
+        """)
+    return textwrap.dedent(f"""
+        static char ce_out_buffer[{output_buffer_size}];
+        static size_t ce_out_length = 0;
+
+        void ce_flush() {{
+          size_t written = 0;
+          while (written < ce_out_length) {{
+            ssize_t n = write(STDOUT_FILENO, ce_out_buffer + written, ce_out_length - written);
+            if (n < 0) {{
+              if (errno == EINTR) continue;
+              break;
+            }}
+            written += n;
+          }}
+          ce_out_length = 0;
+        }}
+
+        void ce_putc(char c) {{
+          if (ce_out_length == sizeof(ce_out_buffer)) ce_flush();
+          ce_out_buffer[ce_out_length++] = c;
+        }}
+
+        // the whole string is copied to the buffer, only a full buffer is written
+        void ce_puts(bytes s, cell n) {{
+          while (n > 0) {{
+            if (ce_out_length == sizeof(ce_out_buffer)) ce_flush();
+            size_t chunk = sizeof(ce_out_buffer) - ce_out_length;
+            if ((size_t) n < chunk) chunk = n;
+            memcpy(ce_out_buffer + ce_out_length, s, chunk);
+            ce_out_length += chunk;
+            s += chunk;
+            n -= chunk;
+          }}
+        }}
+
+        void ce_print_int(cell value) {{
+          // 19 digits, a sign and a new line
+          char digits[21];
+          int i = sizeof(digits);
+          unsigned long magnitude = value < 0 ? 0ul - (unsigned long) value : (unsigned long) value;
+          digits[--i] = '\\n';
+          do {{
+            digits[--i] = '0' + magnitude % 10;
+            magnitude /= 10;
+          }} while (magnitude);
+          if (value < 0) digits[--i] = '-';
+          if (ce_out_length + sizeof(digits) > sizeof(ce_out_buffer)) ce_flush();
+          memcpy(ce_out_buffer + ce_out_length, digits + i, sizeof(digits) - i);
+          ce_out_length += sizeof(digits) - i;
+        }}
+    """)
+
+
+def generate_io_runtime() -> str:
+    """
+    the functions behind `read`, `read-file` and `write`, they move whole blocks
+    with as few read(2)/write(2) calls as possible
+    """
+    return textwrap.dedent("""
+        cell ce_read_fd(int fd, bytes buffer, cell size) {
+          cell total = 0;
+          while (total < size) {
+            ssize_t n = read(fd, buffer + total, size - total);
+            if (n < 0) {
+              if (errno == EINTR) continue;
+              return total ? total : -1;
+            }
+            if (n == 0) break;
+            total += n;
+          }
+          return total;
+        }
+
+        cell ce_read_file(const char* path, bytes buffer, cell size) {
+          int fd = open(path, O_RDONLY);
+          if (fd < 0) return -1;
+          cell total = ce_read_fd(fd, buffer, size);
+          close(fd);
+          return total;
+        }
+
+        cell ce_write_fd(int fd, bytes buffer, cell size) {
+          cell total = 0;
+          // anything that print or putc buffered has to come out first
+          ce_flush();
+          while (total < size) {
+            ssize_t n = write(fd, buffer + total, size - total);
+            if (n < 0) {
+              if (errno == EINTR) continue;
+              return total ? total : -1;
+            }
+            total += n;
+          }
+          return total;
+        }
+    """)
+
+
+def generate_mmap_runtime() -> str:
+    """
+    maps the file from a command line argument to a memory declared with memory-file(-rw)
+    """
+    return textwrap.dedent("""
+        void ce_map_file(int argc, char** argv, int argument, int writable, bytes* memory, cell* length) {
+          if (argument >= argc) {
+            fprintf(stderr, "[ERROR] expected a file path as command line argument %d\\n", argument);
+            exit(1);
+          }
+          int fd = open(argv[argument], writable ? O_RDWR : O_RDONLY);
+          struct stat st;
+          if (fd < 0 || fstat(fd, &st) < 0) {
+            perror(argv[argument]);
+            exit(1);
+          }
+          *length = st.st_size;
+          if (st.st_size > 0) {
+            void* mapped = mmap(
+              NULL, st.st_size, writable ? PROT_READ | PROT_WRITE : PROT_READ,
+              writable ? MAP_SHARED : MAP_PRIVATE, fd, 0
+            );
+            if (mapped == MAP_FAILED) {
+              perror(argv[argument]);
+              exit(1);
+            }
+            *memory = mapped;
+          }
+          close(fd);
+        }
+    """)
 
-    push_mems: list[PushMem] = list(filter(lambda op: isinstance(op, PushMem), ast.body))
 
-    # to be sure that we dont access out of memory accidentally
-    memories = "\n"
+def function_bodies(ast: CEAst.AST) -> list[list[BuildIn]]:
+    """
+    main and the procs, each with the bodies of the parallel-for loops in it added
+    """
+    return [
+        [*body, *(op for loop in CEAst.parallel_loops(body) for op in loop.body)]
+        for body in [ast.body, *(proc.body for proc in ast.procs)]
+    ]
+
+
+def all_parallel_loops(ast: CEAst.AST) -> list[ParallelFor]:
+    return [
+        loop
+        for body in [ast.body, *(proc.body for proc in ast.procs)]
+        for loop in CEAst.parallel_loops(body)
+    ]
+
+
+def assign_memory_ids(ast: CEAst.AST) -> None:
+    ids: dict[str, int] = {}
     for i, mem in enumerate(ast.memories):
-        memories += f"        bytes {memory_prefix}{i}[{mem.size}]; // {mem.name}\n"
         mem.id = i
-        for push_mem in push_mems:
-            if push_mem.name == mem.name:
-                push_mem.id = i
+        ids[mem.name] = i
+    for body in function_bodies(ast):
+        for op in body:
+            if isinstance(op, (PushMem, PushMemLength, ArrayGet, ArraySet)):
+                op.id = ids[op.name]
+
+
+def memory_weights(ast: CEAst.AST) -> dict[str, int]:
+    """
+    an estimate of how often every memory is used: a use counts LOOP_WEIGHT to the
+    power of the number of loops (while and parallel-for) around it
+    """
+    weights: dict[str, int] = {mem.name: 0 for mem in ast.memories}
+
+    def walk(body: list[BuildIn], loops: int) -> None:
+        # the keyword of every block that is open
+        blocks: list[KeyWords] = []
+        for op in body:
+            if isinstance(op, KeyWord) and op.typ in (KeyWords.IF, KeyWords.WHILE):
+                blocks.append(op.typ)
+                loops += op.typ == KeyWords.WHILE
+            elif isinstance(op, KeyWord) and op.typ == KeyWords.END:
+                loops -= blocks.pop() == KeyWords.WHILE
+            elif isinstance(op, ParallelFor):
+                walk(op.body, loops + 1)
+            elif isinstance(op, (PushMem, ArrayGet, ArraySet)):
+                weights[op.name] += LOOP_WEIGHT**loops
+
+    for body in [ast.body, *(proc.body for proc in ast.procs)]:
+        walk(body, 0)
+    return weights
+
+
+@dataclass
+class ArenaSlot:
+    mem: Mem
+    offset: int
+    alignment: int
+
+
+def region_alignment(mem: Mem) -> int:
+    if mem.size >= CACHE_LINE:
+        return CACHE_LINE
+    return mem.element_size or CELL_SIZE
+
+
+def arena_layout(
+    ast: CEAst.AST, initialized: bool = False
+) -> tuple[list[ArenaSlot], int]:
+    """
+    the regions of the arena (of the memories with initial contents with `initialized`)
+    and its size. the hot memories come first, so the small ones that are used together
+    share cache lines, and the ones that are never used are at the end
+    """
+    weights = memory_weights(ast)
+    memories = [
+        mem
+        for mem in ast.memories
+        if not mem.mapped and (mem.initial is not None) == initialized
+    ]
+    memories.sort(key=lambda mem: -weights[mem.name])
+    slots: list[ArenaSlot] = []
+    offset = 0
+    for mem in memories:
+        alignment = region_alignment(mem)
+        offset += -offset % alignment
+        slots.append(ArenaSlot(mem, offset, alignment))
+        offset += mem.size
+    return slots, offset + -offset % CACHE_LINE
+
+
+def memory_reference(mem: Mem) -> str:
+    """
+    the C expression of a memory, the pointer for the mapped ones and the array
+    for the rest
+    """
+    if mem.mapped:
+        return f"{memory_prefix}{mem.id}"
+    arena = arena_name if mem.initial is None else data_arena_name
+    return f"{arena}.{memory_prefix}{mem.id}"
+
+
+def proc_calls(ast: CEAst.AST) -> list[list[int]]:
+    """
+    the ids of the procs that are called at every call site, the first list is main
+    and the rest are the procs in order
+    """
+    return [
+        [op.id for op in body if isinstance(op, Call)] for body in function_bodies(ast)
+    ]
+
+
+def inlined_procs(ast: CEAst.AST) -> set[int]:
+    """
+    the ids of the procs that are inlined instead of being compiled to a function:
+    procs that are small or called at most once, as long as they can not call themselves
+    """
+    calls = proc_calls(ast)
+    call_count = [0] * len(ast.procs)
+    for callees in calls:
+        for callee in callees:
+            call_count[callee] += 1
+
+    def reaches(start: int, target: int) -> bool:
+        seen: set[int] = set()
+        todo = list(calls[start + 1])
+        while todo:
+            proc_id = todo.pop()
+            if proc_id == target:
+                return True
+            if proc_id not in seen:
+                seen.add(proc_id)
+                todo.extend(calls[proc_id + 1])
+        return False
+
+    return {
+        proc.id
+        for proc in ast.procs
+        if not reaches(proc.id, proc.id)
+        and (len(proc.body) <= PROC_INLINE_OPS or call_count[proc.id] <= 1)
+    }
+
 
-    string = textwrap.dedent(
-        f"""
+def proc_prototypes(ast: CEAst.AST, inlined: set[int]) -> str:
+    return "".join(
+        f"void {proc_prefix}{proc.id}(); // {proc.name}\n"
+        for proc in ast.procs
+        if proc.id not in inlined
+    )
+
+
+def parallel_prototypes(ast: CEAst.AST, inlined: set[int]) -> str:
+    return "".join(
+        f"void {parallel_prefix}{loop.id}({parallel_parameters(ast, loop, inlined)});\n"
+        for loop in all_parallel_loops(ast)
+    )
+
+
+def parallel_parameters(ast: CEAst.AST, loop: ParallelFor, inlined: set[int]) -> str:
+    """
+    an iteration gets its index and a copy of every variable that its body uses
+    """
+    return ", ".join(
+        ["cell ce_index"]
+        + [
+            f"cell {variable_prefix}{i}"
+            for i in function_variables(ast, loop.body, inlined)
+        ]
+    )
+
+
+def generate_prelude() -> str:
+    return textwrap.dedent("""
         #include <stdio.h>
         #include <stdlib.h>
+        #include <string.h>
+        #include <errno.h>
+        #include <unistd.h>
+        #include <fcntl.h>
+        #include <sys/mman.h>
+        #include <sys/stat.h>
         #include <math.h>
-        
+
         typedef unsigned char byte;
         typedef unsigned char* bytes;
-        
-        int stack[{stack_size}];
-        int stack_ptr = 0;
-        {memories}
-        void push(int value) {{
+        // a stack cell has to be able to hold a pointer
+        typedef long cell;
+    """)
+
+
+def generate_globals(ast: CEAst.AST, stack_size: int, extern: bool = False) -> str:
+    """
+    the data stack and the memories, with `extern` it only declares them (for the shared header)
+    """
+    storage = "extern " if extern else ""
+    # every thread of a parallel-for works on a stack of its own
+    stack_storage = storage + ("_Thread_local " if all_parallel_loops(ast) else "")
+    string = "\n"
+    string += f"{stack_storage}cell stack[{stack_size}];\n"
+    string += f"{stack_storage}int stack_ptr{'' if extern else ' = 0'};\n"
+    for mem in ast.memories:
+        if mem.mapped:
+            # the file is mapped at the start of main
+            string += f"{storage}bytes {memory_prefix}{mem.id}{'' if extern else ' = NULL'}; // {mem.name}\n"
+            string += f"{storage}cell {memory_length_prefix}{mem.id}{'' if extern else ' = 0'};\n"
+    if arena_layout(ast)[0]:
+        string += f"{storage}struct {arena_name} {arena_name};\n"
+    slots, _ = arena_layout(ast, initialized=True)
+    if slots:
+        string += f"{storage}struct {data_arena_name} {data_arena_name}"
+        if extern:
+            string += ";\n"
+        else:
+            string += " = {\n"
+            for slot in slots:
+                string += f"  .{memory_prefix}{slot.mem.id} = {{\n{memory_initializer(slot.mem)}  }},\n"
+            string += "};\n"
+    for i, text in enumerate(ast.strings):
+        string += f"{storage}const char {string_prefix}{i}[{len(text) + 1}]"
+        string += ";\n" if extern else f" = {c_string(text)};\n"
+    return string
+
+
+def generate_arena_types(ast: CEAst.AST) -> str:
+    """
+    the structs of the arenas, a member for every memory at the offset of
+    arena_layout (the aligned attributes make the C compiler put it there)
+    """
+    string = ""
+    for name, initialized in ((arena_name, False), (data_arena_name, True)):
+        slots, size = arena_layout(ast, initialized)
+        if not slots:
+            continue
+        string += f"\nstruct {name} {{ // {size} bytes\n"
+        for slot in slots:
+            mem = slot.mem
+            if mem.element_size is None:
+                typ, count = "byte", mem.size
+            else:
+                typ, count = ELEMENT_C_TYPES[mem.element_size], mem.count
+            string += (
+                f"  {typ} {memory_prefix}{mem.id}[{count}] "
+                f"__attribute__((aligned({slot.alignment}))); // {mem.name} at {slot.offset}\n"
+            )
+        string += f"}} __attribute__((aligned({CACHE_LINE})));\n"
+    return string
+
+
+def c_string(text: bytes) -> str:
+    """
+    the C literal of the bytes, everything that is not printable ascii is an octal
+    escape (three digits, so a digit after it is not part of it) and `?` is escaped
+    so it never makes a trigraph
+    """
+    return (
+        '"'
+        + "".join(
+            (
+                "\\" + chr(byte)
+                if chr(byte) in '"\\?'
+                else chr(byte) if 32 <= byte < 127 else f"\\{byte:03o}"
+            )
+            for byte in text
+        )
+        + '"'
+    )
+
+
+def memory_initializer(mem: Mem, per_line: int = 16) -> str:
+    """
+    the elements of the initial contents of a memory, the zeroes at the end are left out
+    """
+    assert mem.initial is not None
+    size = mem.element_size or 1
+    values = [
+        int.from_bytes(
+            mem.initial[i : i + size], "little", signed=mem.element_size is not None
+        )
+        for i in range(0, len(mem.initial), size)
+    ]
+    while values and values[-1] == 0:
+        values.pop()
+    return "".join(
+        " " * 2 * INDENTATION + ", ".join(map(str, values[i : i + per_line])) + ",\n"
+        for i in range(0, len(values), per_line)
+    )
+
+
+def generate_stack_helpers(qualifier: str = "") -> str:
+    """
+    the functions that work on the data stack, `qualifier` is put before every one of them
+    (the shared header makes them `static inline` so every translation unit can inline them)
+    """
+    return textwrap.dedent(f"""
+        {qualifier}void push(cell value) {{
           stack[++stack_ptr] = value;
         }}
-        
-        int pop() {{
+
+        {qualifier}cell pop() {{
           return stack[stack_ptr--];
         }}
-        
-        void drop() {{
+
+        {qualifier}void drop() {{
           stack_ptr -= 1;
         }}
-        
-        void drop2() {{
+
+        {qualifier}void drop2() {{
           stack_ptr -= 2;
         }}
-        
-        void dup() {{
-          stack[++stack_ptr] = stack[stack_ptr - 1];
+
+        // dup and dup2 are taken by unistd.h
+        {qualifier}void ce_dup() {{
+          cell value = stack[stack_ptr];
+          stack[++stack_ptr] = value;
         }}
-        
-        void dup2() {{
-          stack[++stack_ptr] = stack[stack_ptr - 1];
-          stack[++stack_ptr] = stack[stack_ptr - 1];
+
+        {qualifier}void ce_dup2() {{
+          cell value = stack[stack_ptr];
+          stack[++stack_ptr] = value;
+          stack[++stack_ptr] = value;
         }}
-        
-        void swap() {{
-          int temp = stack[stack_ptr];
+
+        {qualifier}void swap() {{
+          cell temp = stack[stack_ptr];
           stack[stack_ptr] = stack[stack_ptr - 1];
           stack[stack_ptr - 1] = temp;
         }}
-        
-        void clear() {{
+
+        {qualifier}void clear() {{
           stack_ptr = 0;
         }}
-    """[1:]
+    """)
+
+
+def generate_bounds_runtime() -> str:
+    """
+    called by `<array>.get` and `<array>.set` when bounds checks are on and the index is out of bounds
+    """
+    return textwrap.dedent("""
+        void ce_bounds_error(const char* name, cell index, cell count) {
+          fprintf(stderr, "[ERROR] index %ld is out of the bounds of %s (%ld elements)\\n", index, name, count);
+          exit(1);
+        }
+    """)
+
+
+def generate_pow_runtime() -> str:
+    """
+    `**` on cells, it wraps like the other operators instead of going through
+    double, so it gives the same results as ce_pow of the x86-64 backend and
+    c_pow of comptime. negative exponents give 0
+    """
+    return textwrap.dedent("""
+        cell ce_pow(cell base, cell exponent) {
+          if (exponent < 0) return 0;
+          unsigned long result = 1;
+          unsigned long square = base;
+          while (exponent) {
+            if (exponent & 1) result *= square;
+            square *= square;
+            exponent >>= 1;
+          }
+          return result;
+        }
+    """)
+
+
+def generate_runtime(buffered_output: bool = True) -> str:
+    return (
+        generate_output_runtime(buffered_output)
+        + generate_io_runtime()
+        + generate_mmap_runtime()
+        + generate_bounds_runtime()
+        + generate_pow_runtime()
+    )
+
+
+def c_prototypes(source: str) -> str:
+    """
+    the prototypes of the (non static) functions that are defined in `source`,
+    it only understands the way the runtime above is written: the signature and
+    the opening brace on one line at the start of the line
+    """
+    prototypes = ""
+    for line in source.splitlines():
+        if (
+            line.endswith(") {")
+            and line[:1].isalpha()
+            and not line.startswith("static")
+        ):
+            prototypes += line[: -len(" {")] + ";\n"
+    return prototypes
+
+
+def generate_standard_code(
+    out: TextIO,
+    ast: CEAst.AST,
+    stack_size: int = 30000,
+    buffered_output: bool = True,
+) -> None:
+    bake(ast)
+    assign_memory_ids(ast)
+
+    string = (
+        generate_prelude()[1:]
+        + generate_arena_types(ast)
+        + generate_globals(ast, stack_size)
+        + generate_stack_helpers()
+        + generate_runtime(buffered_output)
+        + proc_prototypes(ast, inlined_procs(ast))
+        + parallel_prototypes(ast, inlined_procs(ast))
     )
-    out.extend(line + "\n" for line in string.splitlines())
-
-
-def generate_c_code_from_AST(ast: CEAst.AST, stack_size: int = 30000) -> str:
-    generated_c: list[str] = []
-    generated_functions_c: list[str] = []
-    generated_standard_c: list[str] = []
-
-    indentation_level: int = 0
-    indentation_levels: list[int] = []
-
-    while_loops: list[int] = []
-    while_loop_count: int = -1
-
-    def write(s: str, end: str = "\n") -> None:
-        if while_loops:
-            if s != "":
-                generated_functions_c.append(f"{' ' * indentation_level}{s}{end}")
-        elif s != "":
-            generated_c.append(f"{' ' * indentation_level}{s}{end}")
-
-    generate_standard_code(generated_standard_c, ast, stack_size)
-
-    write("int main(int argc, char** argv) {")
-    indentation_level += INDENTATION
-    write("int a;")
-    write("int b;")
-
-    for op in ast.body:
-        if op == Intrinsic:
-            if op.typ == Intrinsics.ADD:
-                write("// add")
-                write("a = pop();")
-                write("b = pop();")
-                write("push(b + a);")
-            elif op.typ == Intrinsics.SUB:
-                write("// sub")
-                write("a = pop();")
-                write("b = pop();")
-                write("push(b - a);")
-            elif op.typ == Intrinsics.DIV:
-                write("// div")
-                write("a = pop();")
-                write("b = pop();")
-                write("push(b / a);")
-            elif op.typ == Intrinsics.MOD:
-                write("// mod")
-                write("a = pop();")
-                write("b = pop();")
-                write("push(b % a);")
-            elif op.typ == Intrinsics.MUL:
-                write("// mul")
-                write("a = pop();")
-                write("b = pop();")
-                write("push(b * a);")
-            elif op.typ == Intrinsics.POW:
-                write("// pow")
-                write("a = pop();")
-                write("b = pop();")
-                write("push(pow(b, a));")
-            elif op.typ == Intrinsics.BIN_AND:
-                write("// bin and")
-                write("a = pop();")
-                write("b = pop();")
-                write("push(b & a);")
-            elif op.typ == Intrinsics.BIN_OR:
-                write("// bin or")
-                write("a = pop();")
-                write("b = pop();")
-                write("push(b | a);")
-            elif op.typ == Intrinsics.BIN_INV:
-                write("// bin inc")
-                write("a = pop();")
-                write("push(~a);")
-            elif op.typ == Intrinsics.BIN_XOR:
-                write("// bin xor")
-                write("a = pop();")
-                write("b = pop();")
-                write("push(b ^ a);")
-            elif op.typ == Intrinsics.RSHIFT:
-                write("// bin right shift")
-                write("a = pop();")
-                write("b = pop();")
-                write("push(b >> a);")
-            elif op.typ == Intrinsics.LSHIFT:
-                write("// bin left shift")
-                write("a = pop();")
-                write("b = pop();")
-                write("push(b << a);")
-            elif op.typ == Intrinsics.PRINT:
-                write("// print")
-                write('printf("%d\\n", pop());')
-            elif op.typ == Intrinsics.PUTC:
-                write("// putc")
-                write("fputc((char) pop(), stdout);")
-            elif op.typ == Intrinsics.LT:
-                write("// less than")
-                write("a = pop();")
-                write("b = pop();")
-                write("push(b < a);")
-            elif op.typ == Intrinsics.LE:
-                write("// less than or equal")
-                write("a = pop();")
-                write("b = pop();")
-                write("push(b <= a);")
-            elif op.typ == Intrinsics.EQ:
-                write("// equal")
-                write("a = pop();")
-                write("b = pop();")
-                write("push(b == a);")
-            elif op.typ == Intrinsics.NE:
-                write("// not equal")
-                write("a = pop();")
-                write("b = pop();")
-                write("push(b != a);")
-            elif op.typ == Intrinsics.GE:
-                write("// greater than")
-                write("a = pop();")
-                write("b = pop();")
-                write("push(b > a);")
-            elif op.typ == Intrinsics.GT:
-                write("// greater than or equal")
-                write("a = pop();")
-                write("b = pop();")
-                write("push(b >= a);")
-            elif op.typ == Intrinsics.DROP:
-                write("// drop")
-                write("drop();")
-            elif op.typ == Intrinsics.DROP2:
-                write("// 2drop")
-                write("drop2();")
-            elif op.typ == Intrinsics.DUP:
-                write("// dup")
-                write("dup();")
-            elif op.typ == Intrinsics.DUP2:
-                write("// 2dup")
-                write("dup2();")
-            elif op.typ == Intrinsics.SWAP:
-                write("// swap")
-                write("swap();")
-            elif op.typ == Intrinsics.CLEAR:
-                write("// clear stack")
-                write("clear();")
-            elif op.typ == Intrinsics.DBG_PRINT_STACK:
-                write("for (int jj = 0; jj < stack_ptr; jj ++) {")
-                write('  printf("%d:%d\\n", jj, stack[jj]);')
-                write("}")
-            elif op.typ == Intrinsics.CAST_PTR:  # ignore
-                pass
-            elif op.typ == Intrinsics.CAST_INT:  # ignore
-                pass
-            elif op.typ == Intrinsics.STORE8:
-                write(f"((bytes) pop())[0] = (char) pop();")
-            elif op.typ == Intrinsics.LOAD8:
-                write(f"push((char) ((bytes) pop())[0]);")
-            elif op.typ == Intrinsics.STORE16:
-                write(f"((bytes) pop())[0] = (short) pop();")
-            elif op.typ == Intrinsics.LOAD16:
-                write(f"push((short) ((bytes) pop())[0]);")
-            elif op.typ == Intrinsics.STORE32:
-                write(f"((bytes) pop())[0] = (int) pop();")
-            elif op.typ == Intrinsics.LOAD32:
-                write(f"push((int) ((bytes) pop())[0]);")
-            elif op.typ == Intrinsics.STORE64:
-                write(f"((bytes) pop())[0] = (long) pop();")
-            elif op.typ == Intrinsics.LOAD64:
-                write(f"push((long) ((bytes) pop())[0]);")
+    out.write("".join(line + "\n" for line in string.splitlines()))
+
+
+def binary_op_template(comment: str, operator: str) -> tuple[str, ...]:
+    return (f"// {comment}", "a = pop();", "b = pop();", f"push(b {operator} a);")
+
+
+def store_template(width: int, c_type: str) -> tuple[str, ...]:
+    return (
+        f"// store {width}",
+        "a = pop();",
+        "b = pop();",
+        f"*({c_type}*) a = ({c_type}) b;",
+    )
+
+
+def load_template(width: int, c_type: str) -> tuple[str, ...]:
+    return (f"// load {width}", "a = pop();", f"push(*({c_type}*) a);")
+
+
+def bounds_check(mem: Mem) -> str:
+    return (
+        f"if ((unsigned long) a >= {mem.count}) "
+        f'ce_bounds_error("{mem.name}", a, {mem.count});'
+    )
+
+
+def array_get_template(mem: Mem, bounds_checks: bool) -> tuple[str, ...]:
+    return (
+        f"// {mem.name}{ARRAY_GET_SUFFIX}",
+        "a = pop();",
+        *([bounds_check(mem)] if bounds_checks else []),
+        f"push({memory_reference(mem)}[a]);",
+    )
+
+
+def array_set_template(mem: Mem, bounds_checks: bool) -> tuple[str, ...]:
+    assert mem.element_size is not None
+    return (
+        f"// {mem.name}{ARRAY_SET_SUFFIX}",
+        "a = pop();",
+        "b = pop();",
+        *([bounds_check(mem)] if bounds_checks else []),
+        f"{memory_reference(mem)}[a] = ({ELEMENT_C_TYPES[mem.element_size]}) b;",
+    )
+
+
+# the C code of every intrinsic, one string per line.
+# the operands are popped into the a, b and c locals that main and every while
+# condition function declare
+INTRINSIC_TEMPLATES: dict[Intrinsics, tuple[str, ...]] = {
+    Intrinsics.ADD: binary_op_template("add", "+"),
+    Intrinsics.SUB: binary_op_template("sub", "-"),
+    Intrinsics.DIV: binary_op_template("div", "/"),
+    Intrinsics.MOD: binary_op_template("mod", "%"),
+    Intrinsics.MUL: binary_op_template("mul", "*"),
+    Intrinsics.POW: ("// pow", "a = pop();", "b = pop();", "push(ce_pow(b, a));"),
+    Intrinsics.BIN_AND: binary_op_template("bin and", "&"),
+    Intrinsics.BIN_OR: binary_op_template("bin or", "|"),
+    Intrinsics.BIN_INV: ("// bin inv", "a = pop();", "push(~a);"),
+    Intrinsics.BIN_XOR: binary_op_template("bin xor", "^"),
+    Intrinsics.RSHIFT: binary_op_template("bin right shift", ">>"),
+    Intrinsics.LSHIFT: binary_op_template("bin left shift", "<<"),
+    Intrinsics.PRINT: ("// print", "ce_print_int(pop());"),
+    Intrinsics.PUTC: ("// putc", "ce_putc((char) pop());"),
+    Intrinsics.PUTS: ("// puts", "a = pop();", "b = pop();", "ce_puts((bytes) b, a);"),
+    Intrinsics.LT: binary_op_template("less than", "<"),
+    Intrinsics.LE: binary_op_template("less than or equal", "<="),
+    Intrinsics.EQ: binary_op_template("equal", "=="),
+    Intrinsics.NE: binary_op_template("not equal", "!="),
+    Intrinsics.GE: binary_op_template("greater than or equal", ">="),
+    Intrinsics.GT: binary_op_template("greater than", ">"),
+    Intrinsics.DROP: ("// drop", "drop();"),
+    Intrinsics.DROP2: ("// 2drop", "drop2();"),
+    Intrinsics.DUP: ("// dup", "ce_dup();"),
+    Intrinsics.DUP2: ("// 2dup", "ce_dup2();"),
+    Intrinsics.SWAP: ("// swap", "swap();"),
+    Intrinsics.CLEAR: ("// clear stack", "clear();"),
+    Intrinsics.DBG_PRINT_STACK: (
+        "ce_flush();",
+        "for (int jj = 0; jj < stack_ptr; jj ++) {",
+        '  printf("%d:%ld\\n", jj, stack[jj]);',
+        "}",
+        "fflush(stdout);",
+    ),
+    # the casts only exist for the type checker
+    Intrinsics.CAST_INT: (),
+    Intrinsics.CAST_PTR: (),
+    Intrinsics.STORE8: store_template(8, "char"),
+    Intrinsics.LOAD8: load_template(8, "char"),
+    Intrinsics.STORE16: store_template(16, "short"),
+    Intrinsics.LOAD16: load_template(16, "short"),
+    Intrinsics.STORE32: store_template(32, "int"),
+    Intrinsics.LOAD32: load_template(32, "int"),
+    Intrinsics.STORE64: store_template(64, "long"),
+    Intrinsics.LOAD64: load_template(64, "long"),
+    Intrinsics.READ: (
+        "// read",
+        "a = pop();",
+        "b = pop();",
+        "push(ce_read_fd(STDIN_FILENO, (bytes) b, a));",
+    ),
+    Intrinsics.READ_FILE: (
+        "// read-file",
+        "c = pop();",
+        "a = pop();",
+        "b = pop();",
+        "push(ce_read_file((const char*) c, (bytes) b, a));",
+    ),
+    Intrinsics.WRITE: (
+        "// write",
+        "a = pop();",
+        "b = pop();",
+        "push(ce_write_fd(STDOUT_FILENO, (bytes) b, a));",
+    ),
+    Intrinsics.FILL: (
+        "// fill",
+        "a = pop();",
+        "b = pop();",
+        "c = pop();",
+        "memset((bytes) c, (int) a, b);",
+    ),
+    # the regions of copy can overlap, memmove is as fast as memcpy when they do not
+    Intrinsics.COPY: (
+        "// copy",
+        "a = pop();",
+        "b = pop();",
+        "c = pop();",
+        "memmove((bytes) b, (bytes) c, a);",
+    ),
+    Intrinsics.COMPARE: (
+        "// compare",
+        "a = pop();",
+        "b = pop();",
+        "c = pop();",
+        "a = memcmp((bytes) c, (bytes) b, a);",
+        "push((a > 0) - (a < 0));",
+    ),
+}
+
+
+def run_checks() -> None:
+    """
+    every intrinsic needs a template, this is a development time check (see tests.py -checks)
+    """
+    err: bool = False
+    for intrinsic in Intrinsics:
+        if intrinsic not in INTRINSIC_TEMPLATES:
+            print(f"{intrinsic} does not have a C template", file=sys.stderr)
+            err = True
+
+    if err:
+        sys.exit(1)
+
+
+def write_main_prologue(emitter: Emitter, ast: CEAst.AST) -> None:
+    emitter.write("int main(int argc, char** argv) {")
+    emitter.indent()
+    emitter.write("atexit(ce_flush);")
+    for mem in ast.memories:
+        if mem.mapped:
+            emitter.write(
+                f"ce_map_file(argc, argv, {mem.argument}, {int(mem.writable)}, "
+                f"&{memory_prefix}{mem.id}, &{memory_length_prefix}{mem.id});"
+            )
+
+
+class Emitter:
+    """
+    writes the generated C as it is generated, nothing is kept in memory apart
+    from the rendered templates.
+    a template is joined into one indented string the first time it is used at an
+    indentation level, after that emitting it is a dict lookup and one write
+    """
+
+    def __init__(self, out: TextIO, bounds_checks: bool = False) -> None:
+        self.out = out
+        self.indentation_level: int = 0
+        self.rendered: dict[tuple[object, int], str] = {}
+        # check the index of every `<array>.get` and `<array>.set`
+        self.bounds_checks = bounds_checks
+
+    def write(self, s: str) -> None:
+        self.out.write(f"{' ' * self.indentation_level}{s}\n")
+
+    def emit(self, key: object, template: tuple[str, ...]) -> None:
+        rendered = self.rendered.get((key, self.indentation_level))
+        if rendered is None:
+            indentation = " " * self.indentation_level
+            rendered = "".join(f"{indentation}{line}\n" for line in template)
+            self.rendered[(key, self.indentation_level)] = rendered
+        self.out.write(rendered)
+
+    def indent(self) -> None:
+        self.indentation_level += INDENTATION
+
+    def dedent(self) -> None:
+        self.indentation_level -= INDENTATION
+
+    def begin(self, ast: CEAst.AST, variables: list[int]) -> None:
+        write_main_prologue(self, ast)
+        self.write("cell a, b, c;")
+        write_variables(self, ast, variables)
+
+    def end(self) -> None:
+        self.dedent()
+        self.write("}")
+
+    def split_point(self, ops_since_split: int) -> bool:
+        """
+        called between top level operations of main, returns True if the code after
+        this point goes to a new function
+        """
+        return False
+
+
+class SplitEmitter(Emitter):
+    """
+    splits main into chunk functions, each chunk goes to its own translation unit
+    in `directory`. main itself is written to main.c by `finish` once the number
+    of chunks is known.
+    the variables of main can not be locals of the chunks, they are globals in runtime.c
+    """
+
+    def __init__(
+        self, directory: Path, header: str, chunk_ops: int, bounds_checks: bool = False
+    ) -> None:
+        self.directory = directory
+        self.header = header
+        self.chunk_ops = chunk_ops
+        self.units: list[Path] = []
+        super().__init__(io.StringIO(), bounds_checks)
+
+    def open_chunk(self) -> None:
+        path = self.directory / f"chunk_{len(self.units)}.c"
+        self.units.append(path)
+        self.out = open(path, "w")
+        self.out.write(f'#include "{self.header}"\n\n')
+        self.indentation_level = 0
+        self.write(f"void _CeMainChunk{len(self.units) - 1}() {{")
+        self.indent()
+        self.write("cell a, b, c;")
+
+    def close_chunk(self) -> None:
+        super().end()
+        self.out.close()
+
+    def begin(self, ast: CEAst.AST, variables: list[int]) -> None:
+        self.open_chunk()
+
+    def end(self) -> None:
+        self.close_chunk()
+
+    def split_point(self, ops_since_split: int) -> bool:
+        if ops_since_split < self.chunk_ops:
+            return False
+        self.close_chunk()
+        self.open_chunk()
+        return True
+
+    def finish(self, ast: CEAst.AST) -> Path:
+        path = self.directory / "main.c"
+        with open(path, "w") as self.out:
+            self.out.write(f'#include "{self.header}"\n\n')
+            self.indentation_level = 0
+            for i in range(len(self.units)):
+                self.write(f"void _CeMainChunk{i}();")
+            write_main_prologue(self, ast)
+            for i in range(len(self.units)):
+                self.write(f"_CeMainChunk{i}();")
+            self.write("return 0;")
+            super().end()
+        self.units.append(path)
+        return path
+
+
+def function_variables(
+    ast: CEAst.AST, body: list[BuildIn], inlined: set[int]
+) -> list[int]:
+    """
+    the ids of the variables that a C function uses, the variables of the procs that
+    are inlined into it are its locals too
+    """
+    ids: dict[int, None] = {}
+    bodies = [body]
+    while bodies:
+        for op in bodies.pop():
+            if isinstance(op, PushVar) or isinstance(op, SetVar):
+                ids[op.id] = None
+            elif isinstance(op, Call) and op.id in inlined:
+                bodies.append(ast.procs[op.id].body)
+            elif isinstance(op, ParallelFor):
+                bodies.append(op.body)
+    return list(ids)
+
+
+def proc_variables(ast: CEAst.AST, proc: Proc) -> list[int]:
+    """
+    the ids of the variables of the proc itself, without the ones of the procs that it
+    calls. an inlined call sets them to 0 like a call of the C function does, so
+    inlining does not change what the program does
+    """
+    return function_variables(ast, proc.body, set())
+
+
+def variable_declarations(
+    ast: CEAst.AST, variables: list[int], storage: str = ""
+) -> str:
+    return "".join(
+        f"{storage}cell {variable_prefix}{i}{'' if storage else ' = 0'}; // {ast.variables[i].name}\n"
+        for i in variables
+    )
+
+
+def write_variables(emitter: Emitter, ast: CEAst.AST, variables: list[int]) -> None:
+    for line in variable_declarations(ast, variables).splitlines():
+        emitter.write(line)
+
+
+def write_c_code_from_AST(
+    ast: CEAst.AST,
+    out: TextIO,
+    stack_size: int = 30000,
+    buffered_output: bool = True,
+    bounds_checks: bool = False,
+) -> None:
+    """
+    streams the C code of the program to `out` while walking the AST,
+    main and then the procs are written straight to `out`, so memory use
+    does not grow with the size of the program
+    """
+    generate_standard_code(out, ast, stack_size, buffered_output)
+
+    emitter = Emitter(out, bounds_checks)
+    walk_AST(ast, emitter)
+    walk_procs(ast, emitter)
+
+
+def generate_c_code_from_AST(
+    ast: CEAst.AST,
+    stack_size: int = 30000,
+    buffered_output: bool = True,
+    bounds_checks: bool = False,
+) -> str:
+    out = io.StringIO()
+    write_c_code_from_AST(ast, out, stack_size, buffered_output, bounds_checks)
+    return out.getvalue()
+
+
+def write_translation_units(
+    ast: CEAst.AST,
+    directory: Path,
+    stack_size: int = 30000,
+    buffered_output: bool = True,
+    chunk_ops: int = MAIN_CHUNK_OPS,
+    bounds_checks: bool = False,
+) -> list[Path]:
+    """
+    writes the program as several translation units that can be compiled in parallel:
+        program.h: the types, the stack, the memories and the variables of main (extern)
+            and the stack helpers (static inline so every unit can inline them)
+        runtime.c: the definitions of the stack, the memories, the variables of main
+            and the runtime functions
+        chunk_<n>.c: a part of main
+        procs.c: the procs that are not inlined and the bodies of the parallel-for loops
+        main.c: main, it calls the chunks in order
+    returns the paths of the .c files
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    bake(ast)
+    assign_memory_ids(ast)
+    inlined = inlined_procs(ast)
+    main_variables = function_variables(ast, ast.body, inlined)
+
+    runtime = generate_runtime(buffered_output)
+    header = "program.h"
+    with open(directory / header, "w") as out:
+        out.write("#pragma once\n")
+        out.write(generate_prelude())
+        out.write(generate_arena_types(ast))
+        out.write(generate_globals(ast, stack_size, extern=True))
+        out.write(variable_declarations(ast, main_variables, "extern "))
+        out.write(generate_stack_helpers("static inline "))
+        out.write("\n")
+        out.write(c_prototypes(runtime))
+        out.write(proc_prototypes(ast, inlined))
+        out.write(parallel_prototypes(ast, inlined))
+
+    runtime_path = directory / "runtime.c"
+    with open(runtime_path, "w") as out:
+        out.write(f'#include "{header}"\n')
+        out.write(generate_globals(ast, stack_size))
+        out.write(variable_declarations(ast, main_variables))
+        out.write(runtime)
+
+    emitter = SplitEmitter(directory, header, chunk_ops, bounds_checks)
+    walk_AST(ast, emitter)
+    emitter.finish(ast)
+
+    procs_path = directory / "procs.c"
+    with open(procs_path, "w") as out:
+        out.write(f'#include "{header}"\n\n')
+        walk_procs(ast, Emitter(out, bounds_checks))
+    return [runtime_path, *emitter.units, procs_path]
+
+
+@dataclass
+class CountedLoop:
+    """
+    `while dup <limit> <compare> do <body> <step> <+|-> end` where the body never touches
+    the counter below it other than copying it with dup or 2dup. the counter is kept in
+    a C local instead of on the stack and the copies push that local
+    """
+
+    limit: str
+    compare: str
+    step: str
+    # the body is operations[body_start:body_end] of the body the loop is in
+    body_start: int
+    body_end: int
+    # the index of the end of the loop
+    end: int
+    # the dup and 2dup operations of the body that copy the counter
+    counter_copies: set[int]
+
+
+def limit_expression(op: BuildIn) -> Optional[str]:
+    """
+    the C expression of a loop limit, it is evaluated on every iteration like the
+    condition of the while loop it replaces
+    """
+    if isinstance(op, Push) and op.typ == Types.INT:
+        return str(op.value)
+    if isinstance(op, PushVar):
+        return f"{variable_prefix}{op.id}"
+    if isinstance(op, PushMemLength):
+        return f"{memory_length_prefix}{op.id}"
+    return None
+
+
+def matching_end(body: list[BuildIn], start: int) -> Optional[int]:
+    """
+    the index of the end that closes the block opened at body[start]
+    """
+    depth = 0
+    for i in range(start, len(body)):
+        op = body[i]
+        if isinstance(op, KeyWord) and op.typ in (KeyWords.IF, KeyWords.WHILE):
+            depth += 1
+        elif isinstance(op, KeyWord) and op.typ == KeyWords.END:
+            depth -= 1
+            if depth == 0:
+                return i
+    return None
+
+
+def match_counted_loop(
+    ast: CEAst.AST, body: list[BuildIn], start: int
+) -> Optional[CountedLoop]:
+    """
+    matches a counted loop at the while at body[start], None if it is not one
+    """
+    header = body[start + 1 : start + 5]
+    end = matching_end(body, start)
+    if (
+        end is None
+        or end - 2 < start + 5
+        or not (isinstance(header[0], Intrinsic) and header[0].typ == Intrinsics.DUP)
+        or not (
+            isinstance(header[2], Intrinsic) and header[2].typ in COUNTED_LOOP_COMPARES
+        )
+        or not (isinstance(header[3], KeyWord) and header[3].typ == KeyWords.DO)
+    ):
+        return None
+    limit = limit_expression(header[1])
+    step = body[end - 2 : end]
+    if (
+        limit is None
+        or not (isinstance(step[0], Push) and step[0].typ == Types.INT)
+        or not (isinstance(step[1], Intrinsic) and step[1].typ in COUNTED_LOOP_STEPS)
+    ):
+        return None
+
+    # the depth of the stack from the counter up, the body starts and ends at 1
+    depth = 1
+    # the depths at the start of the open blocks
+    blocks: list[int] = []
+    counter_copies: set[int] = set()
+    for i in range(start + 5, end - 2):
+        op = body[i]
+        # the number of elements the operation takes and leaves
+        ins, outs = 0, 0
+        if isinstance(op, KeyWord):
+            if op.typ == KeyWords.IF:
+                ins = 1
+            elif op.typ == KeyWords.DO:
+                ins = 1
+            elif op.typ == KeyWords.END:
+                depth = blocks.pop()
+                continue
+        elif isinstance(op, Intrinsic):
+            if op.typ in (Intrinsics.CLEAR, Intrinsics.DBG_PRINT_STACK):
+                return None
+            if op.typ in (Intrinsics.DUP, Intrinsics.DUP2) and depth == 1:
+                counter_copies.add(i)
             else:
-                raise NotImplementedError(op)
-        elif op == Push:
+                ins = len(SIGNATURES[op.typ].ins)
+            outs = len(SIGNATURES[op.typ].outs) - (i in counter_copies)
+        elif (
+            isinstance(op, Push)
+            or isinstance(op, PushMem)
+            or isinstance(op, PushMemLength)
+            or isinstance(op, PushVar)
+        ):
+            outs = 1
+        elif isinstance(op, PushStr):
+            outs = 2
+        elif isinstance(op, SetVar):
+            ins = 1
+        elif isinstance(op, ArrayGet):
+            ins, outs = 1, 1
+        elif isinstance(op, ArraySet) or isinstance(op, ParallelFor):
+            ins = 2
+        elif isinstance(op, Call):
+            ins, outs = len(ast.procs[op.id].ins), len(ast.procs[op.id].outs)
+        else:
+            return None
+        if depth - ins < 1:
+            # it would take the counter
+            return None
+        depth += outs - ins
+        if isinstance(op, KeyWord) and op.typ in (KeyWords.IF, KeyWords.WHILE):
+            blocks.append(depth)
+
+    return CountedLoop(
+        limit,
+        COUNTED_LOOP_COMPARES[header[2].typ],
+        f"{COUNTED_LOOP_STEPS[step[1].typ]} {step[0].value}",
+        start + 5,
+        end - 2,
+        end,
+        counter_copies,
+    )
+
+
+def walk_AST(ast: CEAst.AST, emitter: Emitter) -> None:
+    inlined = inlined_procs(ast)
+    emitter.begin(ast, function_variables(ast, ast.body, inlined))
+    walk_body(ast, ast.body, emitter, inlined, splittable=True)
+    emitter.end()
+
+
+def walk_procs(ast: CEAst.AST, emitter: Emitter) -> None:
+    """
+    writes every proc that is not inlined and the body of every parallel-for as a
+    function, after main was written
+    """
+    inlined = inlined_procs(ast)
+    for proc in ast.procs:
+        if proc.id in inlined:
+            continue
+        emitter.write(f"void {proc_prefix}{proc.id}() {{ // {proc.name}")
+        emitter.indent()
+        emitter.write("cell a, b, c;")
+        write_variables(emitter, ast, function_variables(ast, proc.body, inlined))
+        walk_body(ast, proc.body, emitter, inlined)
+        emitter.end()
+    for loop in all_parallel_loops(ast):
+        emitter.write(
+            f"void {parallel_prefix}{loop.id}({parallel_parameters(ast, loop, inlined)}) {{"
+            f" // parallel-for at {loop.format_location()}"
+        )
+        emitter.indent()
+        emitter.write("cell a, b, c;")
+        emitter.write("push(ce_index);")
+        walk_body(ast, loop.body, emitter, inlined)
+        emitter.end()
+
+
+def write_counted_loop(
+    ast: CEAst.AST,
+    body: list[BuildIn],
+    loop: CountedLoop,
+    emitter: Emitter,
+    inlined: set[int],
+    level: int,
+) -> None:
+    """
+    a for loop over a C local, the counter only goes back on the stack after the loop
+    when the loop is not followed by a drop
+    """
+    counter = f"{counter_prefix}{level}"
+    following = body[loop.end + 1] if loop.end + 1 < len(body) else None
+    dropped = isinstance(following, Intrinsic) and following.typ == Intrinsics.DROP
+    condition = f"{counter} {loop.compare} {loop.limit}; {counter} {loop.step}"
+    emitter.write("// counted loop")
+    if dropped:
+        emitter.write(f"for (cell {counter} = pop(); {condition}) {{")
+    else:
+        emitter.write("{")
+        emitter.indent()
+        emitter.write(f"cell {counter} = pop();")
+        emitter.write(f"for (; {condition}) {{")
+    emitter.indent()
+    walk_body(
+        ast,
+        body[loop.body_start : loop.body_end],
+        emitter,
+        inlined,
+        level=level + 1,
+        counter_copies={i - loop.body_start for i in loop.counter_copies},
+    )
+    emitter.dedent()
+    emitter.write("}")
+    if not dropped:
+        emitter.write(f"push({counter});")
+        emitter.dedent()
+        emitter.write("}")
+
+
+def walk_body(
+    ast: CEAst.AST,
+    body: list[BuildIn],
+    emitter: Emitter,
+    inlined: set[int],
+    splittable: bool = False,
+    level: int = 0,
+    counter_copies: Optional[set[int]] = None,
+) -> None:
+    """
+    writes the operations of main or of a proc, the calls to the procs in `inlined`
+    are replaced with their body. only the top level of main (`splittable`) is split.
+    the body of a counted loop is written with the `level` of nested counted loops it
+    is in and the operations that copy its counter
+    """
+    # the number of open if/while blocks, main can only be split outside of them
+    depth: int = 0
+    ops_since_split: int = 0
+
+    templates = INTRINSIC_TEMPLATES
+    i = 0
+    while i < len(body):
+        op = body[i]
+        i += 1
+        if splittable and depth == 0 and emitter.split_point(ops_since_split):
+            ops_since_split = 0
+        ops_since_split += 1
+
+        loop = None
+        if isinstance(op, KeyWord) and op.typ == KeyWords.WHILE:
+            loop = match_counted_loop(ast, body, i - 1)
+
+        if counter_copies is not None and i - 1 in counter_copies:
+            # the copies are the dup or 2dup of the counter
+            assert isinstance(op, Intrinsic)
+            for _ in range(1 if op.typ == Intrinsics.DUP else 2):
+                emitter.write(f"push({counter_prefix}{level - 1});")
+        elif loop is not None:
+            write_counted_loop(ast, body, loop, emitter, inlined, level)
+            i = loop.end + 1
+            following = body[i] if i < len(body) else None
+            if isinstance(following, Intrinsic) and following.typ == Intrinsics.DROP:
+                i += 1
+        elif isinstance(op, Intrinsic):
+            emitter.emit(op.typ, templates[op.typ])
+        elif isinstance(op, Push):
             # for mypy reasons
             assert isinstance(op, Push), "Is this even possible?"
             if op.typ == Types.INT:
-                write(f"push({op.value});")
-        elif op == KeyWord:
+                emitter.write(f"push({op.value});")
+        elif isinstance(op, KeyWord):
             if op.typ == KeyWords.IF:
-                write("if (pop()) {")
-                indentation_level += INDENTATION
+                depth += 1
+                emitter.write("if (pop()) {")
+                emitter.indent()
             elif op.typ == KeyWords.END:
-                indentation_level -= INDENTATION
-                write("}")
+                depth -= 1
+                emitter.dedent()
+                emitter.write("}")
             elif op.typ == KeyWords.WHILE:
-                while_loop_count += 1
-                write(f"while (_CeWhileLoopFunction{while_loop_count}()) ")
-
-                while_loops.append(while_loop_count)
-                indentation_levels.append(indentation_level)
-                indentation_level = 0
-                write(f"int _CeWhileLoopFunction{while_loop_count}() {{")
-                indentation_level += INDENTATION
-                write("int a, b;")
-                # raise NotImplementedError(op)
+                # the condition is inside of the loop, so it sees the same locals as the body
+                depth += 1
+                emitter.write("while (1) {")
+                emitter.indent()
             elif op.typ == KeyWords.DO:
-                if while_loops:
-                    write("return pop();")
-                    indentation_level -= INDENTATION
-                    write("}")
-                    write("    ")
-                    while_loops.pop()
-                    indentation_level = indentation_levels.pop()
-                write("{")
-                indentation_level += INDENTATION
+                emitter.write("if (!pop()) break;")
             elif op.typ == KeyWords.CONST:
                 # no need to implement anything special for this as constants is a parsing stage thing
                 continue
-        elif op == PushMem:
-            write(f"push((int) &{memory_prefix}{op.id});")
+        elif isinstance(op, PushMem):
+            emitter.write(f"push((cell) {memory_reference(ast.memories[op.id])});")
+        elif isinstance(op, PushMemLength):
+            emitter.write(f"push({memory_length_prefix}{op.id});")
+        elif isinstance(op, PushStr):
+            emitter.write(f"push((cell) {string_prefix}{op.id});")
+            emitter.write(f"push({len(ast.strings[op.id])});")
+        elif isinstance(op, ArrayGet):
+            emitter.emit(
+                (ArrayGet, op.id),
+                array_get_template(ast.memories[op.id], emitter.bounds_checks),
+            )
+        elif isinstance(op, ArraySet):
+            emitter.emit(
+                (ArraySet, op.id),
+                array_set_template(ast.memories[op.id], emitter.bounds_checks),
+            )
+        elif isinstance(op, PushVar):
+            emitter.write(f"push({variable_prefix}{op.id});")
+        elif isinstance(op, SetVar):
+            emitter.write(f"{variable_prefix}{op.id} = pop();")
+        elif isinstance(op, ParallelFor):
+            # the iterations only share the memories, the variables are passed by value
+            arguments = ", ".join(
+                ["ce_index"]
+                + [
+                    f"{variable_prefix}{i}"
+                    for i in function_variables(ast, op.body, inlined)
+                ]
+            )
+            emitter.write("// parallel-for")
+            emitter.write("b = pop();")
+            emitter.write("a = pop();")
+            emitter.write("#pragma omp parallel for")
+            emitter.write(
+                f"for (cell ce_index = a; ce_index < b; ce_index++) {parallel_prefix}{op.id}({arguments});"
+            )
+        elif isinstance(op, Call):
+            if op.id in inlined:
+                emitter.write(f"// {op.name}")
+                for variable in proc_variables(ast, ast.procs[op.id]):
+                    emitter.write(f"{variable_prefix}{variable} = 0;")
+                walk_body(ast, ast.procs[op.id].body, emitter, inlined, level=level)
+            else:
+                emitter.write(f"{proc_prefix}{op.id}(); // {op.name}")
         else:
             raise NotImplementedError(op)
-
-    indentation_level -= INDENTATION
-    write("}")
-
-    return (
-        "".join(generated_standard_c)
-        + "".join(generated_functions_c)
-        + "".join(generated_c)
-    )
@@ -0,0 +1,400 @@
+# runs the comptime blocks while compiling, the memories that they write start with
+# their contents instead of zeroes
+from __future__ import annotations
+
+import src.CEAst as CEAst  # type: ignore[import]
+from src.CEAst import compiler_error  # type: ignore[import]
+
+from src.core import (  # type: ignore[import]
+    BuildIn,
+    Intrinsics,
+    Intrinsic,
+    KeyWords,
+    KeyWord,
+    mapping,
+    Push,
+    PushMem,
+    PushStr,
+    Call,
+    ParallelFor,
+    Comptime,
+    PushVar,
+    SetVar,
+    ArrayGet,
+    ArraySet,
+    ARRAY_GET_SUFFIX,
+    ARRAY_SET_SUFFIX,
+    wrap,
+)
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Callable, Optional, Union
+
+# a comptime block that runs longer than this is reported as an error instead of
+# hanging the compiler
+STEP_LIMIT: int = 20_000_000
+
+# the memories do not have an address while compiling, a pointer is
+# POINTER_BASE + (the index of the memory << 32) + the offset in the memory,
+# so the pointer arithmetic and the comparisons of the program keep working
+POINTER_BASE: int = 0x7CE0 << 48
+MAX_MEMORY_SIZE: int = 1 << 32
+
+# the operations are translated to (opcode, operand, node) before they run,
+# the operand of the jumps is the index of the target
+OP_PUSH = 0
+OP_BINARY = 1
+OP_INTRINSIC = 2
+OP_PUSH_MEM = 3
+OP_ARRAY_GET = 4
+OP_ARRAY_SET = 5
+OP_CALL = 6
+OP_PUSH_VAR = 7
+OP_SET_VAR = 8
+OP_JUMP = 9
+OP_JUMP_IF_ZERO = 10
+OP_PARALLEL_FOR = 11
+OP_PUSH_STR = 12
+OP_UNSUPPORTED = 13
+
+
+# division and modulo truncate towards zero like C and idiv
+def c_div(b: int, a: int) -> int:
+    quotient = abs(b) // abs(a)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+
+def c_mod(b: int, a: int) -> int:
+    return b - c_div(b, a) * a
+
+
+def c_pow(b: int, a: int) -> int:
+    # negative exponents give 0 like ce_pow of the x86-64 backend
+    return pow(b, a, 1 << 64) if a >= 0 else 0
+
+
+BINARY_OPS: dict[Intrinsics, Callable[[int, int], int]] = {
+    Intrinsics.ADD: lambda b, a: b + a,
+    Intrinsics.SUB: lambda b, a: b - a,
+    Intrinsics.MUL: lambda b, a: b * a,
+    Intrinsics.DIV: c_div,
+    Intrinsics.MOD: c_mod,
+    Intrinsics.POW: c_pow,
+    Intrinsics.BIN_AND: lambda b, a: b & a,
+    Intrinsics.BIN_OR: lambda b, a: b | a,
+    Intrinsics.BIN_XOR: lambda b, a: b ^ a,
+    # the shift count is masked like the shift instructions of x86-64 do
+    Intrinsics.RSHIFT: lambda b, a: b >> (a & 63),
+    Intrinsics.LSHIFT: lambda b, a: b << (a & 63),
+    Intrinsics.LT: lambda b, a: int(b < a),
+    Intrinsics.LE: lambda b, a: int(b <= a),
+    Intrinsics.EQ: lambda b, a: int(b == a),
+    Intrinsics.NE: lambda b, a: int(b != a),
+    Intrinsics.GE: lambda b, a: int(b >= a),
+    Intrinsics.GT: lambda b, a: int(b > a),
+}
+
+# the width in bytes of every load and store
+LOADS: dict[Intrinsics, int] = {
+    Intrinsics.LOAD8: 1,
+    Intrinsics.LOAD16: 2,
+    Intrinsics.LOAD32: 4,
+    Intrinsics.LOAD64: 8,
+}
+STORES: dict[Intrinsics, int] = {
+    Intrinsics.STORE8: 1,
+    Intrinsics.STORE16: 2,
+    Intrinsics.STORE32: 4,
+    Intrinsics.STORE64: 8,
+}
+
+
+class Machine:
+    """
+    an interpreter for the operations of comptime blocks, the memories are bytearrays
+    with the layout that the generated code gives them
+    """
+
+    def __init__(self, ast: CEAst.AST) -> None:
+        self.ast = ast
+        # the mapped memories only exist when the program runs, the string literals
+        # come after the memories and can only be read
+        self.memories: list[Optional[bytearray]] = [
+            None if mem.mapped else bytearray(mem.initial or mem.size)
+            for mem in ast.memories
+        ]
+        self.memories.extend(bytearray(text) for text in ast.strings)
+        self.memory_ids: dict[str, int] = {
+            mem.name: i for i, mem in enumerate(ast.memories)
+        }
+        self.stack: list[int] = []
+        self.steps: int = 0
+        # the translated bodies by the id of the list of operations
+        self.code: dict[int, list[list[Any]]] = {}
+
+    def translate(self, body: list[BuildIn]) -> list[list[Any]]:
+        code = self.code.get(id(body))
+        if code is not None:
+            return code
+        code = []
+        # the index of the jump of every if and do that is not closed yet and the
+        # index of the condition of every while
+        opened: list[tuple[KeyWord, int, int]] = []
+        for node in body:
+            if isinstance(node, Push):
+                code.append([OP_PUSH, int(node.value), node])
+            elif isinstance(node, Intrinsic) and node.typ in BINARY_OPS:
+                code.append([OP_BINARY, BINARY_OPS[node.typ], node])
+            elif isinstance(node, Intrinsic):
+                code.append([OP_INTRINSIC, node.typ, node])
+            elif isinstance(node, PushMem):
+                code.append([OP_PUSH_MEM, self.memory_ids[node.name], node])
+            elif isinstance(node, PushStr):
+                code.append([OP_PUSH_STR, node.id, node])
+            elif isinstance(node, ArrayGet):
+                code.append([OP_ARRAY_GET, self.memory_ids[node.name], node])
+            elif isinstance(node, ArraySet):
+                code.append([OP_ARRAY_SET, self.memory_ids[node.name], node])
+            elif isinstance(node, Call):
+                code.append([OP_CALL, node.id, node])
+            elif isinstance(node, PushVar):
+                code.append([OP_PUSH_VAR, node.id, node])
+            elif isinstance(node, SetVar):
+                code.append([OP_SET_VAR, node.id, node])
+            elif isinstance(node, ParallelFor):
+                code.append([OP_PARALLEL_FOR, self.translate(node.body), node])
+            elif isinstance(node, KeyWord) and node.typ == KeyWords.IF:
+                opened.append((node, len(code), -1))
+                code.append([OP_JUMP_IF_ZERO, -1, node])
+            elif isinstance(node, KeyWord) and node.typ == KeyWords.WHILE:
+                opened.append((node, -1, len(code)))
+            elif isinstance(node, KeyWord) and node.typ == KeyWords.DO:
+                _, _, condition = opened.pop()
+                opened.append((node, len(code), condition))
+                code.append([OP_JUMP_IF_ZERO, -1, node])
+            elif isinstance(node, KeyWord) and node.typ == KeyWords.END:
+                block, jump, condition = opened.pop()
+                if block.typ == KeyWords.DO:
+                    code.append([OP_JUMP, condition, node])
+                code[jump][1] = len(code)
+            else:
+                # a mapped memory or a comptime block in a proc, the type checker
+                # reports them when they are used in the block itself
+                code.append([OP_UNSUPPORTED, None, node])
+        self.code[id(body)] = code
+        return code
+
+    def is_pointer(self, value: int) -> bool:
+        return 0 <= value - POINTER_BASE < len(self.memories) * MAX_MEMORY_SIZE
+
+    def address(
+        self, pointer: int, width: int, node: Intrinsic, write: bool = False
+    ) -> tuple[bytearray, int]:
+        """
+        the memory that `pointer` points into and the offset in it, the `width` bytes
+        from the pointer have to be in the memory
+        """
+        index, offset = divmod(pointer - POINTER_BASE, MAX_MEMORY_SIZE)
+        memory = self.memories[index] if 0 <= index < len(self.memories) else None
+        if memory is None or width < 0 or offset + width > len(memory):
+            compiler_error(
+                node.format_location(),
+                f"{mapping[node.typ]} of {width} bytes at {pointer:#x} is outside of "
+                "every memory while running a comptime block",
+            )
+            raise AssertionError("unreachable")
+        if write and index >= len(self.ast.memories):
+            compiler_error(node.format_location(), "string literals can not be written")
+        return memory, offset
+
+    def store(self, pointer: int, value: int, width: int, node: Intrinsic) -> None:
+        if self.is_pointer(value):
+            compiler_error(
+                node.format_location(),
+                "pointers can not be stored by a comptime block, the memories only "
+                "get their addresses when the program runs",
+            )
+        memory, offset = self.address(pointer, width, node, write=True)
+        memory[offset : offset + width] = (value & ((1 << 8 * width) - 1)).to_bytes(
+            width, "little"
+        )
+
+    def load(self, pointer: int, width: int, node: Intrinsic) -> int:
+        memory, offset = self.address(pointer, width, node)
+        return int.from_bytes(memory[offset : offset + width], "little", signed=True)
+
+    def element(
+        self, index: int, node: Union[ArrayGet, ArraySet]
+    ) -> tuple[bytearray, int, int]:
+        """
+        the memory of an array, the offset and the size of the element at `index`
+        """
+        mem = self.ast.memories[self.memory_ids[node.name]]
+        memory = self.memories[self.memory_ids[node.name]]
+        assert memory is not None and mem.element_size is not None
+        if not 0 <= index < mem.count:
+            suffix = (
+                ARRAY_GET_SUFFIX if isinstance(node, ArrayGet) else ARRAY_SET_SUFFIX
+            )
+            compiler_error(
+                node.format_location(),
+                f"index {index} of {mem.name}{suffix} is out of the bounds of "
+                f"{mem.name} ({mem.count} elements)",
+            )
+        return memory, index * mem.element_size, mem.element_size
+
+    def intrinsic(self, typ: Intrinsics, node: Intrinsic) -> None:
+        stack = self.stack
+        if typ == Intrinsics.DUP:
+            stack.append(stack[-1])
+        elif typ == Intrinsics.DUP2:
+            stack.extend((stack[-1], stack[-1]))
+        elif typ == Intrinsics.DROP:
+            stack.pop()
+        elif typ == Intrinsics.DROP2:
+            del stack[-2:]
+        elif typ == Intrinsics.SWAP:
+            stack[-1], stack[-2] = stack[-2], stack[-1]
+        elif typ == Intrinsics.BIN_INV:
+            stack.append(~stack.pop())
+        elif typ in (Intrinsics.CAST_INT, Intrinsics.CAST_PTR):
+            pass
+        elif typ in LOADS:
+            stack.append(self.load(stack.pop(), LOADS[typ], node))
+        elif typ in STORES:
+            pointer = stack.pop()
+            self.store(pointer, stack.pop(), STORES[typ], node)
+        elif typ == Intrinsics.FILL:
+            value, count, pointer = stack.pop(), stack.pop(), stack.pop()
+            memory, offset = self.address(pointer, count, node, write=True)
+            memory[offset : offset + count] = bytes((value & 0xFF,)) * count
+        elif typ == Intrinsics.COPY:
+            count, destination, source = stack.pop(), stack.pop(), stack.pop()
+            source_memory, source_offset = self.address(source, count, node)
+            memory, offset = self.address(destination, count, node, write=True)
+            # the slice is a copy, so overlapping regions work like memmove
+            memory[offset : offset + count] = source_memory[
+                source_offset : source_offset + count
+            ]
+        elif typ == Intrinsics.COMPARE:
+            count, second, first = stack.pop(), stack.pop(), stack.pop()
+            first_memory, first_offset = self.address(first, count, node)
+            second_memory, second_offset = self.address(second, count, node)
+            a = first_memory[first_offset : first_offset + count]
+            b = second_memory[second_offset : second_offset + count]
+            stack.append((a > b) - (a < b))
+        else:
+            # the output, the files and the stack of the program do not exist yet
+            compiler_error(
+                node.format_location(),
+                f"{mapping[typ]} can not run at compile time (it was reached from a "
+                "comptime block)",
+            )
+
+    def run(self, code: list[list[Any]], frame: dict[int, int]) -> None:
+        stack = self.stack
+        pc = 0
+        # the node that the operation was translated from, for the errors
+        node: Any = None
+        try:
+            while pc < len(code):
+                op, operand, node = code[pc]
+                pc += 1
+                self.steps += 1
+                if op == OP_PUSH:
+                    stack.append(operand)
+                elif op == OP_BINARY:
+                    a = stack.pop()
+                    stack.append(wrap(operand(stack.pop(), a)))
+                elif op == OP_JUMP_IF_ZERO:
+                    if stack.pop() == 0:
+                        pc = operand
+                elif op == OP_JUMP:
+                    pc = operand
+                    if self.steps > STEP_LIMIT:
+                        compiler_error(
+                            node.format_location(),
+                            f"a comptime block did not finish after {STEP_LIMIT} "
+                            "operations",
+                        )
+                elif op == OP_INTRINSIC:
+                    self.intrinsic(operand, node)
+                elif op == OP_PUSH_MEM:
+                    if self.memories[operand] is None:
+                        compiler_error(
+                            node.format_location(),
+                            f"the mapped memory {node.name} only exists when the "
+                            "program runs, it can not be used at compile time",
+                        )
+                    stack.append(POINTER_BASE + operand * MAX_MEMORY_SIZE)
+                elif op == OP_PUSH_STR:
+                    index = len(self.ast.memories) + operand
+                    stack.append(POINTER_BASE + index * MAX_MEMORY_SIZE)
+                    stack.append(len(self.ast.strings[operand]))
+                elif op == OP_ARRAY_GET:
+                    memory, offset, size = self.element(stack.pop(), node)
+                    stack.append(
+                        int.from_bytes(
+                            memory[offset : offset + size], "little", signed=True
+                        )
+                    )
+                elif op == OP_ARRAY_SET:
+                    memory, offset, size = self.element(stack.pop(), node)
+                    memory[offset : offset + size] = (
+                        stack.pop() & ((1 << 8 * size) - 1)
+                    ).to_bytes(size, "little")
+                elif op == OP_CALL:
+                    # every call starts with its variables at zero
+                    self.run(self.translate(self.ast.procs[operand].body), {})
+                elif op == OP_PUSH_VAR:
+                    stack.append(frame.get(operand, 0))
+                elif op == OP_SET_VAR:
+                    frame[operand] = stack.pop()
+                elif op == OP_PARALLEL_FOR:
+                    # the iterations do not share anything, running them in order
+                    # gives the same memories
+                    end, start = stack.pop(), stack.pop()
+                    for index in range(start, end):
+                        stack.append(index)
+                        self.run(operand, frame)
+                else:
+                    compiler_error(
+                        node.format_location(),
+                        "this operation can not run at compile time",
+                    )
+        except ZeroDivisionError:
+            assert node is not None
+            compiler_error(
+                node.format_location(), "division by zero in a comptime block"
+            )
+        except RecursionError:
+            assert node is not None
+            compiler_error(
+                node.format_location(), "the calls of a comptime block are too deep"
+            )
+
+
+def bake(ast: CEAst.AST) -> None:
+    """
+    runs the comptime blocks of the program in order and removes them, every memory
+    that they left with something other than zeroes gets those contents as its
+    initial value. running it again does nothing
+    """
+    blocks = [node for node in ast.body if isinstance(node, Comptime)]
+    if not blocks:
+        return
+    for mem in ast.memories:
+        if not mem.mapped and mem.size > MAX_MEMORY_SIZE:
+            compiler_error(
+                mem.format_location(),
+                f"{mem.name} is too big for comptime blocks ({mem.size} bytes)",
+            )
+    machine = Machine(ast)
+    for block in blocks:
+        machine.run(machine.translate(block.body), {})
+        assert not machine.stack, "the type checker makes comptime blocks leave nothing"
+    ast.body = [node for node in ast.body if not isinstance(node, Comptime)]
+    for mem, memory in zip(ast.memories, machine.memories):
+        if memory is not None and any(memory):
+            mem.initial = bytes(memory)
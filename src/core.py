@@ -1,33 +1,68 @@
+from __future__ import annotations
+
 from dataclasses import dataclass
 
 from enum import Enum, auto
 from pathlib import Path
 
-from typing import *
-
 import re as regex
 
+# `typing` is only needed by mypy, importing it costs a few ms on every start
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Optional, TypeVar, Union
+
 CWD: Path = Path().absolute()
 
 COMMENT: str = "//"
 
+# "<text>" pushes a pointer to the bytes of the text and their number, the escapes
+# are the ones after a backslash
+STRING_QUOTE: str = '"'
+STRING_ESCAPES: dict[str, str] = {
+    "n": "\n",
+    "t": "\t",
+    "r": "\r",
+    "0": "\0",
+    "\\": "\\",
+    STRING_QUOTE: STRING_QUOTE,
+}
+
 EXTENSION: str = ".ce"
+# the checked programs saved by -emit-ir, see src/ir.py
+IR_EXTENSION: str = ".ceir"
 
 STACK_SIZE: int = 30000
 
 INDENTATION: int = 2
 
-_AbstractValue = TypeVar("_AbstractValue")
+if TYPE_CHECKING:
+    _AbstractValue = TypeVar("_AbstractValue")
+
+
+class _LazyPattern:
+    """
+    a regex that is compiled the first time it is accessed instead of at import time
+    """
+
+    def __init__(self, pattern: str) -> None:
+        self.pattern = pattern
+        self.compiled: Optional[regex.Pattern[str]] = None
+
+    def __get__(self, instance: object, owner: type) -> regex.Pattern[str]:
+        if self.compiled is None:
+            self.compiled = regex.compile(self.pattern)
+        return self.compiled
 
 
 class Patterns:
-    signed_integer = regex.compile(r"^[-+]?\d+$")
-    unsigned_integer = regex.compile(r"^([+-]?[1-9]\d*|0)$")
-    signed_float = regex.compile(r"[-.0-9]+")
-    unsigned_float = regex.compile(r"[.0-9]+")
+    signed_integer = _LazyPattern(r"^[-+]?\d+$")
+    unsigned_integer = _LazyPattern(r"^([+-]?[1-9]\d*|0)$")
+    signed_float = _LazyPattern(r"[-.0-9]+")
+    unsigned_float = _LazyPattern(r"[.0-9]+")
 
-    binary_format = regex.compile(r"0[bB][0-1]+")
-    hexadecimal_format = regex.compile(r"0[xX][0-9a-fA-F]+")
+    binary_format = _LazyPattern(r"0[bB][0-1]+")
+    hexadecimal_format = _LazyPattern(r"0[xX][0-9a-fA-F]+")
 
 
 # visual pleasing reasons
@@ -81,17 +116,32 @@ class Intrinsics(BuildIn, Enum):
     LOAD32 = auto()
     STORE64 = auto()
     LOAD64 = auto()
+    READ = auto()
+    READ_FILE = auto()
+    WRITE = auto()
+    FILL = auto()
+    COPY = auto()
+    COMPARE = auto()
+    PUTS = auto()
 
 
 class KeyWords(BuildIn, Enum):
     IF = auto()
     END = auto()
     WHILE = auto()
+    PARALLEL_FOR = auto()
+    COMPTIME = auto()
     MEMORY = auto()
+    MEMORY_FILE = auto()
+    MEMORY_FILE_RW = auto()
+    ARRAY = auto()
     DO = auto()
     CONST = auto()
     MACRO = auto()
     ENDMACRO = auto()
+    PROC = auto()
+    VAR = auto()
+    SET = auto()
 
 
 class Types(BuildIn, Enum):
@@ -103,6 +153,13 @@ def format_location(file: str, line: int, column: int) -> str:
     return f"{file}:{line + 1}:{column + 1}"
 
 
+def wrap(value: int) -> int:
+    """
+    the value as a signed 64 bit integer, like a cell of the generated code
+    """
+    return ((value + (1 << 63)) & ((1 << 64) - 1)) - (1 << 63)
+
+
 @dataclass
 class ExpandedFromNode:
     loc: LocType
@@ -117,7 +174,7 @@ class ExpandedFromNode:
 class Push(BuildIn):
     value: Union[str, int]
     typ: Types
-    expanded_from: Optional[str] = None
+    expanded_from: Optional[ExpandedFromNode] = None
 
     def __eq__(self, other) -> bool:
         return type(self) == other
@@ -177,6 +234,26 @@ class Mem(BuildIn):
     loc: LocType
     id: int = -1  # will be set by the compiler.py file to simplify name
     expanded_from: Optional[ExpandedFromNode] = None
+    # the index of the command line argument with the path of the file that is
+    # mapped to this memory, None for normal (static) memories
+    argument: Optional[int] = None
+    writable: bool = True
+    # the size in bytes of an element of an array declared with the array keyword
+    element_size: Optional[int] = None
+    # the contents that comptime blocks left in the memory, None if it starts zeroed
+    initial: Optional[bytes] = None
+
+    @property
+    def mapped(self) -> bool:
+        return self.argument is not None
+
+    @property
+    def count(self) -> int:
+        """
+        the number of elements of an array
+        """
+        assert self.element_size is not None, f"{self.name} is not an array"
+        return self.size // self.element_size
 
     def format_location(self) -> str:
         return format_location(self.loc[0], self.loc[1], self.loc[2])
@@ -199,6 +276,186 @@ class PushMem(BuildIn):
         return type(self) == other
 
 
+# a string literal, the text is ast.strings[id]
+@dataclass
+class PushStr(BuildIn):
+    loc: LocType
+    id: int
+    expanded_from: Optional[ExpandedFromNode] = None
+
+    def format_location(self) -> str:
+        return format_location(self.loc[0], self.loc[1], self.loc[2])
+
+    def __eq__(self, other) -> bool:
+        return type(self) == other
+
+
+@dataclass
+class PushMemLength(BuildIn):
+    name: str
+    loc: LocType
+    id: int = -1
+    expanded_from: Optional[ExpandedFromNode] = None
+
+    def format_location(self) -> str:
+        return format_location(self.loc[0], self.loc[1], self.loc[2])
+
+    def __eq__(self, other) -> bool:
+        return type(self) == other
+
+
+# the word that pushes the length of a memory that is mapped from a file
+MEMORY_LENGTH_SUFFIX: str = ".length"
+
+
+@dataclass
+class ArrayGet(BuildIn):
+    name: str
+    loc: LocType
+    id: int = -1
+    expanded_from: Optional[ExpandedFromNode] = None
+
+    def format_location(self) -> str:
+        return format_location(self.loc[0], self.loc[1], self.loc[2])
+
+    def __eq__(self, other) -> bool:
+        return type(self) == other
+
+
+@dataclass
+class ArraySet(BuildIn):
+    name: str
+    loc: LocType
+    id: int = -1
+    expanded_from: Optional[ExpandedFromNode] = None
+
+    def format_location(self) -> str:
+        return format_location(self.loc[0], self.loc[1], self.loc[2])
+
+    def __eq__(self, other) -> bool:
+        return type(self) == other
+
+
+# array <name> <element type> <count> end
+# `<name>.get` (index -- value) and `<name>.set` (value index --)
+ARRAY_GET_SUFFIX: str = ".get"
+ARRAY_SET_SUFFIX: str = ".set"
+# the element types of an array and their size in bytes
+ELEMENT_TYPES: dict[str, int] = {"int8": 1, "int16": 2, "int32": 4, "int64": 8}
+
+
+@dataclass
+class Proc(BuildIn):
+    name: str
+    loc: LocType
+    # the stack effect, from the bottom to the top of the stack
+    ins: list[Types]
+    outs: list[Types]
+    body: list[BuildIn]
+    id: int = -1
+    expanded_from: Optional[ExpandedFromNode] = None
+
+    def format_location(self) -> str:
+        return format_location(self.loc[0], self.loc[1], self.loc[2])
+
+    def __eq__(self, other) -> bool:
+        return type(self) == other
+
+
+@dataclass
+class Call(BuildIn):
+    name: str
+    loc: LocType
+    id: int = -1
+    expanded_from: Optional[ExpandedFromNode] = None
+
+    def format_location(self) -> str:
+        return format_location(self.loc[0], self.loc[1], self.loc[2])
+
+    def __eq__(self, other) -> bool:
+        return type(self) == other
+
+
+@dataclass
+class Variable(BuildIn):
+    name: str
+    loc: LocType
+    typ: Types
+    id: int = -1
+
+    def format_location(self) -> str:
+        return format_location(self.loc[0], self.loc[1], self.loc[2])
+
+    def __eq__(self, other) -> bool:
+        return type(self) == other
+
+
+@dataclass
+class PushVar(BuildIn):
+    name: str
+    loc: LocType
+    id: int = -1
+    expanded_from: Optional[ExpandedFromNode] = None
+
+    def format_location(self) -> str:
+        return format_location(self.loc[0], self.loc[1], self.loc[2])
+
+    def __eq__(self, other) -> bool:
+        return type(self) == other
+
+
+@dataclass
+class SetVar(BuildIn):
+    name: str
+    loc: LocType
+    id: int = -1
+    expanded_from: Optional[ExpandedFromNode] = None
+
+    def format_location(self) -> str:
+        return format_location(self.loc[0], self.loc[1], self.loc[2])
+
+    def __eq__(self, other) -> bool:
+        return type(self) == other
+
+
+# <start> <end> parallel-for <body> end
+# the body runs once for every index in [start, end) with the index on an empty stack
+@dataclass
+class ParallelFor(BuildIn):
+    loc: LocType
+    body: list[BuildIn]
+    id: int = -1
+    expanded_from: Optional[ExpandedFromNode] = None
+
+    def format_location(self) -> str:
+        return format_location(self.loc[0], self.loc[1], self.loc[2])
+
+    def __eq__(self, other) -> bool:
+        return type(self) == other
+
+
+# comptime <body> end
+# the body runs while compiling, the memories it writes start with its results
+@dataclass
+class Comptime(BuildIn):
+    loc: LocType
+    body: list[BuildIn]
+    expanded_from: Optional[ExpandedFromNode] = None
+
+    def format_location(self) -> str:
+        return format_location(self.loc[0], self.loc[1], self.loc[2])
+
+    def __eq__(self, other) -> bool:
+        return type(self) == other
+
+
+# proc <name> <inputs> -- <outputs> in <body> end
+PROC_SEPARATOR: str = "--"
+PROC_BODY: str = "in"
+# the words of the types in a proc signature or a var declaration
+TYPE_WORDS: dict[str, Types] = {"int": Types.INT, "ptr": Types.POINTER}
+
+
 mapping: dict[BuildIn, str] = {
     Intrinsics.ADD: "+",
     Intrinsics.SUB: "-",
@@ -237,13 +494,30 @@ mapping: dict[BuildIn, str] = {
     Intrinsics.LOAD32: "@32",
     Intrinsics.STORE64: "!64",
     Intrinsics.LOAD64: "@64",
+    Intrinsics.READ: "read",
+    Intrinsics.READ_FILE: "read-file",
+    Intrinsics.WRITE: "write",
+    Intrinsics.FILL: "fill",
+    Intrinsics.COPY: "copy",
+    Intrinsics.COMPARE: "compare",
+    Intrinsics.PUTS: "puts",
     KeyWords.IF: "if",
     KeyWords.END: "end",
     KeyWords.WHILE: "while",
+    KeyWords.PARALLEL_FOR: "parallel-for",
+    KeyWords.COMPTIME: "comptime",
     KeyWords.DO: "do",
     KeyWords.CONST: "const",
     KeyWords.MEMORY: "memory",
+    KeyWords.MEMORY_FILE: "memory-file",
+    KeyWords.MEMORY_FILE_RW: "memory-file-rw",
+    KeyWords.ARRAY: "array",
     KeyWords.MACRO: "macro",
     KeyWords.ENDMACRO: "endmacro",
+    KeyWords.PROC: "proc",
+    KeyWords.VAR: "var",
+    KeyWords.SET: "set",
 }
 mapping_names: list[str] = list(mapping.values())
+# reverse lookup of `mapping`, so a word can be resolved without scanning the enums
+words: dict[str, BuildIn] = {word: build_in for build_in, word in mapping.items()}
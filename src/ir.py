@@ -0,0 +1,405 @@
+# a binary form of the program after makeAST that can be saved and loaded again
+# without lexing and parsing the source
+#
+# layout (little endian, every section starts 8 byte aligned):
+#     header        see HEADER
+#     operands      int64[op_count]
+#     locations     int32[op_count * 3]: file index, line, column
+#     opcodes       uint16[op_count]: kind << 8 | the index of the enum member
+#     padding       to 8 bytes
+#     metadata      utf-8 JSON: the files, the enum names, the memories, procs
+#                   and variables
+#
+# the crc32 in the header covers everything after the header, the sha256 of every
+# source file is in the metadata so a file that is older than its sources is found
+from __future__ import annotations
+
+import src.CEAst as CEAst  # type: ignore[import]
+
+from src.core import (  # type: ignore[import]
+    IR_EXTENSION,
+    BuildIn,
+    Intrinsics,
+    Intrinsic,
+    KeyWords,
+    KeyWord,
+    Types,
+    LocType,
+    Push,
+    Mem,
+    PushMem,
+    PushMemLength,
+    PushStr,
+    ArrayGet,
+    ArraySet,
+    Proc,
+    Call,
+    ParallelFor,
+    Comptime,
+    Variable,
+    PushVar,
+    SetVar,
+    wrap,
+)
+
+from array import array
+from pathlib import Path
+
+import hashlib
+import struct
+import mmap
+import json
+import zlib
+import sys
+import os
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Optional
+
+MAGIC: bytes = b"CEIR"
+# bumped on every change of the layout or of the meaning of the opcodes
+IR_VERSION: int = 3
+# magic, version, crc32 of the rest of the file, reserved, op count,
+# metadata offset, metadata length
+HEADER = struct.Struct("<4sIIIQQQ")
+# so the header keeps the operands aligned
+assert HEADER.size % 8 == 0
+
+# the high byte of an opcode
+KIND_INTRINSIC: int = 1
+KIND_KEYWORD: int = 2
+KIND_PUSH: int = 3
+KIND_PUSH_MEM: int = 4
+KIND_PUSH_MEM_LENGTH: int = 5
+KIND_ARRAY_GET: int = 6
+KIND_ARRAY_SET: int = 7
+KIND_CALL: int = 8
+KIND_PUSH_VAR: int = 9
+KIND_SET_VAR: int = 10
+# the operand of these is the number of operations of the body, the body follows it
+KIND_PARALLEL_FOR: int = 11
+KIND_COMPTIME: int = 12
+# the operand is the index of the text in the strings of the metadata
+KIND_PUSH_STR: int = 13
+
+# the operand of these is the id of a memory
+MEMORY_KINDS: dict[type, int] = {
+    PushMem: KIND_PUSH_MEM,
+    PushMemLength: KIND_PUSH_MEM_LENGTH,
+    ArrayGet: KIND_ARRAY_GET,
+    ArraySet: KIND_ARRAY_SET,
+}
+VARIABLE_KINDS: dict[type, int] = {PushVar: KIND_PUSH_VAR, SetVar: KIND_SET_VAR}
+
+
+def ir_error(path: str, details: str) -> None:
+    print(f"[ERROR] {path}: {details}", file=sys.stderr)
+    sys.exit(1)
+
+
+def file_hash(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class IRWriter:
+    def __init__(self, ast: CEAst.AST) -> None:
+        self.ast = ast
+        self.opcodes = array("H")
+        self.operands = array("q")
+        self.locations = array("i")
+        # the program itself is always the first file
+        self.files: dict[str, int] = {str(ast.path): 0}
+        self.memory_ids = {mem.name: i for i, mem in enumerate(ast.memories)}
+        # the enums are saved by name, so the values of auto() can change
+        self.members: dict[type, dict[BuildIn, int]] = {
+            enum: {member: i for i, member in enumerate(enum)}
+            for enum in (Intrinsics, KeyWords, Types)
+        }
+
+    def location(self, loc: LocType) -> list[int]:
+        return [self.files.setdefault(loc[0], len(self.files)), loc[1], loc[2]]
+
+    def add(self, kind: int, sub: int, operand: int, loc: Optional[LocType]) -> None:
+        self.opcodes.append(kind << 8 | sub)
+        self.operands.append(operand)
+        self.locations.extend(self.location(loc) if loc is not None else [-1, 0, 0])
+
+    def add_body(self, body: list[BuildIn]) -> int:
+        """
+        returns the number of operations that were added
+        """
+        start = len(self.opcodes)
+        for op in body:
+            if isinstance(op, Intrinsic):
+                self.add(KIND_INTRINSIC, self.members[Intrinsics][op.typ], 0, op.loc)
+            elif isinstance(op, KeyWord):
+                self.add(KIND_KEYWORD, self.members[KeyWords][op.typ], 0, op.loc)
+            elif isinstance(op, Push):
+                # a literal above int64 is saved as the cell that it becomes, both
+                # backends wrap it the same way
+                value = wrap(int(op.value))
+                self.add(KIND_PUSH, self.members[Types][op.typ], value, None)
+            elif isinstance(op, (PushMem, PushMemLength, ArrayGet, ArraySet)):
+                self.add(MEMORY_KINDS[type(op)], 0, self.memory_ids[op.name], op.loc)
+            elif isinstance(op, (PushVar, SetVar)):
+                self.add(VARIABLE_KINDS[type(op)], 0, op.id, op.loc)
+            elif isinstance(op, PushStr):
+                self.add(KIND_PUSH_STR, 0, op.id, op.loc)
+            elif isinstance(op, Call):
+                self.add(KIND_CALL, 0, op.id, op.loc)
+            elif isinstance(op, ParallelFor):
+                index = len(self.opcodes)
+                self.add(KIND_PARALLEL_FOR, 0, 0, op.loc)
+                self.operands[index] = self.add_body(op.body)
+            elif isinstance(op, Comptime):
+                index = len(self.opcodes)
+                self.add(KIND_COMPTIME, 0, 0, op.loc)
+                self.operands[index] = self.add_body(op.body)
+            else:
+                raise NotImplementedError(op)
+        return len(self.opcodes) - start
+
+    def metadata(self, main_length: int, proc_lengths: list[int]) -> dict[str, Any]:
+        memories = [
+            [
+                mem.name,
+                mem.size,
+                self.location(mem.loc),
+                mem.argument,
+                mem.writable,
+                mem.element_size,
+            ]
+            for mem in self.ast.memories
+        ]
+        procs = [
+            [
+                proc.name,
+                self.location(proc.loc),
+                [typ.name for typ in proc.ins],
+                [typ.name for typ in proc.outs],
+                length,
+            ]
+            for proc, length in zip(self.ast.procs, proc_lengths)
+        ]
+        variables = [
+            [variable.name, self.location(variable.loc), variable.typ.name]
+            for variable in self.ast.variables
+        ]
+        # the files last, the locations above can add to them
+        return {
+            "files": [[path, file_hash(path)] for path in self.files],
+            "enums": {
+                enum.__name__: [member.name for member in enum]
+                for enum in (Intrinsics, KeyWords, Types)
+            },
+            "main": main_length,
+            "memories": memories,
+            "procs": procs,
+            "variables": variables,
+            "strings": [text.hex() for text in self.ast.strings],
+        }
+
+    def write(self, path: str) -> None:
+        main_length = self.add_body(self.ast.body)
+        proc_lengths = [self.add_body(proc.body) for proc in self.ast.procs]
+        metadata = json.dumps(self.metadata(main_length, proc_lengths)).encode()
+
+        payload = bytearray()
+        payload += self.operands.tobytes()
+        payload += self.locations.tobytes()
+        payload += self.opcodes.tobytes()
+        payload += bytes(-len(payload) % 8)
+        metadata_offset = HEADER.size + len(payload)
+        payload += metadata
+
+        header = HEADER.pack(
+            MAGIC,
+            IR_VERSION,
+            zlib.crc32(payload),
+            0,
+            len(self.opcodes),
+            metadata_offset,
+            len(metadata),
+        )
+        with open(path, "wb") as f:
+            f.write(header)
+            f.write(payload)
+
+
+def save_ir(ast: CEAst.AST, path: str) -> None:
+    IRWriter(ast).write(path)
+
+
+class IRFile:
+    """
+    a mapped IR file. the operation arrays are views of the mapping, nothing is
+    decoded until `to_AST` is called, so tools that only look at the opcodes or
+    the locations do not pay for building the nodes
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < HEADER.size:
+                ir_error(path, "not a Corpe IR file")
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic,
+            version,
+            checksum,
+            _,
+            self.op_count,
+            metadata_offset,
+            metadata_length,
+        ) = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            ir_error(path, "not a Corpe IR file")
+        if version != IR_VERSION:
+            ir_error(path, f"version {version} is not supported, expected {IR_VERSION}")
+        view = memoryview(self.map)
+        if (
+            metadata_offset + metadata_length != len(self.map)
+            or zlib.crc32(view[HEADER.size :]) != checksum
+        ):
+            ir_error(path, "the checksum does not match, the file is corrupt")
+
+        start = HEADER.size
+        self.operands = view[start : start + 8 * self.op_count].cast("q")
+        start += 8 * self.op_count
+        self.locations = view[start : start + 12 * self.op_count].cast("i")
+        start += 12 * self.op_count
+        self.opcodes = view[start : start + 2 * self.op_count].cast("H")
+        self.metadata: dict[str, Any] = json.loads(
+            bytes(view[metadata_offset : metadata_offset + metadata_length])
+        )
+
+    def stale_sources(self) -> list[str]:
+        """
+        the source files that changed (or are gone) since the file was written
+        """
+        return [
+            path for path, digest in self.metadata["files"] if file_hash(path) != digest
+        ]
+
+    def location(self, loc: list[int]) -> LocType:
+        return (self.metadata["files"][loc[0]][0], loc[1], loc[2])
+
+    def to_AST(self) -> CEAst.AST:
+        enums = self.metadata["enums"]
+        members: dict[int, list[Any]] = {}
+        for kind, enum in (
+            (KIND_INTRINSIC, Intrinsics),
+            (KIND_KEYWORD, KeyWords),
+            (KIND_PUSH, Types),
+        ):
+            try:
+                members[kind] = [enum[name] for name in enums[enum.__name__]]
+            except KeyError as error:
+                ir_error(self.path, f"{error} is unknown to this compiler, rebuild it")
+
+        memories = [
+            Mem(
+                size,
+                name,
+                self.location(loc),
+                argument=argument,
+                writable=writable,
+                element_size=element_size,
+            )
+            for name, size, loc, argument, writable, element_size in self.metadata[
+                "memories"
+            ]
+        ]
+        for i, mem in enumerate(memories):
+            mem.id = i
+        variables = [
+            Variable(name, self.location(loc), Types[typ], i)
+            for i, (name, loc, typ) in enumerate(self.metadata["variables"])
+        ]
+        procs = [
+            Proc(
+                name,
+                self.location(loc),
+                [Types[typ] for typ in ins],
+                [Types[typ] for typ in outs],
+                [],
+                i,
+            )
+            for i, (name, loc, ins, outs, _) in enumerate(self.metadata["procs"])
+        ]
+
+        opcodes, operands, locations = self.opcodes, self.operands, self.locations
+        files = [path for path, _ in self.metadata["files"]]
+        parallel_loops = 0
+
+        def read_body(start: int, length: int) -> list[BuildIn]:
+            nonlocal parallel_loops
+            body: list[BuildIn] = []
+            i = start
+            while i < start + length:
+                kind, sub = opcodes[i] >> 8, opcodes[i] & 0xFF
+                operand = operands[i]
+                if kind == KIND_PUSH:
+                    # pushes do not have a location
+                    body.append(Push(operand, members[kind][sub]))
+                    i += 1
+                    continue
+                loc = (
+                    files[locations[3 * i]],
+                    locations[3 * i + 1],
+                    locations[3 * i + 2],
+                )
+                i += 1
+                if kind == KIND_INTRINSIC:
+                    body.append(Intrinsic(members[kind][sub], loc))
+                elif kind == KIND_KEYWORD:
+                    body.append(KeyWord(members[kind][sub], loc))
+                elif kind == KIND_PUSH_MEM:
+                    body.append(PushMem(memories[operand].name, loc, operand))
+                elif kind == KIND_PUSH_MEM_LENGTH:
+                    body.append(PushMemLength(memories[operand].name, loc, operand))
+                elif kind == KIND_ARRAY_GET:
+                    body.append(ArrayGet(memories[operand].name, loc, operand))
+                elif kind == KIND_ARRAY_SET:
+                    body.append(ArraySet(memories[operand].name, loc, operand))
+                elif kind == KIND_PUSH_STR:
+                    body.append(PushStr(loc, operand))
+                elif kind == KIND_CALL:
+                    body.append(Call(procs[operand].name, loc, operand))
+                elif kind == KIND_PUSH_VAR:
+                    body.append(PushVar(variables[operand].name, loc, operand))
+                elif kind == KIND_SET_VAR:
+                    body.append(SetVar(variables[operand].name, loc, operand))
+                elif kind == KIND_PARALLEL_FOR:
+                    # numbered in the order they start, like group_blocks does
+                    loop = ParallelFor(loc, [], parallel_loops)
+                    parallel_loops += 1
+                    loop.body = read_body(i, operand)
+                    body.append(loop)
+                    i += operand
+                elif kind == KIND_COMPTIME:
+                    block = Comptime(loc, read_body(i, operand))
+                    body.append(block)
+                    i += operand
+                else:
+                    ir_error(self.path, f"unknown opcode {opcodes[i - 1]} at {i - 1}")
+            return body
+
+        main_length = self.metadata["main"]
+        body = read_body(0, main_length)
+        start = main_length
+        for proc, (*_, length) in zip(procs, self.metadata["procs"]):
+            proc.body = read_body(start, length)
+            start += length
+        strings = [bytes.fromhex(text) for text in self.metadata["strings"]]
+        return CEAst.AST(Path(files[0]), body, memories, procs, variables, strings)
+
+    def close(self) -> None:
+        for view in (self.operands, self.locations, self.opcodes):
+            view.release()
+        self.map.close()
@@ -1,26 +1,56 @@
 from __future__ import annotations
 
-from src.core import COMMENT  # type: ignore[import]
+from src.core import COMMENT, STRING_QUOTE  # type: ignore[import]
 
 LocType = tuple[str, int, int]
 
 
-def parse_file(file_path: str) -> list[tuple[LocType, str]]:
-    def find_col(line, start, predicate):
-        while start < len(line) and not predicate(line[start]):
-            start += 1
-        return start
-
-    def lex_line(line):
-        col = find_col(line, 0, lambda x: not x.isspace())
-        while col < len(line):
+def find_col(line, start, predicate):
+    while start < len(line) and not predicate(line[start]):
+        start += 1
+    return start
+
+
+def string_end(line, start):
+    """
+    the column after the quote that closes the string literal at `start`, the end of
+    the line if it is never closed
+    """
+    col = start + 1
+    while col < len(line):
+        if line[col] == "\\":
+            col += 2
+        elif line[col] == STRING_QUOTE:
+            return col + 1
+        else:
+            col += 1
+    return len(line.rstrip("\n"))
+
+
+def lex_line(line):
+    """
+    the (column, word) of every word of a line, without the comment.
+    a string literal is one word with its quotes, its spaces and `//` included
+    """
+    col = find_col(line, 0, lambda x: not x.isspace())
+    while col < len(line):
+        if line[col] == STRING_QUOTE:
+            col_end = string_end(line, col)
+        else:
             col_end = find_col(line, col, lambda x: x.isspace())
-            yield col, line[col:col_end]
-            col = find_col(line, col_end, lambda x: not x.isspace())
+            comment = line.find(COMMENT, col, col_end)
+            if comment != -1:
+                if comment > col:
+                    yield col, line[col:comment]
+                return
+        yield col, line[col:col_end]
+        col = find_col(line, col_end, lambda x: not x.isspace())
+
 
+def parse_file(file_path: str) -> list[tuple[LocType, str]]:
     with open(file_path, "r") as f:
         return [
             ((file_path, row, col), word)
             for (row, line) in enumerate(f.readlines())
-            for (col, word) in lex_line(line.split(COMMENT)[0])
+            for (col, word) in lex_line(line)
         ]
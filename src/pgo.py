@@ -0,0 +1,137 @@
+# profile guided optimization builds
+from __future__ import annotations
+
+from pathlib import Path
+
+from src.build import echo_and_call  # type: ignore[import]
+from src.toolchain import BuildOptions, Toolchain  # type: ignore[import]
+
+import subprocess
+import hashlib
+import shutil
+import shlex
+import sys
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Optional
+
+CACHE_DIRECTORY: str = ".corpe-cache"
+
+
+def profile_key(c_file: str, toolchain: Toolchain, flags: list[str]) -> str:
+    """
+    the profile only matches the exact program and build that produced it,
+    so it is keyed by the hash of the generated C, the compiler and the flags
+    """
+    digest = hashlib.sha256()
+    with open(c_file, "rb") as f:
+        digest.update(f.read())
+    digest.update(toolchain.name.encode())
+    digest.update(shlex.join(flags).encode())
+    return digest.hexdigest()[:32]
+
+
+def has_profile(directory: Path) -> bool:
+    return any(directory.rglob("*.gcda"))
+
+
+def train(executable: Path, train_args: list[str], train_input: Optional[str]) -> int:
+    print(f"[CMD] {shlex.join([str(executable), *train_args])}")
+    stdin = open(train_input, "rb") if train_input is not None else subprocess.DEVNULL
+    try:
+        return subprocess.call(
+            [str(executable), *train_args], stdin=stdin, stdout=subprocess.DEVNULL
+        )
+    finally:
+        if train_input is not None:
+            stdin.close()  # type: ignore[union-attr]
+
+
+def build_with_pgo(
+    toolchain: Toolchain,
+    options: BuildOptions,
+    c_file: str,
+    executable: str,
+    train_args: list[str],
+    train_input: Optional[str] = None,
+) -> int:
+    """
+    1. builds an instrumented executable with -fprofile-generate
+    2. runs it with `train_args` (and `train_input` as stdin) to collect a profile
+    3. rebuilds the executable with -fprofile-use
+    the first two steps are skipped when the profile for this exact program and
+    build is already in the cache next to the C file
+    """
+    if not toolchain.supports_pgo:
+        print(
+            f"[ERROR] profile guided builds are not supported with {toolchain.name}",
+            file=sys.stderr,
+        )
+        return 1
+
+    compile_flags = toolchain.compile_flags(options)
+    link_flags = toolchain.link_flags(options)
+    directory = (
+        Path(c_file).absolute().parent
+        / CACHE_DIRECTORY
+        / "pgo"
+        / profile_key(c_file, toolchain, compile_flags + link_flags)
+    )
+    directory.mkdir(parents=True, exist_ok=True)
+    # the profile is found through the name of the object file, so both builds
+    # compile the same source to the same object
+    source = directory / "program.c"
+    obj = directory / "program.o"
+    shutil.copyfile(c_file, source)
+
+    if has_profile(directory):
+        print(f"[INFO] using the cached profile in {directory}")
+    else:
+        print("[INFO] building the instrumented executable...")
+        instrumented = directory / "instrumented.exe"
+        if echo_and_call(
+            [
+                toolchain.name,
+                "-c",
+                str(source),
+                "-o",
+                str(obj),
+                *compile_flags,
+                f"-fprofile-generate={directory}",
+            ]
+        ) or echo_and_call(
+            [
+                toolchain.name,
+                str(obj),
+                "-o",
+                str(instrumented),
+                *link_flags,
+                f"-fprofile-generate={directory}",
+            ]
+        ):
+            return 1
+        print("[INFO] training...")
+        exit_code = train(instrumented, train_args, train_input)
+        if exit_code:
+            print(f"[WARN] the training run exited with {exit_code}", file=sys.stderr)
+        if not has_profile(directory):
+            print("[ERROR] the training run did not write a profile", file=sys.stderr)
+            return 1
+
+    print("[INFO] building with the profile...")
+    if echo_and_call(
+        [
+            toolchain.name,
+            "-c",
+            str(source),
+            "-o",
+            str(obj),
+            *compile_flags,
+            f"-fprofile-use={directory}",
+            "-fprofile-correction",
+            "-Wno-missing-profile",
+        ]
+    ):
+        return 1
+    return echo_and_call([toolchain.name, str(obj), "-o", executable, *link_flags])
@@ -0,0 +1,189 @@
+# -stats: runs the executable under wait4(2) and reports the resources of every run
+from __future__ import annotations
+
+from dataclasses import dataclass, asdict
+
+import subprocess
+import statistics
+import shlex
+import json
+import sys
+import os
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Optional
+
+
+@dataclass
+class RunStats:
+    exit_code: int
+    wall_s: float
+    user_s: float
+    system_s: float
+    # in kilobytes, like getrusage(2) reports it on linux
+    max_rss_kb: int
+    minor_page_faults: int
+    major_page_faults: int
+    voluntary_context_switches: int
+    involuntary_context_switches: int
+
+
+# what run_checks allocates in the compiler before it runs a program again
+CHECK_BALLAST_BYTES: int = 200 * 1024 * 1024
+
+# the fields that are summarized over the runs, with how they are shown
+SUMMARY_FIELDS: dict[str, tuple[str, float]] = {
+    "wall_s": ("wall (ms)", 1000),
+    "user_s": ("user (ms)", 1000),
+    "system_s": ("system (ms)", 1000),
+    "max_rss_kb": ("max rss (KB)", 1),
+    "minor_page_faults": ("minor faults", 1),
+    "major_page_faults": ("major faults", 1),
+    "voluntary_context_switches": ("voluntary switches", 1),
+    "involuntary_context_switches": ("involuntary switches", 1),
+}
+
+
+# runs the executable for run_with_stats and writes a line of numbers per run to the
+# file descriptor in its first argument. linux keeps the peak RSS of the process that
+# calls execve in the max RSS of the program, so a child of the compiler would report
+# the memory of the compiler. this is a fresh interpreter that imports nothing, the
+# programs that it forks start from its few megabytes instead
+RUNNER: str = """
+import time, os, sys
+fd, repeat, *cmd = sys.argv[1:]
+os.set_inheritable(int(fd), False)
+for _ in range(int(repeat)):
+    start = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.execvp(cmd[0], cmd)
+        except OSError as error:
+            os.write(2, f"[ERROR] {cmd[0]}: {error.strerror}\\n".encode())
+        os._exit(127)
+    _, status, usage = os.wait4(pid, 0)
+    wall = time.perf_counter() - start
+    numbers = [
+        os.waitstatus_to_exitcode(status), wall, usage.ru_utime, usage.ru_stime,
+        usage.ru_maxrss, usage.ru_minflt, usage.ru_majflt, usage.ru_nvcsw,
+        usage.ru_nivcsw,
+    ]
+    os.write(int(fd), (" ".join(map(str, numbers)) + "\\n").encode())
+"""
+
+
+def run_with_stats(cmd: list[str], repeat: int = 1) -> list[RunStats]:
+    """
+    runs `cmd` `repeat` times from RUNNER, the usage of wait4 only covers the
+    program and not the compiler. the max RSS can not go below the memory of
+    RUNNER (about 5MB), it is a floor that smaller programs all report
+    """
+    read_fd, write_fd = os.pipe()
+    runner = subprocess.Popen(
+        [sys.executable, "-S", "-I", "-c", RUNNER, str(write_fd), str(repeat), *cmd],
+        pass_fds=(write_fd,),
+    )
+    os.close(write_fd)
+    # read while it runs, the lines of many runs do not fit in the pipe
+    with os.fdopen(read_fd) as results:
+        lines = results.read().splitlines()
+    runner.wait()
+    runs = []
+    for line in lines:
+        exit_code, wall, user, system, *counts = line.split()
+        runs.append(
+            RunStats(
+                int(exit_code),
+                float(wall),
+                float(user),
+                float(system),
+                *map(int, counts),
+            )
+        )
+    return runs
+
+
+def run_checks() -> None:
+    """
+    the max RSS of a run does not grow with the memory of the compiler, this is a
+    development time check (see tests.py -checks)
+    """
+    cmd = [sys.executable, "-S", "-I", "-c", "pass"]
+    before = run_with_stats(cmd)[0].max_rss_kb
+    # written, so the pages are resident
+    ballast = b"\1" * CHECK_BALLAST_BYTES
+    after = run_with_stats(cmd)[0].max_rss_kb
+    del ballast
+    if after - before > CHECK_BALLAST_BYTES // 1024 // 10:
+        print(
+            f"[ERROR] the max RSS of a run went from {before}KB to {after}KB "
+            f"when the compiler grew by {CHECK_BALLAST_BYTES // 1024}KB",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+
+def summarize(runs: list[RunStats]) -> dict[str, dict[str, float]]:
+    summary = {}
+    for field in SUMMARY_FIELDS:
+        values = [getattr(run, field) for run in runs]
+        summary[field] = {
+            "min": min(values),
+            "median": statistics.median(values),
+            "mean": statistics.fmean(values),
+            "max": max(values),
+            "stdev": statistics.stdev(values) if len(values) > 1 else 0.0,
+        }
+    return summary
+
+
+def report(cmd: list[str], runs: list[RunStats]) -> dict[str, Any]:
+    return {
+        "command": cmd,
+        "runs": [asdict(run) for run in runs],
+        "summary": summarize(runs),
+    }
+
+
+def print_report(result: dict[str, Any]) -> None:
+    """
+    to stderr, so it does not mix with the output of the program
+    """
+    runs = result["runs"]
+    exit_codes = sorted({run["exit_code"] for run in runs})
+    print(
+        f"[STATS] {len(runs)} run{'s' if len(runs) != 1 else ''} of "
+        f"{shlex.join(result['command'])}, exit code {', '.join(map(str, exit_codes))}",
+        file=sys.stderr,
+    )
+    columns = ["min", "median", "mean", "max", "stdev"]
+    print(
+        f"[STATS] {'':22}" + "".join(f"{column:>12}" for column in columns),
+        file=sys.stderr,
+    )
+    for field, (name, scale) in SUMMARY_FIELDS.items():
+        values = result["summary"][field]
+        print(
+            f"[STATS] {name:22}"
+            + "".join(f"{values[column] * scale:12.2f}" for column in columns),
+            file=sys.stderr,
+        )
+
+
+def run_and_report(
+    cmd: list[str], repeat: int = 1, json_path: Optional[str] = None
+) -> int:
+    """
+    runs `cmd` `repeat` times, prints the summary and saves it as JSON to `json_path`.
+    returns the exit code of the last run
+    """
+    print(f"[CMD] {shlex.join(cmd)}")
+    runs = run_with_stats(cmd, repeat)
+    result = report(cmd, runs)
+    print_report(result)
+    if json_path is not None:
+        with open(json_path, "w") as f:
+            f.write(json.dumps(result, indent=2) + "\n")
+    return runs[-1].exit_code
@@ -0,0 +1,169 @@
+# the C compilers that the generated C can be compiled with
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+import shutil
+import shlex
+import sys
+import os
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Optional
+
+
+@dataclass
+class BuildOptions:
+    optimization: str = "-O0"
+    march_native: bool = False
+    lto: bool = False
+    static: bool = False
+    cflags: list[str] = field(default_factory=list)
+    ldflags: list[str] = field(default_factory=list)
+
+
+@dataclass
+class Toolchain:
+    name: str
+    supports_march_native: bool
+    supports_lto: bool
+    # the default options of every profile, `dev` is tuned for compile time
+    # and `release` for the speed of the executable
+    profiles: dict[str, BuildOptions]
+    # gcc style -fprofile-generate=<dir>/-fprofile-use=<dir> with .gcda files
+    supports_pgo: bool = False
+    # the flag that turns on OpenMP for parallel-for, without one the loops run serially
+    openmp_flag: Optional[str] = None
+
+    def available(self) -> bool:
+        return shutil.which(self.name) is not None
+
+    def warn_unsupported(self, feature: str) -> None:
+        print(
+            f"[WARN] {self.name} does not support {feature}, ignoring it",
+            file=sys.stderr,
+        )
+
+    def enable_openmp(self, options: BuildOptions) -> None:
+        if self.openmp_flag is None:
+            print(
+                f"[WARN] {self.name} does not support OpenMP, parallel-for runs serially",
+                file=sys.stderr,
+            )
+            return
+        options.cflags.append(self.openmp_flag)
+        options.ldflags.append(self.openmp_flag)
+
+    def compile_flags(self, options: BuildOptions) -> list[str]:
+        flags = [options.optimization]
+        if options.march_native:
+            if self.supports_march_native:
+                flags.append("-march=native")
+            else:
+                self.warn_unsupported("-march=native")
+        if options.lto:
+            if self.supports_lto:
+                flags.append("-flto")
+            else:
+                self.warn_unsupported("-flto")
+        flags.extend(options.cflags)
+        return flags
+
+    def link_flags(self, options: BuildOptions) -> list[str]:
+        flags = []
+        if options.lto and self.supports_lto:
+            # the optimizations happen at link time with lto
+            flags.extend([options.optimization, "-flto"])
+            if options.march_native and self.supports_march_native:
+                flags.append("-march=native")
+        if options.static:
+            flags.append("-static")
+        flags.extend(options.ldflags)
+        flags.append("-lm")
+        return flags
+
+
+TOOLCHAINS: dict[str, Toolchain] = {
+    "gcc": Toolchain(
+        "gcc",
+        supports_march_native=True,
+        supports_lto=True,
+        profiles={
+            "dev": BuildOptions("-O0"),
+            "release": BuildOptions("-O3", march_native=True, lto=True),
+        },
+        supports_pgo=True,
+        openmp_flag="-fopenmp",
+    ),
+    "clang": Toolchain(
+        "clang",
+        supports_march_native=True,
+        supports_lto=True,
+        profiles={
+            "dev": BuildOptions("-O0"),
+            "release": BuildOptions("-O3", march_native=True, lto=True),
+        },
+        openmp_flag="-fopenmp",
+    ),
+    # tcc compiles very fast but barely optimizes, so it is only the first choice for dev
+    "tcc": Toolchain(
+        "tcc",
+        supports_march_native=False,
+        supports_lto=False,
+        profiles={
+            "dev": BuildOptions("-O0"),
+            "release": BuildOptions("-O2"),
+        },
+    ),
+}
+
+# the order in which the compilers are tried when none is asked for
+PREFERENCES: dict[str, list[str]] = {
+    "dev": ["tcc", "gcc", "clang"],
+    "release": ["gcc", "clang", "tcc"],
+}
+DEFAULT_TOOLCHAIN: str = "gcc"
+
+
+def select_toolchain(name: Optional[str], profile: Optional[str]) -> Toolchain:
+    """
+    returns the asked for compiler or the first available one for the profile,
+    without a profile it is gcc like it always was
+    """
+    if name is not None:
+        if name not in TOOLCHAINS:
+            print(
+                f"[ERROR] unknown C compiler {name}, expected one of {list(TOOLCHAINS)}",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        if not TOOLCHAINS[name].available():
+            print(f"[ERROR] {name} was not found", file=sys.stderr)
+            sys.exit(1)
+        return TOOLCHAINS[name]
+
+    if profile is None:
+        return TOOLCHAINS[DEFAULT_TOOLCHAIN]
+
+    for candidate in PREFERENCES[profile]:
+        if TOOLCHAINS[candidate].available():
+            return TOOLCHAINS[candidate]
+    print(f"[ERROR] none of {PREFERENCES[profile]} were found", file=sys.stderr)
+    sys.exit(1)
+
+
+def profile_options(toolchain: Toolchain, profile: Optional[str]) -> BuildOptions:
+    """
+    a copy of the options of the profile (the default options without one) with
+    CFLAGS and LDFLAGS from the environment added
+    """
+    base = toolchain.profiles[profile] if profile is not None else BuildOptions()
+    return BuildOptions(
+        base.optimization,
+        base.march_native,
+        base.lto,
+        base.static,
+        base.cflags + shlex.split(os.environ.get("CFLAGS", "")),
+        base.ldflags + shlex.split(os.environ.get("LDFLAGS", "")),
+    )
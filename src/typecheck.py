@@ -1,52 +1,260 @@
 # a script to do type checking
 from __future__ import annotations
 
-from src.core import Patterns, CWD, BuildIn  # type: ignore[import]
 import src.CEAst as CEAst  # type: ignore[import]
 
-from typing import Optional
+from dataclasses import dataclass, field
 
 from src.core import (  # type: ignore[import]
-    Patterns,
-    CWD,
     BuildIn,
     Intrinsics,
     Intrinsic,
     KeyWords,
     KeyWord,
     mapping,
-    mapping_names,
     Types,
-    LocType,
     Push,
-    Mem,
     PushMem,
+    PushMemLength,
+    PushStr,
+    Proc,
+    Call,
+    ParallelFor,
+    Comptime,
+    PushVar,
+    SetVar,
+    ArrayGet,
+    ArraySet,
+    ARRAY_GET_SUFFIX,
+    ARRAY_SET_SUFFIX,
 )
 
-from collections import deque
-
 import sys
 
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Iterator, Optional, Protocol, Union
+
+    from src.core import ExpandedFromNode  # type: ignore[import]
+
+    # a type on the stack or a type variable (a lowercase letter) in a signature
+    SignatureType = Union[Types, str]
+
+    # what the errors need from an operation, every node of the AST has it
+    class Node(Protocol):
+        expanded_from: Optional[ExpandedFromNode]
+
+        def format_location(self) -> str: ...
 
-DataStackType = deque[CEAst.Types]
 
+# the data stack of the type checker is a persistent linked list, pushing creates a new
+# node and popping only moves the top, so taking a snapshot at if/while/do is O(1) and
+# the snapshots share everything that is below them
+class TypeStackNode:
+    __slots__ = ("typ", "below", "depth", "hash")
 
-def types_to_human(typs: list[CEAst.Types]) -> list[str]:
+    def __init__(self, typ: Types, below: Optional[TypeStackNode]) -> None:
+        self.typ = typ
+        self.below = below
+        if below is None:
+            self.depth = 1
+            self.hash = hash((typ, 0))
+        else:
+            self.depth = below.depth + 1
+            self.hash = hash((typ, below.hash))
+
+
+def snapshot_depth(snapshot: Optional[TypeStackNode]) -> int:
+    return 0 if snapshot is None else snapshot.depth
+
+
+def snapshots_equal(
+    snapshot1: Optional[TypeStackNode], snapshot2: Optional[TypeStackNode]
+) -> bool:
+    """
+    compares the depth and the hash first, and stops walking the stacks
+    as soon as they share a node
+    """
+    while snapshot1 is not snapshot2:
+        if snapshot1 is None or snapshot2 is None:
+            return False
+        if snapshot1.depth != snapshot2.depth or snapshot1.hash != snapshot2.hash:
+            return False
+        if snapshot1.typ != snapshot2.typ:
+            return False
+        snapshot1 = snapshot1.below
+        snapshot2 = snapshot2.below
+    return True
+
+
+def snapshot_types(snapshot: Optional[TypeStackNode]) -> list[Types]:
+    """
+    the types of a snapshot from the bottom to the top of the stack
+    """
+    types = []
+    while snapshot is not None:
+        types.append(snapshot.typ)
+        snapshot = snapshot.below
+    types.reverse()
+    return types
+
+
+class TypeStack:
+    __slots__ = ("top",)
+
+    def __init__(self, top: Optional[TypeStackNode] = None) -> None:
+        self.top = top
+
+    def __len__(self) -> int:
+        return snapshot_depth(self.top)
+
+    def __iter__(self) -> Iterator[Types]:
+        return iter(snapshot_types(self.top))
+
+    def push(self, typ: Types) -> None:
+        self.top = TypeStackNode(typ, self.top)
+
+    def pop(self) -> Types:
+        assert self.top is not None, "pop from an empty type stack"
+        typ = self.top.typ
+        self.top = self.top.below
+        return typ
+
+    def peek(self, count: int) -> list[Types]:
+        """
+        the top `count` types from the bottom to the top of the stack
+        """
+        types: list[Types] = []
+        node = self.top
+        while node is not None and len(types) < count:
+            types.append(node.typ)
+            node = node.below
+        types.reverse()
+        return types
+
+    def clear(self) -> None:
+        self.top = None
+
+
+# the stack effect of an intrinsic, the inputs and the outputs are from the bottom
+# to the top of the stack. lowercase strings are type variables that match any type
+@dataclass(frozen=True)
+class Signature:
+    ins: tuple[SignatureType, ...]
+    outs: tuple[SignatureType, ...]
+    clears: bool = False
+
+
+def binary_op(result: Types = Types.INT) -> Signature:
+    return Signature((Types.INT, Types.INT), (result,))
+
+
+SIGNATURES: dict[Intrinsics, Signature] = {
+    Intrinsics.ADD: binary_op(),
+    Intrinsics.SUB: binary_op(),
+    Intrinsics.DIV: binary_op(),
+    Intrinsics.MOD: binary_op(),
+    Intrinsics.MUL: binary_op(),
+    Intrinsics.POW: binary_op(),
+    Intrinsics.BIN_AND: binary_op(),
+    Intrinsics.BIN_OR: binary_op(),
+    Intrinsics.BIN_INV: Signature((Types.INT,), (Types.INT,)),
+    Intrinsics.BIN_XOR: binary_op(),
+    Intrinsics.RSHIFT: binary_op(),
+    Intrinsics.LSHIFT: binary_op(),
+    Intrinsics.PRINT: Signature((Types.INT,), ()),
+    Intrinsics.PUTC: Signature((Types.INT,), ()),
+    Intrinsics.LT: binary_op(),
+    Intrinsics.LE: binary_op(),
+    Intrinsics.EQ: binary_op(),
+    Intrinsics.NE: binary_op(),
+    Intrinsics.GE: binary_op(),
+    Intrinsics.GT: binary_op(),
+    Intrinsics.DROP: Signature(("a",), ()),
+    Intrinsics.DROP2: Signature(("a", "b"), ()),
+    Intrinsics.DUP: Signature(("a",), ("a", "a")),
+    Intrinsics.DUP2: Signature(("a",), ("a", "a", "a")),
+    Intrinsics.SWAP: Signature(("a", "b"), ("b", "a")),
+    Intrinsics.CLEAR: Signature((), (), clears=True),
+    Intrinsics.DBG_PRINT_STACK: Signature((), ()),
+    Intrinsics.CAST_INT: Signature(("a",), (Types.INT,)),
+    Intrinsics.CAST_PTR: Signature(("a",), (Types.POINTER,)),
+    Intrinsics.STORE8: Signature((Types.INT, Types.POINTER), ()),
+    Intrinsics.LOAD8: Signature((Types.POINTER,), (Types.INT,)),
+    Intrinsics.STORE16: Signature((Types.INT, Types.POINTER), ()),
+    Intrinsics.LOAD16: Signature((Types.POINTER,), (Types.INT,)),
+    Intrinsics.STORE32: Signature((Types.INT, Types.POINTER), ()),
+    Intrinsics.LOAD32: Signature((Types.POINTER,), (Types.INT,)),
+    Intrinsics.STORE64: Signature((Types.INT, Types.POINTER), ()),
+    Intrinsics.LOAD64: Signature((Types.POINTER,), (Types.INT,)),
+    Intrinsics.READ: Signature((Types.POINTER, Types.INT), (Types.INT,)),
+    Intrinsics.READ_FILE: Signature(
+        (Types.POINTER, Types.INT, Types.POINTER), (Types.INT,)
+    ),
+    Intrinsics.WRITE: Signature((Types.POINTER, Types.INT), (Types.INT,)),
+    # ptr count byte --
+    Intrinsics.FILL: Signature((Types.POINTER, Types.INT, Types.INT), ()),
+    # source destination count --
+    Intrinsics.COPY: Signature((Types.POINTER, Types.POINTER, Types.INT), ()),
+    # ptr ptr count -- -1, 0 or 1
+    Intrinsics.COMPARE: Signature(
+        (Types.POINTER, Types.POINTER, Types.INT), (Types.INT,)
+    ),
+    Intrinsics.PUTS: Signature((Types.POINTER, Types.INT), ()),
+}
+
+# <start> <end> parallel-for
+PARALLEL_FOR_SIGNATURE = Signature((Types.INT, Types.INT), ())
+# the iterations of a parallel-for run at the same time, these would race on the
+# output buffer, the files or the stack of the main thread
+PARALLEL_UNSAFE: set[Intrinsics] = {
+    Intrinsics.PRINT,
+    Intrinsics.PUTC,
+    Intrinsics.CLEAR,
+    Intrinsics.DBG_PRINT_STACK,
+    Intrinsics.READ,
+    Intrinsics.READ_FILE,
+    Intrinsics.WRITE,
+    Intrinsics.PUTS,
+}
+
+# `<array>.get` (index -- value) and `<array>.set` (value index --)
+ARRAY_GET_SIGNATURE = Signature((Types.INT,), (Types.INT,))
+ARRAY_SET_SIGNATURE = Signature((Types.INT, Types.INT), ())
+
+
+def run_checks() -> None:
+    """
+    every intrinsic needs a signature, this is a development time check (see tests.py -checks)
+    """
+    err: bool = False
+    for intrinsic in Intrinsics:
+        if intrinsic not in SIGNATURES:
+            print(f"{intrinsic} does not have a signature", file=sys.stderr)
+            err = True
+
+    if err:
+        sys.exit(1)
+
+
+def types_to_human(typs: list[SignatureType]) -> list[str]:
     return [typ_to_human(typ) for typ in typs]
 
 
-def typ_to_human(typ: CEAst.Types) -> str:
+def typ_to_human(typ: SignatureType) -> str:
     if typ == CEAst.Types.INT:
         return "int"
     if typ == CEAst.Types.POINTER:
         return "pointer"
+    if isinstance(typ, str):
+        return "any"
     raise NotADirectoryError(typ)
 
 
 def typecheck_error(
     location: str,
     details: str,
-    node: Optional[BuildIn] = None,
+    node: Optional[Node] = None,
     exitcode: int = 1,
     noexit: bool = False,
 ) -> None:
@@ -57,153 +265,14 @@ def typecheck_error(
         while expanded_from is not None:
             typecheck_note(
                 expanded_from.format_location(),
-                f"expansion from {node.expanded_from.word}",
+                f"expansion from {expanded_from.word}",
+                noexit=True,
             )
             expanded_from = expanded_from.child
     if not noexit:
         sys.exit(exitcode)
 
 
-def typecheck_node_expect_ptr_int_return_none(
-    stack: DataStackType, node: BuildIn, name: str
-) -> None:
-    if len(stack) < 2:
-        typecheck_error(
-            node.format_location(),
-            f"{name} expects one integer and one ptr on the stack but found {'one element in the stack' if len(stack) == 1 else 'no elements on the stack'}",
-        )
-    types = [stack[-1], stack[-2]]
-    if types != [CEAst.Types.POINTER, CEAst.Types.INT]:
-        typecheck_error(
-            node.format_location(),
-            f"{name} expected one pointer and one integer on top of the stack but found {types_to_human(types)}",
-        )
-    stack.pop()
-    stack.pop()
-
-
-def typecheck_node_expect_ptr_return_int(
-    stack: DataStackType, node: BuildIn, name: str
-) -> None:
-    if len(stack) < 1:
-        typecheck_error(
-            node.format_location(),
-            f"{name} expects one integer and one ptr on the stack but found {'one element in the stack' if len(stack) == 1 else 'no elements on the stack'}",
-        )
-    types = [stack[-1]]
-    if types != [CEAst.Types.POINTER]:
-        typecheck_error(
-            node.format_location(),
-            f"{name} expected two integers on top of the stack but found {types_to_human(types)}",
-        )
-    stack.pop()
-    stack.append(Types.INT)
-
-
-def typecheck_node_expect_two_ints_return_two_ints(
-    stack: DataStackType, node: BuildIn, name: str
-) -> None:
-    if len(stack) < 2:
-        typecheck_error(
-            node.format_location(),
-            f"{name} expects two integers on the stack but found {'one' if len(stack) == 1 else 'none'}",
-        )
-    types = [stack[-1], stack[-2]]
-    if types != [CEAst.Types.INT, CEAst.Types.INT]:
-        typecheck_error(
-            node.format_location(),
-            f"{name} expected two integers on top of the stack but found {types_to_human(types)}",
-        )
-
-
-def typecheck_node_expect_two_ints_return_one_int(
-    stack: DataStackType, node: BuildIn, name: str
-) -> None:
-    if len(stack) < 2:
-        typecheck_error(
-            node.format_location(),
-            f"{name} expects two integers on the stack but found {'one' if len(stack) == 1 else 'none'}",
-        )
-    types = [stack[-1], stack[-2]]
-    if types != [CEAst.Types.INT, CEAst.Types.INT]:
-        typecheck_error(
-            node.format_location(),
-            f"{name} expected two integers on top of the stack but found {types_to_human(types)}",
-        )
-    stack.pop()
-
-
-def typecheck_node_expect_two_ints_return_none(
-    stack: DataStackType, node: BuildIn, name: str
-) -> None:
-    if len(stack) < 2:
-        typecheck_error(
-            node.format_location(),
-            f"{name} expects two integers on the stack but found {'one' if len(stack) == 1 else 'none'}",
-        )
-    types = [stack[-1], stack[-2]]
-    if types != [CEAst.Types.INT, CEAst.Types.INT]:
-        typecheck_error(
-            node.format_location(),
-            f"{name} expected two integers on top of the stack but found {types_to_human(types)}",
-        )
-    stack.pop()
-    stack.pop()
-
-
-def typecheck_node_expect_one_int_return_one_int(
-    stack: DataStackType, node: BuildIn, name: str
-) -> None:
-    if len(stack) < 1:
-        typecheck_error(
-            node.format_location(),
-            f"{name} expects one integer on the stack but found none",
-        )
-    types = [stack[-1]]
-    if types != [CEAst.Types.INT]:
-        typecheck_error(
-            node.format_location(),
-            f"{name} expected one integer on top of the stack but found {types_to_human(types)}",
-        )
-
-
-def typecheck_node_expect_one_int_return_none(
-    stack: DataStackType, node: BuildIn, name: str
-) -> None:
-    if len(stack) < 1:
-        typecheck_error(
-            node.format_location(),
-            f"{name} expects one integer on the stack but found none",
-        )
-    types = [stack[-1]]
-    if types != [CEAst.Types.INT]:
-        typecheck_error(
-            node.format_location(),
-            f"{name} expected one integer on top of the stack but found {types_to_human(types)}",
-        )
-    stack.pop()
-
-
-def typecheck_node_must_have_two_elements(
-    stack: DataStackType, node: BuildIn, name: str
-) -> None:
-    if len(stack) < 2:
-        typecheck_error(
-            node.format_location(),
-            f"{name} expects at least two elements on the stack but found {'one' if len(stack) == 1 else 'none'}",
-        )
-
-
-def typecheck_node_must_have_one_element(
-    stack: DataStackType, node: BuildIn, name: str
-) -> None:
-    if len(stack) < 1:
-        typecheck_error(
-            node.format_location(),
-            f"{name} expects at least one element on the stack but found none",
-        )
-
-
 def typecheck_note(
     location: str, details: str, exitcode: int = 1, noexit: bool = False
 ) -> None:
@@ -212,232 +281,377 @@ def typecheck_note(
         sys.exit(exitcode)
 
 
-def stack_equality(stack1: DataStackType, stack2: DataStackType) -> bool:
-    return list(stack1) == list(stack2)
+@dataclass
+class TypecheckError:
+    location: str
+    details: str
+    node: Optional[Node] = None
+    notes: list[tuple[str, str]] = field(default_factory=list)
 
+    def report(self) -> None:
+        typecheck_error(self.location, self.details, self.node, noexit=True)
+        for location, details in self.notes:
+            typecheck_note(location, details, noexit=True)
 
-def typecheck_AST(ast: CEAst.AST) -> None:
-    stack: DataStackType = deque()
-    stacks: list[tuple[DataStackType, BuildIn]] = []
-
-    for node in ast.body:
-        if node == Push:
-            stack.append(node.typ)
-        elif node == PushMem:
-            stack.append(Types.POINTER)
-        elif node == Intrinsic:
-            if node.typ == Intrinsics.ADD:
-                typecheck_node_expect_two_ints_return_one_int(
-                    stack, node, mapping[Intrinsics.ADD]
-                )
-            elif node.typ == Intrinsics.SUB:
-                typecheck_node_expect_two_ints_return_one_int(
-                    stack, node, mapping[Intrinsics.SUB]
-                )
-            elif node.typ == Intrinsics.DIV:
-                typecheck_node_expect_two_ints_return_one_int(
-                    stack, node, mapping[Intrinsics.DIV]
-                )
-            elif node.typ == Intrinsics.MOD:
-                typecheck_node_expect_two_ints_return_one_int(
-                    stack, node, mapping[Intrinsics.MOD]
-                )
-            elif node.typ == Intrinsics.MUL:
-                typecheck_node_expect_two_ints_return_one_int(
-                    stack, node, mapping[Intrinsics.MUL]
-                )
-            elif node.typ == Intrinsics.POW:
-                typecheck_node_expect_two_ints_return_one_int(
-                    stack, node, mapping[Intrinsics.POW]
-                )
-            elif node.typ == Intrinsics.BIN_AND:
-                typecheck_node_expect_two_ints_return_one_int(
-                    stack, node, mapping[Intrinsics.BIN_AND]
-                )
-            elif node.typ == Intrinsics.BIN_OR:
-                typecheck_node_expect_two_ints_return_one_int(
-                    stack, node, mapping[Intrinsics.BIN_OR]
-                )
-            elif node.typ == Intrinsics.BIN_INV:
-                typecheck_node_expect_one_int_return_one_int(
-                    stack, node, mapping[Intrinsics.BIN_INV]
-                )
-            elif node.typ == Intrinsics.BIN_XOR:
-                typecheck_node_expect_two_ints_return_one_int(
-                    stack, node, mapping[Intrinsics.BIN_XOR]
-                )
-            elif node.typ == Intrinsics.RSHIFT:
-                typecheck_node_expect_two_ints_return_one_int(
-                    stack, node, mapping[Intrinsics.RSHIFT]
-                )
-            elif node.typ == Intrinsics.LSHIFT:
-                typecheck_node_expect_two_ints_return_one_int(
-                    stack, node, mapping[Intrinsics.LSHIFT]
-                )
-            elif node.typ == Intrinsics.PRINT:
-                typecheck_node_expect_one_int_return_none(
-                    stack, node, mapping[Intrinsics.PRINT]
-                )
-            elif node.typ == Intrinsics.PUTC:
-                typecheck_node_expect_one_int_return_none(
-                    stack, node, mapping[Intrinsics.PUTC]
-                )
-            elif node.typ == Intrinsics.LT:
-                typecheck_node_expect_two_ints_return_one_int(
-                    stack, node, mapping[Intrinsics.LT]
-                )
-            elif node.typ == Intrinsics.LE:
-                typecheck_node_expect_two_ints_return_one_int(
-                    stack, node, mapping[Intrinsics.LE]
-                )
-            elif node.typ == Intrinsics.EQ:
-                typecheck_node_expect_two_ints_return_one_int(
-                    stack, node, mapping[Intrinsics.EQ]
-                )
-            elif node.typ == Intrinsics.NE:
-                typecheck_node_expect_two_ints_return_one_int(
-                    stack, node, mapping[Intrinsics.NE]
-                )
-            elif node.typ == Intrinsics.GE:
-                typecheck_node_expect_two_ints_return_one_int(
-                    stack, node, mapping[Intrinsics.GE]
-                )
-            elif node.typ == Intrinsics.GT:
-                typecheck_node_expect_two_ints_return_one_int(
-                    stack, node, mapping[Intrinsics.GT]
-                )
-            elif node.typ == Intrinsics.DROP:
-                typecheck_node_must_have_one_element(
-                    stack, node, mapping[Intrinsics.DROP]
-                )
-                stack.pop()
-            elif node.typ == Intrinsics.DROP2:
-                typecheck_node_must_have_two_elements(
-                    stack, node, mapping[Intrinsics.DROP2]
-                )
-                stack.pop()
-                stack.pop()
-            elif node.typ == Intrinsics.DUP:
-                typecheck_node_must_have_one_element(
-                    stack, node, mapping[Intrinsics.DUP]
+
+def apply_signature(
+    stack: TypeStack,
+    signature: Signature,
+    node: Node,
+    name: str,
+    errors: list[TypecheckError],
+) -> None:
+    """
+    checks the inputs of the signature against the stack and replaces them with
+    the outputs. on an error the outputs are still pushed so checking can go on
+    """
+    if signature.clears:
+        stack.clear()
+        return
+
+    count = len(signature.ins)
+    found = stack.peek(count)
+    bindings: dict[str, Types] = {}
+    ok = len(found) == count
+    if not ok:
+        errors.append(
+            TypecheckError(
+                node.format_location(),
+                f"{name} expects {count} element{'s' if count != 1 else ''} on the stack "
+                f"({', '.join(types_to_human(list(signature.ins)))}) but found {len(found)}",
+                node,
+            )
+        )
+    else:
+        for expected, typ in zip(signature.ins, found):
+            if isinstance(expected, str):
+                bindings.setdefault(expected, typ)
+            elif expected != typ:
+                ok = False
+        if not ok:
+            errors.append(
+                TypecheckError(
+                    node.format_location(),
+                    f"{name} expected {types_to_human(list(signature.ins))} on top of the stack "
+                    f"but found {types_to_human(list(found))}",
+                    node,
                 )
-                a = stack[-1]
-                stack.append(a)
-            elif node.typ == Intrinsics.DUP2:
-                typecheck_node_must_have_one_element(
-                    stack, node, mapping[Intrinsics.DUP2]
+            )
+
+    for _ in found:
+        stack.pop()
+    for out in signature.outs:
+        if isinstance(out, str):
+            # an unbound type variable only happens after an error
+            stack.push(bindings.get(out, Types.INT))
+        else:
+            stack.push(out)
+
+
+def proc_signature(proc: Proc) -> Signature:
+    return Signature(tuple(proc.ins), tuple(proc.outs))
+
+
+def parallel_unsafe_procs(ast: CEAst.AST) -> dict[int, Intrinsic]:
+    """
+    the ids of the procs that use a word of PARALLEL_UNSAFE, themselves or through the
+    procs that they call, with the first of those words that was found
+    """
+    unsafe: dict[int, Intrinsic] = {}
+    # callee -> the procs that call it
+    callers: dict[int, list[int]] = {}
+    for proc in ast.procs:
+        bodies = [proc.body]
+        while bodies:
+            for node in bodies.pop():
+                if isinstance(node, Intrinsic) and node.typ in PARALLEL_UNSAFE:
+                    unsafe.setdefault(proc.id, node)
+                elif isinstance(node, Call):
+                    callers.setdefault(node.id, []).append(proc.id)
+                elif isinstance(node, ParallelFor) or isinstance(node, Comptime):
+                    bodies.append(node.body)
+    todo = list(unsafe)
+    while todo:
+        callee = todo.pop()
+        for caller in callers.get(callee, []):
+            if caller not in unsafe:
+                unsafe[caller] = unsafe[callee]
+                todo.append(caller)
+    return unsafe
+
+
+def block_name(block: Union[ParallelFor, Comptime]) -> str:
+    return mapping[
+        KeyWords.PARALLEL_FOR if isinstance(block, ParallelFor) else KeyWords.COMPTIME
+    ]
+
+
+def typecheck_body(
+    body: list[BuildIn],
+    stack: TypeStack,
+    ast: CEAst.AST,
+    errors: list[TypecheckError],
+    proc: Optional[Proc] = None,
+    restricted: Optional[Union[ParallelFor, Comptime]] = None,
+    unsafe_procs: Optional[dict[int, Intrinsic]] = None,
+) -> list[tuple[Optional[TypeStackNode], KeyWord]]:
+    """
+    checks the operations of the program, of a proc or of the body of a parallel-for or
+    comptime block (`restricted`), `stack` is left with the types at the end.
+    `unsafe_procs` is parallel_unsafe_procs(ast), it is computed when it is not given.
+    returns the blocks that were never closed
+    """
+    if unsafe_procs is None:
+        unsafe_procs = parallel_unsafe_procs(ast)
+    # the snapshot of the stack when each block was opened
+    blocks: list[tuple[Optional[TypeStackNode], KeyWord]] = []
+
+    def restriction_error(node: Node, message: str) -> None:
+        assert restricted is not None
+        name = block_name(restricted)
+        errors.append(
+            TypecheckError(
+                node.format_location(),
+                f"{message} can not be used in a {name}",
+                node,
+                [(restricted.format_location(), f"the {name} starts here")],
+            )
+        )
+
+    def expect_condition(node: KeyWord) -> None:
+        found = stack.peek(1)
+        if found != [Types.INT]:
+            errors.append(
+                TypecheckError(
+                    node.format_location(),
+                    f"{mapping[node.typ]} expected one integer on top of the stack "
+                    f"but found {types_to_human(list(found)) or 'nothing'}",
+                    node,
                 )
-                a = stack[-1]
-                stack.append(a)
-                stack.append(a)
-            elif node.typ == Intrinsics.SWAP:
-                typecheck_node_must_have_two_elements(
-                    stack, node, mapping[Intrinsics.SWAP]
+            )
+        if found:
+            stack.pop()
+
+    def expect_same_stack(
+        expect: Optional[TypeStackNode], op: KeyWord, node: KeyWord, block_name: str
+    ) -> None:
+        if snapshots_equal(expect, stack.top):
+            return
+        errors.append(
+            TypecheckError(
+                op.format_location(),
+                f"can not change the data types in the data stack in {block_name}",
+                node,
+                [
+                    (
+                        op.format_location(),
+                        f"\nexpected: {snapshot_types(expect)}\n"
+                        f"got: {snapshot_types(stack.top)}",
+                    )
+                ],
+            )
+        )
+        # carry on as if the block was correct
+        stack.top = expect
+
+    for node in body:
+        if isinstance(node, Push):
+            stack.push(node.typ)
+        elif isinstance(node, PushMem) or isinstance(node, PushMemLength):
+            if isinstance(restricted, Comptime) and any(
+                mem.name == node.name and mem.mapped for mem in ast.memories
+            ):
+                # the file is only known when the program runs
+                restriction_error(node, f"the mapped memory {node.name}")
+            stack.push(Types.POINTER if isinstance(node, PushMem) else Types.INT)
+        elif isinstance(node, PushStr):
+            stack.push(Types.POINTER)
+            stack.push(Types.INT)
+        elif isinstance(node, PushVar):
+            if isinstance(restricted, Comptime):
+                restriction_error(node, f"the variable {node.name}")
+            stack.push(ast.variables[node.id].typ)
+        elif isinstance(node, SetVar):
+            if isinstance(restricted, ParallelFor):
+                restriction_error(node, f"set {node.name} (the iterations would race)")
+            elif isinstance(restricted, Comptime):
+                restriction_error(node, f"set {node.name}")
+            typ = ast.variables[node.id].typ
+            apply_signature(
+                stack, Signature((typ,), ()), node, f"set {node.name}", errors
+            )
+        elif isinstance(node, ArrayGet):
+            apply_signature(
+                stack, ARRAY_GET_SIGNATURE, node, node.name + ARRAY_GET_SUFFIX, errors
+            )
+        elif isinstance(node, ArraySet):
+            apply_signature(
+                stack, ARRAY_SET_SIGNATURE, node, node.name + ARRAY_SET_SUFFIX, errors
+            )
+        elif isinstance(node, ParallelFor):
+            apply_signature(
+                stack,
+                PARALLEL_FOR_SIGNATURE,
+                node,
+                mapping[KeyWords.PARALLEL_FOR],
+                errors,
+            )
+            # every iteration starts on an empty stack of its own with the index on it
+            iteration = TypeStack()
+            iteration.push(Types.INT)
+            blocks_left = typecheck_body(
+                node.body,
+                iteration,
+                ast,
+                errors,
+                proc,
+                restricted or node,
+                unsafe_procs,
+            )
+            if not blocks_left and len(iteration) != 0:
+                errors.append(
+                    TypecheckError(
+                        node.format_location(),
+                        "the body of a parallel-for has to consume the index and leave "
+                        f"nothing on the stack but it leaves {types_to_human(list(iteration))}",
+                        node,
+                    )
                 )
-                a = stack.pop()
-                b = stack.pop()
-                stack.append(a)
-                stack.append(b)
-            elif node.typ == Intrinsics.CLEAR:
-                stack.clear()
-            elif node.typ == Intrinsics.DBG_PRINT_STACK:
-                pass
-            elif node.typ == Intrinsics.CAST_INT:
-                if len(stack) < 1:
-                    typecheck_error(
+        elif isinstance(node, Comptime):
+            if proc is not None or restricted is not None or blocks:
+                # the blocks run once, in order, before the program starts
+                errors.append(
+                    TypecheckError(
                         node.format_location(),
-                        f"{mapping[Intrinsics.CAST_INT]} expected one element on the stack but found none",
+                        "comptime blocks can only be used at the top level of the program",
                         node,
                     )
-                stack.pop()
-                stack.append(Types.INT)
-            elif node.typ == Intrinsics.CAST_PTR:
-                if len(stack) < 1:
-                    typecheck_error(
+                )
+            inner = TypeStack()
+            blocks_left = typecheck_body(
+                node.body, inner, ast, errors, proc, node, unsafe_procs
+            )
+            if not blocks_left and len(inner) != 0:
+                errors.append(
+                    TypecheckError(
                         node.format_location(),
-                        f"{mapping[Intrinsics.CAST_PTR]} expected one element on the stack but found none",
+                        "a comptime block has to leave nothing on the stack but it "
+                        f"leaves {types_to_human(list(inner))}",
                         node,
                     )
-                stack.pop()
-                stack.append(Types.POINTER)
-            elif node.typ in {
-                Intrinsics.STORE8,
-                Intrinsics.STORE16,
-                Intrinsics.STORE32,
-                Intrinsics.STORE64,
-            }:
-                typecheck_node_expect_ptr_int_return_none(
-                    stack, node, mapping[node.typ]
                 )
-            elif node.typ in {
-                Intrinsics.LOAD8,
-                Intrinsics.LOAD16,
-                Intrinsics.LOAD32,
-                Intrinsics.LOAD64,
-            }:
-                typecheck_node_expect_ptr_return_int(
-                    stack, node, mapping[Intrinsics.LOAD8]
+        elif isinstance(node, Call):
+            callee = ast.procs[node.id]
+            if restricted is not None and node.id in unsafe_procs:
+                # the iterations would race the same way as with the word itself
+                restriction_error(
+                    node,
+                    f"{callee.name} (it uses {mapping[unsafe_procs[node.id].typ]})",
                 )
-            else:
-                raise NotImplementedError(node)
-
-        elif node == KeyWord:
+            apply_signature(stack, proc_signature(callee), node, callee.name, errors)
+        elif isinstance(node, Intrinsic):
+            if proc is not None and node.typ == Intrinsics.CLEAR:
+                # the stack below the inputs of a proc belongs to the caller
+                errors.append(
+                    TypecheckError(
+                        node.format_location(),
+                        f"{mapping[node.typ]} can not be used in a proc ({proc.name})",
+                        node,
+                    )
+                )
+                continue
+            if restricted is not None and node.typ in PARALLEL_UNSAFE:
+                restriction_error(node, mapping[node.typ])
+            apply_signature(
+                stack, SIGNATURES[node.typ], node, mapping[node.typ], errors
+            )
+        elif isinstance(node, KeyWord):
             if node.typ == KeyWords.IF:
-                stack.pop()
-                stacks.append((stack, node))
-                stack = stack.copy()
+                expect_condition(node)
+                blocks.append((stack.top, node))
             elif node.typ == KeyWords.WHILE:
-                stacks.append((stack, node))
-                stack = stack.copy()
+                blocks.append((stack.top, node))
             elif node.typ == KeyWords.DO:
-                expect, op = stacks.pop()
-                if op.typ == KeyWords.WHILE:
-                    stack.pop()
-                    if not stack_equality(expect, stack):
-                        typecheck_error(
-                            op.format_location(),
-                            f"can not change the data types in the data stack in while-do blocks",
-                            node,
-                            noexit=True,
+                if not blocks or blocks[-1][1].typ != KeyWords.WHILE:
+                    errors.append(
+                        TypecheckError(
+                            node.format_location(), "do without a matching while", node
                         )
-                        typecheck_note(
-                            op.format_location(),
-                            f"\nexpected: {list(expect)}\n" f"got: {list(stack)}",
-                        )
-                    stacks.append((stack, node))
-                    stack = stack.copy()
-                else:
-                    raise NotImplementedError(
-                        f"{op} is not handled in typechecking with the DO keyword"
                     )
+                    continue
+                expect, op = blocks.pop()
+                expect_condition(node)
+                expect_same_stack(expect, op, node, "while-do blocks")
+                blocks.append((stack.top, node))
             elif node.typ == KeyWords.END:
-                expect, op = stacks.pop()
-                if op.typ == KeyWords.IF:
-                    if not stack_equality(expect, stack):
-                        typecheck_error(
-                            op.format_location(),
-                            f"can not change the data types in the data stack in if statements",
-                            node,
-                            noexit=True,
-                        )
-                        typecheck_note(
-                            op.format_location(),
-                            f"\nexpected: {list(expect)}\n" f"got: {list(stack)}",
+                if not blocks:
+                    errors.append(
+                        TypecheckError(
+                            node.format_location(), "end without a matching block", node
                         )
+                    )
+                    continue
+                expect, op = blocks.pop()
+                if op.typ == KeyWords.IF:
+                    expect_same_stack(expect, op, node, "if statements")
                 elif op.typ == KeyWords.DO:
-                    if not stack_equality(expect, stack):
-                        typecheck_error(
+                    expect_same_stack(expect, op, node, "do-end statements")
+                else:
+                    errors.append(
+                        TypecheckError(
                             op.format_location(),
-                            f"can not change the data types in the data stack in do-end statements",
+                            f"{mapping[op.typ]} block was closed without a do",
                             node,
-                            noexit=True,
-                        )
-                        typecheck_note(
-                            op.format_location(),
-                            f"\nexpected: {list(expect)}\n" f"got: {list(stack)}",
                         )
+                    )
+            else:
+                raise NotImplementedError(node)
         else:
             raise NotImplementedError(node)
 
-    if len(stack) != 0:
-        typecheck_error(str(ast.path), f"unhandled data on the stack: {list(stack)}")
+    for _, op in blocks:
+        errors.append(
+            TypecheckError(
+                op.format_location(), f"{mapping[op.typ]} block is never closed", op
+            )
+        )
+    return blocks
+
+
+def typecheck_AST(ast: CEAst.AST) -> None:
+    """
+    checks the whole program and reports every error that it finds before exiting.
+    every proc is checked once against its signature, a call only applies the signature
+    """
+    errors: list[TypecheckError] = []
+    unsafe_procs = parallel_unsafe_procs(ast)
+
+    for proc in ast.procs:
+        stack = TypeStack()
+        for typ in proc.ins:
+            stack.push(typ)
+        blocks = typecheck_body(
+            proc.body, stack, ast, errors, proc, unsafe_procs=unsafe_procs
+        )
+        if not blocks and list(stack) != proc.outs:
+            errors.append(
+                TypecheckError(
+                    proc.format_location(),
+                    f"{proc.name} has to leave {types_to_human(list(proc.outs))} on the stack "
+                    f"but it leaves {types_to_human(list(stack))}",
+                    proc,
+                )
+            )
+
+    stack = TypeStack()
+    blocks = typecheck_body(ast.body, stack, ast, errors, unsafe_procs=unsafe_procs)
+
+    if len(stack) != 0 and not blocks:
+        errors.append(
+            TypecheckError(str(ast.path), f"unhandled data on the stack: {list(stack)}")
+        )
+
+    for error in errors:
+        error.report()
+    if errors:
+        sys.exit(1)
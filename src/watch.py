@@ -0,0 +1,161 @@
+# -watch: stays running and rebuilds (and reruns) the program when its source changes
+from __future__ import annotations
+
+from dataclasses import replace
+from pathlib import Path
+
+from src import CEAst, typecheck, build, parsing  # type: ignore[import]
+from src.compiler import all_parallel_loops, generate_c_code_from_AST  # type: ignore
+from src.toolchain import BuildOptions, Toolchain  # type: ignore[import]
+from src.core import STACK_SIZE  # type: ignore[import]
+
+import hashlib
+import time
+import io
+import os
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Optional
+
+    from src.core import LocType  # type: ignore[import]
+
+# how often the source is checked for changes, in seconds
+POLL_INTERVAL: float = 0.1
+
+
+class LineLexer:
+    """
+    keeps the words of every line that it lexed, so after an edit only the lines
+    that are new or changed are lexed again
+    """
+
+    def __init__(self) -> None:
+        self.lines: dict[str, list[tuple[int, str]]] = {}
+
+    def lex(self, path: str) -> list[tuple[LocType, str]]:
+        with open(path, "r") as f:
+            lines = f.readlines()
+        # only the lines of the current version are kept, so the cache does not grow
+        cache: dict[str, list[tuple[int, str]]] = {}
+        ops: list[tuple[LocType, str]] = []
+        for row, line in enumerate(lines):
+            words = cache.get(line)
+            if words is None:
+                words = self.lines.get(line)
+                if words is None:
+                    words = list(parsing.lex_line(line))
+                cache[line] = words
+            ops.extend(((path, row, col), word) for col, word in words)
+        self.lines = cache
+        return ops
+
+
+def generate_code(ast: CEAst.AST, backend: str, bounds_checks: bool) -> str:
+    if backend == "asm":
+        from src.x86_64 import write_asm_from_AST  # type: ignore[import]
+
+        out = io.StringIO()
+        write_asm_from_AST(ast, out, bounds_checks)
+        return out.getvalue()
+    return generate_c_code_from_AST(ast, STACK_SIZE, bounds_checks=bounds_checks)
+
+
+class Watcher:
+    def __init__(
+        self,
+        filepath: str,
+        base_filename: str,
+        backend: str,
+        toolchain: Toolchain,
+        options: BuildOptions,
+        bounds_checks: bool,
+        run: bool,
+    ) -> None:
+        self.filepath = filepath
+        self.base_filename = base_filename
+        self.backend = backend
+        self.toolchain = toolchain
+        self.options = options
+        self.bounds_checks = bounds_checks
+        self.run = run
+        self.lexer = LineLexer()
+        # the words of the last version that was built successfully, an edit of only
+        # comments or whitespace does not change them
+        self.words: Optional[list[str]] = None
+        # the hash of the code that the executable was built from
+        self.code_hash: Optional[str] = None
+
+    def rebuild(self) -> None:
+        ops = self.lexer.lex(self.filepath)
+        words = [word for _, word in ops]
+        if words == self.words:
+            print("[INFO] only comments or whitespace changed")
+            return
+        # cleared until the executable is built, so a failed build is retried on the
+        # next save even if that only changes comments or whitespace
+        self.words = None
+        ast = CEAst.makeAST(ops, Path(self.filepath))
+        typecheck.typecheck_AST(ast)
+
+        code = generate_code(ast, self.backend, self.bounds_checks)
+        code_hash = hashlib.sha256(code.encode()).hexdigest()
+        executable = self.base_filename + ".exe"
+        if code_hash == self.code_hash and os.path.exists(executable):
+            print("[INFO] the generated code did not change, not compiling")
+        else:
+            self.code_hash = None
+            if self.backend == "asm":
+                with open(self.base_filename + ".s", "w") as out:
+                    out.write(code)
+                exit_code = build.assemble_and_link(
+                    self.base_filename + ".s", executable
+                )
+            else:
+                with open(self.base_filename + ".c", "w") as out:
+                    out.write(code)
+                options = replace(
+                    self.options,
+                    cflags=list(self.options.cflags),
+                    ldflags=list(self.options.ldflags),
+                )
+                if all_parallel_loops(ast):
+                    self.toolchain.enable_openmp(options)
+                exit_code = build.compile_program(
+                    self.toolchain, options, self.base_filename + ".c", executable
+                )
+            if exit_code:
+                return
+            self.code_hash = code_hash
+        self.words = words
+
+        if self.run:
+            build.echo_and_call([executable])
+
+    def watch(self, interval: float = POLL_INTERVAL) -> None:
+        """
+        polls the modification time of the source until ctrl-c, the errors of a
+        build are reported and the watcher waits for the next change
+        """
+        modified: Optional[int] = None
+        print(f"[INFO] watching {self.filepath}, press ctrl-c to stop")
+        try:
+            while True:
+                try:
+                    current = os.stat(self.filepath).st_mtime_ns
+                except FileNotFoundError:
+                    current = None
+                if current is None or current == modified:
+                    time.sleep(interval)
+                    continue
+                modified = current
+                start = time.perf_counter()
+                try:
+                    self.rebuild()
+                except SystemExit:
+                    # makeAST, the type checker and the backends exit on errors
+                    pass
+                elapsed = (time.perf_counter() - start) * 1000
+                print(f"[INFO] done in {elapsed:.0f}ms, waiting for changes")
+        except KeyboardInterrupt:
+            print()
@@ -0,0 +1,830 @@
+# a backend that lowers the AST straight to x86-64 GNU assembly (linux, no libc)
+# the top of the data stack is kept in %rbx and the rest of the data stack lives on
+# the machine stack, %rbp points to the bottom of the data stack and %r15 to the top
+# of the return stack of the procs.
+# the type checker makes the depth of the data stack known at every operation, so
+# the generator tracks it and only moves values between %rbx and memory when needed
+from __future__ import annotations
+
+import src.CEAst as CEAst  # type: ignore[import]
+
+from src.core import (  # type: ignore[import]
+    BuildIn,
+    Intrinsics,
+    Intrinsic,
+    KeyWords,
+    KeyWord,
+    Types,
+    Push,
+    PushMem,
+    PushMemLength,
+    PushStr,
+    Call,
+    ParallelFor,
+    PushVar,
+    SetVar,
+    ArrayGet,
+    ArraySet,
+    Mem,
+)
+from src.typecheck import SIGNATURES  # type: ignore[import]
+from src.comptime import bake  # type: ignore[import]
+from src.compiler import (  # type: ignore[import]
+    assign_memory_ids,
+    arena_layout,
+    arena_name,
+    data_arena_name,
+    CACHE_LINE,
+    function_variables,
+    proc_variables,
+    inlined_procs,
+    proc_prefix,
+    memory_prefix,
+    memory_length_prefix,
+    string_prefix,
+    output_buffer_size,
+)
+
+import textwrap
+import sys
+
+# the size of the return stack in cells, it holds the return addresses and the
+# variables of the procs that are running
+RETURN_STACK_SIZE: int = 1 << 16
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import TextIO
+
+
+def binary_op_template(*instructions: str) -> tuple[str, ...]:
+    # the second element goes to %rax, the top stays in %rbx
+    return ("pop %rax", *instructions)
+
+
+def compare_template(condition: str) -> tuple[str, ...]:
+    return binary_op_template(
+        "cmp %rbx, %rax", f"set{condition} %al", "movzbq %al, %rbx"
+    )
+
+
+def store_template(register: str) -> tuple[str, ...]:
+    return ("pop %rax", f"mov {register}, (%rbx)")
+
+
+# the load instruction and the register of %rax to store from, by the size of an element
+ELEMENT_LOADS: dict[int, str] = {1: "movsbq", 2: "movswq", 4: "movslq", 8: "movq"}
+ELEMENT_REGISTERS: dict[int, str] = {1: "%al", 2: "%ax", 4: "%eax", 8: "%rax"}
+
+
+def bounds_check(mem: Mem) -> tuple[str, ...]:
+    # a negative index is a big unsigned one
+    return (f"cmp ${mem.count}, %rbx", "jae ce_bounds_error")
+
+
+def array_get_template(mem: Mem, bounds_checks: bool) -> tuple[str, ...]:
+    assert mem.element_size is not None
+    return (
+        *(bounds_check(mem) if bounds_checks else ()),
+        f"lea {memory_prefix}{mem.id}(%rip), %rax",
+        f"{ELEMENT_LOADS[mem.element_size]} (%rax, %rbx, {mem.element_size}), %rbx",
+    )
+
+
+def array_set_template(mem: Mem, bounds_checks: bool) -> tuple[str, ...]:
+    # the caller refills %rbx
+    assert mem.element_size is not None
+    return (
+        *(bounds_check(mem) if bounds_checks else ()),
+        "pop %rax",
+        f"lea {memory_prefix}{mem.id}(%rip), %rcx",
+        f"mov {ELEMENT_REGISTERS[mem.element_size]}, (%rcx, %rbx, {mem.element_size})",
+    )
+
+
+# the instructions of every intrinsic. the inputs are the top of the stack in %rbx
+# and the rest on the machine stack. an intrinsic with outputs leaves the top in %rbx,
+# one without outputs leaves the top to be refilled from the machine stack.
+# the number of inputs and outputs comes from typecheck.SIGNATURES
+ASM_TEMPLATES: dict[Intrinsics, tuple[str, ...]] = {
+    Intrinsics.ADD: binary_op_template("add %rax, %rbx"),
+    Intrinsics.SUB: binary_op_template("sub %rbx, %rax", "mov %rax, %rbx"),
+    Intrinsics.DIV: binary_op_template("cqo", "idiv %rbx", "mov %rax, %rbx"),
+    Intrinsics.MOD: binary_op_template("cqo", "idiv %rbx", "mov %rdx, %rbx"),
+    Intrinsics.MUL: binary_op_template("imul %rax, %rbx"),
+    Intrinsics.POW: binary_op_template(
+        "mov %rax, %rdi", "mov %rbx, %rsi", "call ce_pow", "mov %rax, %rbx"
+    ),
+    Intrinsics.BIN_AND: binary_op_template("and %rax, %rbx"),
+    Intrinsics.BIN_OR: binary_op_template("or %rax, %rbx"),
+    Intrinsics.BIN_INV: ("not %rbx",),
+    Intrinsics.BIN_XOR: binary_op_template("xor %rax, %rbx"),
+    Intrinsics.RSHIFT: binary_op_template(
+        "mov %rbx, %rcx", "mov %rax, %rbx", "sar %cl, %rbx"
+    ),
+    Intrinsics.LSHIFT: binary_op_template(
+        "mov %rbx, %rcx", "mov %rax, %rbx", "shl %cl, %rbx"
+    ),
+    Intrinsics.PRINT: ("mov %rbx, %rdi", "call ce_print_int"),
+    Intrinsics.PUTC: ("mov %rbx, %rdi", "call ce_putc"),
+    Intrinsics.PUTS: ("mov %rbx, %rsi", "pop %rdi", "call ce_puts"),
+    Intrinsics.LT: compare_template("l"),
+    Intrinsics.LE: compare_template("le"),
+    Intrinsics.EQ: compare_template("e"),
+    Intrinsics.NE: compare_template("ne"),
+    Intrinsics.GE: compare_template("ge"),
+    Intrinsics.GT: compare_template("g"),
+    Intrinsics.DROP: (),
+    Intrinsics.DROP2: ("add $8, %rsp",),
+    Intrinsics.DUP: ("push %rbx",),
+    Intrinsics.DUP2: ("push %rbx", "push %rbx"),
+    Intrinsics.SWAP: ("xchg %rbx, (%rsp)",),
+    # clear and dbg-print-stack depend on the depth of the stack, see write_intrinsic
+    Intrinsics.CLEAR: (),
+    Intrinsics.DBG_PRINT_STACK: (),
+    Intrinsics.CAST_INT: (),
+    Intrinsics.CAST_PTR: (),
+    Intrinsics.STORE8: store_template("%al"),
+    Intrinsics.LOAD8: ("movsbq (%rbx), %rbx",),
+    Intrinsics.STORE16: store_template("%ax"),
+    Intrinsics.LOAD16: ("movswq (%rbx), %rbx",),
+    Intrinsics.STORE32: store_template("%eax"),
+    Intrinsics.LOAD32: ("movslq (%rbx), %rbx",),
+    Intrinsics.STORE64: store_template("%rax"),
+    Intrinsics.LOAD64: ("mov (%rbx), %rbx",),
+    Intrinsics.READ: (
+        "mov %rbx, %rdx",
+        "pop %rsi",
+        "xor %edi, %edi",
+        "call ce_read_fd",
+        "mov %rax, %rbx",
+    ),
+    Intrinsics.READ_FILE: (
+        "mov %rbx, %rdi",
+        "pop %rdx",
+        "pop %rsi",
+        "call ce_read_file",
+        "mov %rax, %rbx",
+    ),
+    Intrinsics.WRITE: (
+        "mov %rbx, %rdx",
+        "pop %rsi",
+        "mov $1, %edi",
+        "call ce_write_fd",
+        "mov %rax, %rbx",
+    ),
+    Intrinsics.FILL: ("mov %rbx, %rax", "pop %rcx", "pop %rdi", "rep stosb"),
+    Intrinsics.COPY: ("mov %rbx, %rdx", "pop %rdi", "pop %rsi", "call ce_copy"),
+    # the flags of `xor` make a compare of 0 bytes equal
+    Intrinsics.COMPARE: (
+        "mov %rbx, %rcx",
+        "pop %rdi",
+        "pop %rsi",
+        "xor %ebx, %ebx",
+        "repe cmpsb",
+        "seta %bl",
+        "setb %al",
+        "movzbq %al, %rax",
+        "sub %rax, %rbx",
+    ),
+}
+
+
+def run_checks() -> None:
+    """
+    every intrinsic needs a template, this is a development time check (see tests.py -checks)
+    """
+    err: bool = False
+    for intrinsic in Intrinsics:
+        if intrinsic not in ASM_TEMPLATES:
+            print(f"{intrinsic} does not have an x86-64 template", file=sys.stderr)
+            err = True
+
+    if err:
+        sys.exit(1)
+
+
+def generate_asm_runtime() -> str:
+    """
+    the routines the generated code calls, they take their arguments in %rdi, %rsi,
+    %rdx and %rcx, return in %rax and may clobber every register apart from %rbx,
+    %rbp and %r12-%r15
+    """
+    return textwrap.dedent(f"""
+            .text
+        # write(1, ce_out_buffer, ce_out_length) until everything is written
+        ce_flush:
+            xor %ecx, %ecx
+        1:  mov ce_out_length(%rip), %rdx
+            sub %rcx, %rdx
+            jle 2f
+            push %rcx
+            mov $1, %eax
+            mov $1, %edi
+            lea ce_out_buffer(%rip), %rsi
+            add %rcx, %rsi
+            syscall
+            pop %rcx
+            cmp $-4, %rax  # EINTR
+            je 1b
+            test %rax, %rax
+            jl 2f
+            add %rax, %rcx
+            jmp 1b
+        2:  movq $0, ce_out_length(%rip)
+            ret
+
+        # %dil: the character
+        ce_putc:
+            mov ce_out_length(%rip), %rax
+            cmp ${output_buffer_size}, %rax
+            jb 1f
+            push %rdi
+            call ce_flush
+            pop %rdi
+            xor %eax, %eax
+        1:  lea ce_out_buffer(%rip), %rdx
+            mov %dil, (%rdx, %rax)
+            inc %rax
+            mov %rax, ce_out_length(%rip)
+            ret
+
+        # %rdi: the bytes, %rsi: the length, the bytes are copied to the output
+        # buffer in chunks of what fits (ce_flush leaves %r8 and %r9 alone)
+        ce_puts:
+            mov %rdi, %r8
+            mov %rsi, %r9
+        1:  test %r9, %r9
+            jle 3f
+            mov ${output_buffer_size}, %rcx
+            sub ce_out_length(%rip), %rcx
+            jnz 2f
+            call ce_flush
+            jmp 1b
+        2:  cmp %r9, %rcx
+            cmova %r9, %rcx
+            lea ce_out_buffer(%rip), %rdi
+            add ce_out_length(%rip), %rdi
+            add %rcx, ce_out_length(%rip)
+            sub %rcx, %r9
+            mov %r8, %rsi
+            rep movsb
+            mov %rsi, %r8
+            jmp 1b
+        3:  ret
+
+        # %rsi: the bytes, %rdx: the length (at most 32)
+        ce_out_bytes:
+            mov ce_out_length(%rip), %rax
+            add %rdx, %rax
+            cmp ${output_buffer_size}, %rax
+            jbe 1f
+            push %rsi
+            push %rdx
+            call ce_flush
+            pop %rdx
+            pop %rsi
+        1:  lea ce_out_buffer(%rip), %rdi
+            add ce_out_length(%rip), %rdi
+            add %rdx, ce_out_length(%rip)
+            mov %rdx, %rcx
+            rep movsb
+            ret
+
+        # %rdi: the value, %sil: the character that is written after it
+        ce_format_int:
+            sub $32, %rsp
+            lea 31(%rsp), %r8
+            mov %sil, (%r8)
+            mov %rdi, %rax
+            test %rax, %rax
+            jns 1f
+            neg %rax
+        1:  mov $10, %ecx
+        2:  xor %edx, %edx
+            div %rcx
+            add $48, %dl
+            dec %r8
+            mov %dl, (%r8)
+            test %rax, %rax
+            jnz 2b
+            test %rdi, %rdi
+            jns 3f
+            dec %r8
+            movb $45, (%r8)
+        3:  lea 32(%rsp), %rdx
+            sub %r8, %rdx
+            mov %r8, %rsi
+            call ce_out_bytes
+            add $32, %rsp
+            ret
+
+        # %rdi: the value
+        ce_print_int:
+            mov $10, %esi
+            jmp ce_format_int
+
+        # %rdi: the index, %rsi: the value
+        ce_print_dbg:
+            push %rsi
+            mov $58, %esi
+            call ce_format_int
+            pop %rdi
+            mov $10, %esi
+            jmp ce_format_int
+
+        # %rdi: the base, %rsi: the exponent, negative exponents give 0
+        ce_pow:
+            mov $1, %eax
+            test %rsi, %rsi
+            jns 1f
+            xor %eax, %eax
+            ret
+        1:  test %rsi, %rsi
+            jz 3f
+            test $1, %rsi
+            jz 2f
+            imul %rdi, %rax
+        2:  imul %rdi, %rdi
+            shr %rsi
+            jmp 1b
+        3:  ret
+
+        # %rdi: the destination, %rsi: the source, %rdx: the count
+        # copies backwards when the destination overlaps the end of the source
+        ce_copy:
+            mov %rdx, %rcx
+            mov %rdi, %rax
+            sub %rsi, %rax
+            cmp %rdx, %rax
+            jb 1f
+            rep movsb
+            ret
+        1:  lea -1(%rsi, %rdx), %rsi
+            lea -1(%rdi, %rdx), %rdi
+            std
+            rep movsb
+            cld
+            ret
+
+        # %rdi: fd, %rsi: the buffer, %rdx: the size
+        # returns the number of bytes that were read or -1
+        ce_read_fd:
+            push %r12
+            xor %r12d, %r12d
+        1:  cmp %rdx, %r12
+            jge 3f
+            push %rdi
+            push %rsi
+            push %rdx
+            sub %r12, %rdx
+            add %r12, %rsi
+            xor %eax, %eax
+            syscall
+            pop %rdx
+            pop %rsi
+            pop %rdi
+            cmp $-4, %rax  # EINTR
+            je 1b
+            test %rax, %rax
+            jz 3f
+            jg 2f
+            test %r12, %r12
+            jnz 3f
+            mov $-1, %r12
+            jmp 3f
+        2:  add %rax, %r12
+            jmp 1b
+        3:  mov %r12, %rax
+            pop %r12
+            ret
+
+        # %rdi: the path, %rsi: the buffer, %rdx: the size
+        ce_read_file:
+            push %r12
+            push %rsi
+            push %rdx
+            mov $2, %eax  # open
+            xor %esi, %esi  # O_RDONLY
+            xor %edx, %edx
+            syscall
+            pop %rdx
+            pop %rsi
+            test %rax, %rax
+            jns 1f
+            mov $-1, %rax
+            pop %r12
+            ret
+        1:  mov %rax, %r12
+            mov %rax, %rdi
+            call ce_read_fd
+            push %rax
+            mov $3, %eax  # close
+            mov %r12, %rdi
+            syscall
+            pop %rax
+            pop %r12
+            ret
+
+        # %rdi: fd, %rsi: the buffer, %rdx: the size
+        # returns the number of bytes that were written or -1
+        ce_write_fd:
+            push %r12
+            push %rdi
+            push %rsi
+            push %rdx
+            call ce_flush
+            pop %rdx
+            pop %rsi
+            pop %rdi
+            xor %r12d, %r12d
+        1:  cmp %rdx, %r12
+            jge 3f
+            push %rdi
+            push %rsi
+            push %rdx
+            sub %r12, %rdx
+            add %r12, %rsi
+            mov $1, %eax
+            syscall
+            pop %rdx
+            pop %rsi
+            pop %rdi
+            cmp $-4, %rax  # EINTR
+            je 1b
+            test %rax, %rax
+            jg 2f
+            test %r12, %r12
+            jnz 3f
+            mov $-1, %r12
+            jmp 3f
+        2:  add %rax, %r12
+            jmp 1b
+        3:  mov %r12, %rax
+            pop %r12
+            ret
+
+        # %rdi: the argument index, %rsi: writable, %rdx: the memory, %rcx: the length
+        ce_map_file:
+            push %r12
+            push %r13
+            push %r14
+            push %r15
+            mov %rsi, %r13
+            mov %rdx, %r14
+            mov %rcx, %r15
+            cmp ce_argc(%rip), %rdi
+            jge ce_map_file_error
+            mov ce_argv(%rip), %rax
+            mov (%rax, %rdi, 8), %rdi
+            lea (%r13, %r13), %rsi  # O_RDWR or O_RDONLY
+            xor %edx, %edx
+            mov $2, %eax  # open
+            syscall
+            test %rax, %rax
+            js ce_map_file_error
+            mov %rax, %r12
+            sub $144, %rsp  # struct stat
+            mov %r12, %rdi
+            mov %rsp, %rsi
+            mov $5, %eax  # fstat
+            syscall
+            test %rax, %rax
+            js ce_map_file_error
+            mov 48(%rsp), %rsi  # st_size
+            add $144, %rsp
+            mov %rsi, (%r15)
+            test %rsi, %rsi
+            jz 1f
+            xor %edi, %edi
+            lea 1(%r13, %r13), %rdx  # PROT_READ | PROT_WRITE or PROT_READ
+            mov $2, %r10d  # MAP_SHARED or MAP_PRIVATE
+            sub %r13, %r10
+            mov %r12, %r8
+            xor %r9d, %r9d
+            mov $9, %eax  # mmap
+            syscall
+            cmp $-4096, %rax
+            ja ce_map_file_error
+            mov %rax, (%r14)
+        1:  mov $3, %eax  # close
+            mov %r12, %rdi
+            syscall
+            pop %r15
+            pop %r14
+            pop %r13
+            pop %r12
+            ret
+        ce_map_file_error:
+            mov $1, %eax
+            mov $2, %edi
+            lea ce_map_file_message(%rip), %rsi
+            mov $ce_map_file_message_length, %edx
+            syscall
+            mov $60, %eax
+            mov $1, %edi
+            syscall
+
+        # jumped to by `<array>.get` and `<array>.set` when the index is out of bounds
+        ce_bounds_error:
+            call ce_flush
+            mov $1, %eax
+            mov $2, %edi
+            lea ce_bounds_message(%rip), %rsi
+            mov $ce_bounds_message_length, %edx
+            syscall
+            mov $60, %eax
+            mov $1, %edi
+            syscall
+
+            .section .rodata
+        ce_map_file_message:
+            .ascii "[ERROR] could not map the file from the command line arguments\\n"
+            .set ce_map_file_message_length, . - ce_map_file_message
+        ce_bounds_message:
+            .ascii "[ERROR] array index out of bounds\\n"
+            .set ce_bounds_message_length, . - ce_bounds_message
+
+            .bss
+            .align 16
+        ce_out_buffer: .skip {output_buffer_size}
+        ce_out_length: .skip 8
+        ce_argc: .skip 8
+        ce_argv: .skip 8
+    """)
+
+
+class AsmEmitter:
+    def __init__(self, out: TextIO, bounds_checks: bool = False) -> None:
+        self.out = out
+        # the depth of the data stack plus one, there is always a value below the
+        # bottom (garbage in main, the stack of the caller in a proc), so the top of
+        # the stack is always in %rbx
+        self.depth: int = 1
+        self.label_count: int = 0
+        # check the index of every `<array>.get` and `<array>.set`
+        self.bounds_checks = bounds_checks
+        # the offset from %r15 of every variable of the function that is being written
+        self.variables: dict[int, int] = {}
+
+    def write(self, s: str) -> None:
+        self.out.write(f"    {s}\n")
+
+    def label(self, name: str) -> None:
+        self.out.write(f"{name}:\n")
+
+    def new_label(self) -> int:
+        self.label_count += 1
+        return self.label_count
+
+    def make_room(self) -> None:
+        """
+        moves the top of the stack out of %rbx so a new value can be put in it
+        """
+        self.write("push %rbx")
+        self.depth += 1
+
+    def enter_function(self, variables: list[int]) -> int:
+        """
+        the variables of a function live on the return stack, above its return
+        address, returns the size of the frame
+        """
+        self.variables = {
+            variable: -8 * (len(variables) - i) for i, variable in enumerate(variables)
+        }
+        return 8 * len(variables)
+
+    def refill(self, consumed: int) -> None:
+        """
+        after `consumed` elements (including the one in %rbx) were used up, loads
+        the new top of the stack into %rbx
+        """
+        self.depth -= consumed
+        self.write("pop %rbx")
+
+
+def write_intrinsic(emitter: AsmEmitter, op: Intrinsic) -> None:
+    if op.typ == Intrinsics.CLEAR:
+        # procs can not clear the stack, so this is always main
+        emitter.write("mov %rbp, %rsp")
+        emitter.depth = 1
+        return
+    if op.typ == Intrinsics.DBG_PRINT_STACK:
+        # the depth is known here, so every element is printed with its own call
+        count = emitter.depth - 1
+        for i in range(count):
+            emitter.write(f"mov ${i}, %edi")
+            if i == count - 1:
+                emitter.write("mov %rbx, %rsi")
+            else:
+                emitter.write(f"mov {8 * (count - 2 - i)}(%rsp), %rsi")
+            emitter.write("call ce_print_dbg")
+        return
+
+    for instruction in ASM_TEMPLATES[op.typ]:
+        emitter.write(instruction)
+    signature = SIGNATURES[op.typ]
+    if signature.outs:
+        emitter.depth += len(signature.outs) - len(signature.ins)
+    else:
+        emitter.refill(len(signature.ins))
+
+
+def write_body(
+    emitter: AsmEmitter, ast: CEAst.AST, body: list[BuildIn], inlined: set[int]
+) -> None:
+    """
+    writes the operations of main or of a proc, the calls to the procs in `inlined`
+    are replaced with their body
+    """
+    # (label of the block, the keyword that opened it, the depth at the start)
+    blocks: list[tuple[int, KeyWords, int]] = []
+
+    for op in body:
+        if isinstance(op, Intrinsic):
+            write_intrinsic(emitter, op)
+        elif isinstance(op, Push):
+            if op.typ == Types.INT:
+                emitter.make_room()
+                emitter.write(f"mov ${op.value}, %rbx")
+        elif isinstance(op, PushMem):
+            emitter.make_room()
+            if ast.memories[op.id].mapped:
+                emitter.write(f"mov {memory_prefix}{op.id}(%rip), %rbx")
+            else:
+                emitter.write(f"lea {memory_prefix}{op.id}(%rip), %rbx")
+        elif isinstance(op, PushMemLength):
+            emitter.make_room()
+            emitter.write(f"mov {memory_length_prefix}{op.id}(%rip), %rbx")
+        elif isinstance(op, PushStr):
+            emitter.make_room()
+            emitter.write(f"lea {string_prefix}{op.id}(%rip), %rbx")
+            emitter.make_room()
+            emitter.write(f"mov ${len(ast.strings[op.id])}, %rbx")
+        elif isinstance(op, ArrayGet):
+            for instruction in array_get_template(
+                ast.memories[op.id], emitter.bounds_checks
+            ):
+                emitter.write(instruction)
+        elif isinstance(op, ArraySet):
+            for instruction in array_set_template(
+                ast.memories[op.id], emitter.bounds_checks
+            ):
+                emitter.write(instruction)
+            emitter.refill(2)
+        elif isinstance(op, PushVar):
+            emitter.make_room()
+            emitter.write(f"mov {emitter.variables[op.id]}(%r15), %rbx  # {op.name}")
+        elif isinstance(op, SetVar):
+            emitter.write(f"mov %rbx, {emitter.variables[op.id]}(%r15)  # {op.name}")
+            emitter.refill(1)
+        elif isinstance(op, Call):
+            proc = ast.procs[op.id]
+            if op.id in inlined:
+                for variable in proc_variables(ast, proc):
+                    emitter.write(
+                        f"movq $0, {emitter.variables[variable]}(%r15)  # {ast.variables[variable].name}"
+                    )
+                write_body(emitter, ast, proc.body, inlined)
+            else:
+                emitter.write(f"call {proc_prefix}{op.id}  # {op.name}")
+                emitter.depth += len(proc.outs) - len(proc.ins)
+        elif isinstance(op, ParallelFor):
+            # there are no threads without libc, the iterations run one after the other.
+            # the index lives below the end on the data stack while the body runs
+            label = emitter.new_label()
+            emitter.label(f".Lparallel{label}")
+            emitter.write("mov (%rsp), %rax")
+            emitter.write("cmp %rbx, %rax")
+            emitter.write(f"jge .Lend{label}")
+            emitter.make_room()
+            emitter.write("mov %rax, %rbx")
+            write_body(emitter, ast, op.body, inlined)
+            emitter.write("incq (%rsp)")
+            emitter.write(f"jmp .Lparallel{label}")
+            emitter.label(f".Lend{label}")
+            emitter.write("add $8, %rsp")
+            emitter.refill(2)
+        elif isinstance(op, KeyWord):
+            if op.typ == KeyWords.IF:
+                label = emitter.new_label()
+                emitter.write("test %rbx, %rbx")
+                emitter.refill(1)  # pop does not change the flags
+                emitter.write(f"jz .Lend{label}")
+                blocks.append((label, KeyWords.IF, emitter.depth))
+            elif op.typ == KeyWords.WHILE:
+                label = emitter.new_label()
+                emitter.label(f".Lwhile{label}")
+                blocks.append((label, KeyWords.WHILE, emitter.depth))
+            elif op.typ == KeyWords.DO:
+                label, _, depth = blocks.pop()
+                emitter.write("test %rbx, %rbx")
+                emitter.refill(1)
+                emitter.write(f"jz .Lend{label}")
+                blocks.append((label, KeyWords.DO, depth))
+            elif op.typ == KeyWords.END:
+                label, keyword, depth = blocks.pop()
+                if keyword == KeyWords.DO:
+                    emitter.write(f"jmp .Lwhile{label}")
+                emitter.label(f".Lend{label}")
+                emitter.depth = depth
+            else:
+                raise NotImplementedError(op)
+        else:
+            raise NotImplementedError(op)
+
+
+def write_arena(out: TextIO, ast: CEAst.AST, initialized: bool = False) -> None:
+    """
+    the memories at the offsets of the C backend (see compiler.arena_layout), the
+    arena of the memories that the comptime blocks gave contents is in .data
+    """
+    slots, size = arena_layout(ast, initialized)
+    if not slots:
+        return
+    out.write("    .data\n" if initialized else "    .bss\n")
+    out.write(f"    .balign {CACHE_LINE}\n")
+    out.write(f"{data_arena_name if initialized else arena_name}:\n")
+    position = 0
+    for slot in slots:
+        mem = slot.mem
+        if slot.offset > position:
+            out.write(f"    .skip {slot.offset - position}\n")
+        out.write(f"{memory_prefix}{mem.id}:  # {mem.name} at {slot.offset}\n")
+        contents = (mem.initial or b"").rstrip(b"\0")
+        for i in range(0, len(contents), 16):
+            out.write(f"    .byte {', '.join(map(str, contents[i : i + 16]))}\n")
+        if len(contents) < mem.size:
+            out.write(f"    .skip {mem.size - len(contents)}\n")
+        position = slot.offset + mem.size
+    if size > position:
+        out.write(f"    .skip {size - position}\n")
+
+
+def write_asm_from_AST(
+    ast: CEAst.AST, out: TextIO, bounds_checks: bool = False
+) -> None:
+    bake(ast)
+    assign_memory_ids(ast)
+    inlined = inlined_procs(ast)
+    emitter = AsmEmitter(out, bounds_checks)
+
+    out.write("    .globl _start\n    .text\n")
+    emitter.label("_start")
+    emitter.write("mov (%rsp), %rax")
+    emitter.write("mov %rax, ce_argc(%rip)")
+    emitter.write("lea 8(%rsp), %rax")
+    emitter.write("mov %rax, ce_argv(%rip)")
+    emitter.write("mov %rsp, %rbp")
+    # the variables of main are zero like the rest of .bss
+    frame = emitter.enter_function(function_variables(ast, ast.body, inlined))
+    emitter.write(f"lea ce_return_stack+{frame}(%rip), %r15")
+    for mem in ast.memories:
+        if mem.mapped:
+            emitter.write(f"mov ${mem.argument}, %edi")
+            emitter.write(f"mov ${int(mem.writable)}, %esi")
+            emitter.write(f"lea {memory_prefix}{mem.id}(%rip), %rdx")
+            emitter.write(f"lea {memory_length_prefix}{mem.id}(%rip), %rcx")
+            emitter.write("call ce_map_file")
+
+    write_body(emitter, ast, ast.body, inlined)
+
+    emitter.write("call ce_flush")
+    emitter.write("mov $60, %eax")
+    emitter.write("xor %edi, %edi")
+    emitter.write("syscall")
+
+    # the return address of a proc would be in the way on the data stack, so it is
+    # moved to the return stack (%r15) on entry and back before `ret`
+    for proc in ast.procs:
+        if proc.id in inlined:
+            continue
+        emitter.label(f"{proc_prefix}{proc.id}")
+        frame = 8 + emitter.enter_function(function_variables(ast, proc.body, inlined))
+        emitter.write("popq (%r15)")
+        emitter.write(f"add ${frame}, %r15")
+        for offset in emitter.variables.values():
+            emitter.write(f"movq $0, {offset}(%r15)")
+        emitter.depth = len(proc.ins) + 1
+        write_body(emitter, ast, proc.body, inlined)
+        emitter.write(f"sub ${frame}, %r15")
+        emitter.write("pushq (%r15)")
+        emitter.write("ret")
+
+    out.write(generate_asm_runtime())
+    out.write(f"ce_return_stack: .skip {8 * RETURN_STACK_SIZE}\n")
+    for mem in ast.memories:
+        if mem.mapped:
+            out.write(f"{memory_prefix}{mem.id}: .skip 8  # {mem.name}\n")
+            out.write(f"{memory_length_prefix}{mem.id}: .skip 8\n")
+    write_arena(out, ast)
+    write_arena(out, ast, initialized=True)
+
+    if ast.strings:
+        out.write("    .section .rodata\n")
+    for i, text in enumerate(ast.strings):
+        out.write(f"{string_prefix}{i}:\n")
+        for start in range(0, len(text), 16):
+            out.write(f"    .byte {', '.join(map(str, text[start : start + 16]))}\n")
+        # zero terminated like the C arrays, so a literal can be used as a path
+        out.write("    .byte 0\n")
@@ -2,8 +2,10 @@
 it runs some tests on the source code ranging from formatting
 to type checking with mypy
 
-"""
+the word table checks and the startup budget live here instead of
+in corpe.py so the compiler does not pay for them on every start
 
+"""
 
 from pathlib import Path
 import subprocess
@@ -19,6 +21,11 @@ all_scripts.extend(
     for script in os.listdir(here / "src")
     if script.endswith(".py")
 )
+all_scripts.extend(
+    here / "bench" / script
+    for script in os.listdir(here / "bench")
+    if script.endswith(".py")
+)
 MyPy_SHOW_ERROR_CODES: bool = True
 
 
@@ -46,6 +53,23 @@ if __name__ == "__main__":
     if "-mypy" in sys.argv or full:
         cmd = [sys.executable, "-m", "mypy"]
         cmd.extend(str(here / script) for script in all_scripts)
+        # src/ has no __init__.py, without this src/core.py is found twice,
+        # as core and as src.core
+        cmd.append("--explicit-package-bases")
         if MyPy_SHOW_ERROR_CODES:
             cmd.append("--show-error-codes")
         echo_and_call(cmd)
+
+    if "-checks" in sys.argv or full:
+        sys.path.insert(0, str(here))
+        from src import CEAst, typecheck, compiler, x86_64  # type: ignore[import]
+        from src import stats  # type: ignore[import]
+
+        CEAst.run_checks()
+        typecheck.run_checks()
+        compiler.run_checks()
+        x86_64.run_checks()
+        stats.run_checks()
+
+    if "-startup" in sys.argv or full:
+        echo_and_call([sys.executable, str(here / "bench" / "startup.py")])